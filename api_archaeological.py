@@ -5,37 +5,42 @@ Handles MEKAN entities: Birin, Wall, Grave, Finds with media
 
 from flask import Blueprint, jsonify, request, current_app
 from flask_login import login_required
-import psycopg2
 from psycopg2.extras import RealDictCursor
-import json
+from database import get_db
+from pagination import KeysetOrder, Key, fetch_page, fetch_page_json, PaginationError
+from site_statistics import statistics_response
+from enrichment import WALL_MEKAN_JOIN, relationship_counts, empty_counts
+from search import search_clause, tsv_column
+from schema_registry import get_schema, geometry_4326
+from json_response import raw_json
 
 api_arch = Blueprint('api_arch', __name__, url_prefix='/api/v2')
 
-def get_db():
-    """Get database connection to Supabase"""
-    return psycopg2.connect(
-        host=current_app.config.get('host', 'aws-0-eu-central-1.pooler.supabase.com'),
-        port=current_app.config.get('port', 5432),
-        database=current_app.config.get('database', 'postgres'),
-        user=current_app.config.get('user', 'postgres.ctlqtgwyuknxpkssidcd'),
-        password=current_app.config.get('password', '6pRZELCQUoGFIcf')
-    )
-
 # ============= MEKAN BIRIN (Stratigraphic Units) =============
+BIRIN_ORDER = KeysetOrder(
+    Key('b.created_at', 'created_at', descending=True),
+    Key('b.birin_uuid', 'birin_uuid')
+)
+
 @api_arch.route('/birin', methods=['GET'])
 @login_required
 def get_birin_units():
     """Get MEKAN Birin units (stratigraphic units)"""
     page = request.args.get('page', 1, type=int)
     per_page = request.args.get('per_page', 50, type=int)
+    cursor_token = request.args.get('cursor')
+    count_strategy = request.args.get('count', 'auto')
     search = request.args.get('search', '')
     year = request.args.get('year')
+    # ?render=db: PostgreSQL renders the whole page, geometry nested as json
+    db_rendered = request.args.get('render') == 'db'
+    geometry_cast = '::json' if db_rendered else ''
     
     conn = get_db()
     cursor = conn.cursor(cursor_factory=RealDictCursor)
     
     try:
-        query = """
+        query = f"""
             SELECT 
                 b.birin_uuid,
                 b.su_uuid,
@@ -51,7 +56,7 @@ def get_birin_units():
                 b.excavation_date,
                 b.excavated_by,
                 b.created_at,
-                ST_AsGeoJSON(b.geom) as geometry,
+                ST_AsGeoJSON(b.geom){geometry_cast} as geometry,
                 s.mekan_year,
                 s.mekan_alan,
                 s.mekan_acma,
@@ -63,59 +68,67 @@ def get_birin_units():
         params = []
         
         if search:
-            query += " AND (b.birin_no::text ILIKE %s OR b.description ILIKE %s OR b.birin_type ILIKE %s)"
-            params.extend([f'%{search}%', f'%{search}%', f'%{search}%'])
+            clause, clause_params = search_clause(
+                search, ['b.description', 'b.birin_type'], cast_columns=['b.birin_no'],
+                tsv=tsv_column('b', 'mekan_birin')
+            )
+            query += f" AND {clause}"
+            params.extend(clause_params)
         
         if year:
             query += " AND s.mekan_year = %s"
             params.append(year)
             
-        # Count total
-        count_query = f"SELECT COUNT(*) FROM ({query}) as t"
-        cursor.execute(count_query, params)
-        total = cursor.fetchone()['count']
-        
-        # Add pagination
-        query += " ORDER BY b.created_at DESC LIMIT %s OFFSET %s"
-        params.extend([per_page, (page - 1) * per_page])
-        
-        cursor.execute(query, params)
-        units = cursor.fetchall()
+        if db_rendered:
+            body = fetch_page_json(cursor, query, params, BIRIN_ORDER, page, per_page, cursor_token, count_strategy)
+            return current_app.response_class(body, mimetype='application/json')
+            
+        # Paginate: page/offset, or keyset when ?cursor= is given
+        units, page_info = fetch_page(cursor, query, params, BIRIN_ORDER, page, per_page, cursor_token, count_strategy)
         
         # Convert geometry
         for unit in units:
             if unit.get('geometry'):
-                unit['geometry'] = json.loads(unit['geometry'])
+                unit['geometry'] = raw_json(unit['geometry'])
         
         return jsonify({
             'data': units,
-            'total': total,
-            'page': page,
-            'per_page': per_page,
-            'total_pages': (total + per_page - 1) // per_page
+            **page_info
         })
         
+    except PaginationError as e:
+        return jsonify({'error': str(e)}), 400
     except Exception as e:
         return jsonify({'error': str(e)}), 500
     finally:
         cursor.close()
-        conn.close()
 
 # ============= MEKAN WALL =============
+WALL_ORDER = KeysetOrder(
+    Key('w.wall_year', 'wall_year', descending=True, nulls_last=True),
+    Key('w.wall_no', 'wall_no'),
+    Key('w.wall_uuid', 'wall_uuid')
+)
+
 @api_arch.route('/walls', methods=['GET'])
 @login_required
 def get_walls():
     """Get MEKAN Wall data"""
     page = request.args.get('page', 1, type=int)
     per_page = request.args.get('per_page', 50, type=int)
+    cursor_token = request.args.get('cursor')
+    count_strategy = request.args.get('count', 'auto')
     search = request.args.get('search', '')
     year = request.args.get('year')
+    # ?render=db: PostgreSQL renders the whole page, geometry nested as json
+    db_rendered = request.args.get('render') == 'db'
+    geometry_cast = '::json' if db_rendered else ''
     
     conn = get_db()
     cursor = conn.cursor(cursor_factory=RealDictCursor)
     
     try:
-        query = """
+        query = f"""
             SELECT 
                 w.wall_uuid,
                 w.wall_no,
@@ -132,78 +145,76 @@ def get_walls():
                 w.material,
                 w.preservation_state,
                 w.created_at,
-                ST_AsGeoJSON(w.geometry) as geometry
+                wm.mekan_no,
+                ST_AsGeoJSON(w.geometry){geometry_cast} as geometry
             FROM mekan_wall w
+        """ + WALL_MEKAN_JOIN + """
             WHERE 1=1
         """
         params = []
         
         if search:
-            query += " AND (w.wall_no ILIKE %s OR w.description ILIKE %s OR w.wall_type ILIKE %s)"
-            params.extend([f'%{search}%', f'%{search}%', f'%{search}%'])
+            clause, clause_params = search_clause(
+                search, ['w.description', 'w.wall_type'], cast_columns=['w.wall_no'],
+                tsv=tsv_column('w', 'mekan_wall')
+            )
+            query += f" AND {clause}"
+            params.extend(clause_params)
         
         if year:
             query += " AND w.wall_year = %s"
             params.append(year)
             
-        # Count total
-        count_query = f"SELECT COUNT(*) FROM ({query}) as t"
-        cursor.execute(count_query, params)
-        total = cursor.fetchone()['count']
-        
-        # Add pagination
-        query += " ORDER BY w.wall_year DESC NULLS LAST, w.wall_no LIMIT %s OFFSET %s"
-        params.extend([per_page, (page - 1) * per_page])
-        
-        cursor.execute(query, params)
-        walls = cursor.fetchall()
-        
-        # Add MEKAN relationship for each wall
-        for wall in walls:
-            if wall.get('wall_year') and wall.get('wall_alan'):
-                cursor.execute("""
-                    SELECT mekan_no FROM strat_unit 
-                    WHERE mekan_year = %s AND mekan_alan = %s
-                    LIMIT 1
-                """, (wall['wall_year'], wall['wall_alan']))
-                result = cursor.fetchone()
-                if result:
-                    wall['mekan_no'] = result['mekan_no']
+        if db_rendered:
+            body = fetch_page_json(cursor, query, params, WALL_ORDER, page, per_page, cursor_token, count_strategy)
+            return current_app.response_class(body, mimetype='application/json')
+            
+        # Paginate: page/offset, or keyset when ?cursor= is given
+        walls, page_info = fetch_page(cursor, query, params, WALL_ORDER, page, per_page, cursor_token, count_strategy)
         
         # Convert geometry
         for wall in walls:
             if wall.get('geometry'):
-                wall['geometry'] = json.loads(wall['geometry'])
+                wall['geometry'] = raw_json(wall['geometry'])
         
         return jsonify({
             'data': walls,
-            'total': total,
-            'page': page,
-            'per_page': per_page,
-            'total_pages': (total + per_page - 1) // per_page
+            **page_info
         })
         
+    except PaginationError as e:
+        return jsonify({'error': str(e)}), 400
     except Exception as e:
         return jsonify({'error': str(e)}), 500
     finally:
         cursor.close()
-        conn.close()
 
 # ============= MEKAN GRAVE =============
+GRAVE_ORDER = KeysetOrder(
+    Key('g.grave_year', 'grave_year', descending=True),
+    Key('g.grave_no', 'grave_no', descending=True),
+    Key('g.grave_uuid', 'grave_uuid')
+)
+
 @api_arch.route('/graves', methods=['GET'])
 @login_required
 def get_graves():
     """Get MEKAN Grave data"""
     page = request.args.get('page', 1, type=int)
     per_page = request.args.get('per_page', 50, type=int)
+    cursor_token = request.args.get('cursor')
+    count_strategy = request.args.get('count', 'auto')
     search = request.args.get('search', '')
     year = request.args.get('year')
+    # ?render=db: PostgreSQL renders the whole page, geometry nested as json
+    db_rendered = request.args.get('render') == 'db'
+    geometry_cast = '::json' if db_rendered else ''
     
     conn = get_db()
     cursor = conn.cursor(cursor_factory=RealDictCursor)
     
     try:
-        query = """
+        query = f"""
             SELECT 
                 g.grave_uuid,
                 g.grave_no,
@@ -220,7 +231,7 @@ def get_graves():
                 g.preservation_state,
                 g.grave_goods,
                 g.created_at,
-                ST_AsGeoJSON(g.geometry) as geometry,
+                ST_AsGeoJSON(g.geometry){geometry_cast} as geometry,
                 s.mekan_no
             FROM mekan_grave g
             LEFT JOIN strat_unit s ON g.su_uuid = s.su_uuid
@@ -229,59 +240,66 @@ def get_graves():
         params = []
         
         if search:
-            query += " AND (g.grave_no::text ILIKE %s OR g.description ILIKE %s OR g.grave_type ILIKE %s)"
-            params.extend([f'%{search}%', f'%{search}%', f'%{search}%'])
+            clause, clause_params = search_clause(
+                search, ['g.description', 'g.grave_type'], cast_columns=['g.grave_no'],
+                tsv=tsv_column('g', 'mekan_grave')
+            )
+            query += f" AND {clause}"
+            params.extend(clause_params)
         
         if year:
             query += " AND g.grave_year = %s"
             params.append(year)
             
-        # Count total
-        count_query = f"SELECT COUNT(*) FROM ({query}) as t"
-        cursor.execute(count_query, params)
-        total = cursor.fetchone()['count']
-        
-        # Add pagination
-        query += " ORDER BY g.grave_year DESC, g.grave_no DESC LIMIT %s OFFSET %s"
-        params.extend([per_page, (page - 1) * per_page])
-        
-        cursor.execute(query, params)
-        graves = cursor.fetchall()
+        if db_rendered:
+            body = fetch_page_json(cursor, query, params, GRAVE_ORDER, page, per_page, cursor_token, count_strategy)
+            return current_app.response_class(body, mimetype='application/json')
+            
+        # Paginate: page/offset, or keyset when ?cursor= is given
+        graves, page_info = fetch_page(cursor, query, params, GRAVE_ORDER, page, per_page, cursor_token, count_strategy)
         
         # Convert geometry
         for grave in graves:
             if grave.get('geometry'):
-                grave['geometry'] = json.loads(grave['geometry'])
+                grave['geometry'] = raw_json(grave['geometry'])
         
         return jsonify({
             'data': graves,
-            'total': total,
-            'page': page,
-            'per_page': per_page,
-            'total_pages': (total + per_page - 1) // per_page
+            **page_info
         })
         
+    except PaginationError as e:
+        return jsonify({'error': str(e)}), 400
     except Exception as e:
         return jsonify({'error': str(e)}), 500
     finally:
         cursor.close()
-        conn.close()
 
 # ============= FINDS (Correct Structure) =============
+FIND_ORDER = KeysetOrder(
+    Key('f.created_at', 'created_at', descending=True),
+    Key('f.id', 'id')
+)
+
 @api_arch.route('/finds', methods=['GET'])
 @login_required
 def get_finds():
     """Get Finds with correct structure"""
     page = request.args.get('page', 1, type=int)
     per_page = request.args.get('per_page', 50, type=int)
+    cursor_token = request.args.get('cursor')
+    count_strategy = request.args.get('count', 'auto')
     search = request.args.get('search', '')
     material = request.args.get('material')
+    # ?render=db: PostgreSQL renders the whole page, geometry nested as json
+    db_rendered = request.args.get('render') == 'db'
+    geometry_cast = '::json' if db_rendered else ''
     
     conn = get_db()
     cursor = conn.cursor(cursor_factory=RealDictCursor)
     
     try:
-        query = """
+        query = f"""
             SELECT 
                 f.id,
                 f.su_uuid,
@@ -297,7 +315,7 @@ def get_finds():
                 f.discovery_date,
                 f.registered_by,
                 f.created_at,
-                ST_AsGeoJSON(f.geometry) as geometry,
+                ST_AsGeoJSON(f.geometry){geometry_cast} as geometry,
                 s.mekan_no,
                 s.mekan_year,
                 s.mekan_alan
@@ -308,43 +326,40 @@ def get_finds():
         params = []
         
         if search:
-            query += " AND (f.find_number::text ILIKE %s OR f.description ILIKE %s OR f.material_type ILIKE %s)"
-            params.extend([f'%{search}%', f'%{search}%', f'%{search}%'])
+            clause, clause_params = search_clause(
+                search, ['f.description', 'f.material_type'], cast_columns=['f.find_number'],
+                tsv=tsv_column('f', 'finds')
+            )
+            query += f" AND {clause}"
+            params.extend(clause_params)
         
         if material:
             query += " AND f.material_type = %s"
             params.append(material)
             
-        # Count total
-        count_query = f"SELECT COUNT(*) FROM ({query}) as t"
-        cursor.execute(count_query, params)
-        total = cursor.fetchone()['count']
-        
-        # Add pagination
-        query += " ORDER BY f.created_at DESC LIMIT %s OFFSET %s"
-        params.extend([per_page, (page - 1) * per_page])
-        
-        cursor.execute(query, params)
-        finds = cursor.fetchall()
+        if db_rendered:
+            body = fetch_page_json(cursor, query, params, FIND_ORDER, page, per_page, cursor_token, count_strategy)
+            return current_app.response_class(body, mimetype='application/json')
+            
+        # Paginate: page/offset, or keyset when ?cursor= is given
+        finds, page_info = fetch_page(cursor, query, params, FIND_ORDER, page, per_page, cursor_token, count_strategy)
         
         # Convert geometry
         for find in finds:
             if find.get('geometry'):
-                find['geometry'] = json.loads(find['geometry'])
+                find['geometry'] = raw_json(find['geometry'])
         
         return jsonify({
             'data': finds,
-            'total': total,
-            'page': page,
-            'per_page': per_page,
-            'total_pages': (total + per_page - 1) // per_page
+            **page_info
         })
         
+    except PaginationError as e:
+        return jsonify({'error': str(e)}), 400
     except Exception as e:
         return jsonify({'error': str(e)}), 500
     finally:
         cursor.close()
-        conn.close()
 
 # ============= MEDIA/PHOTOS =============
 @api_arch.route('/media/<entity_type>/<entity_id>', methods=['GET'])
@@ -394,7 +409,6 @@ def get_entity_media(entity_type, entity_id):
         return jsonify({'error': str(e)}), 500
     finally:
         cursor.close()
-        conn.close()
 
 # ============= SPATIAL DATA =============
 @api_arch.route('/spatial/all', methods=['GET'])
@@ -406,16 +420,18 @@ def get_all_spatial():
     
     try:
         features = []
+        # Reads the maintained geom_4326 columns once migrated
+        schema = get_schema()
         
         # Get Birin units with geometry
-        cursor.execute("""
+        cursor.execute(f"""
             SELECT 
                 'birin' as layer,
                 birin_uuid as id,
                 birin_no as label,
                 birin_type,
                 description,
-                ST_AsGeoJSON(ST_Transform(geom, 4326)) as geometry
+                ST_AsGeoJSON({geometry_4326('mekan_birin', 'mekan_birin', schema)}) as geometry
             FROM mekan_birin
             WHERE geom IS NOT NULL
         """)
@@ -430,18 +446,18 @@ def get_all_spatial():
                         'type': row['birin_type'],
                         'description': row['description']
                     },
-                    'geometry': json.loads(row['geometry'])
+                    'geometry': raw_json(row['geometry'])
                 })
         
         # Get Walls with geometry
-        cursor.execute("""
+        cursor.execute(f"""
             SELECT 
                 'wall' as layer,
                 wall_uuid as id,
                 wall_no as label,
                 wall_type,
                 description,
-                ST_AsGeoJSON(ST_Transform(geometry, 4326)) as geometry
+                ST_AsGeoJSON({geometry_4326('mekan_wall', 'mekan_wall', schema)}) as geometry
             FROM mekan_wall
             WHERE geometry IS NOT NULL
         """)
@@ -456,18 +472,18 @@ def get_all_spatial():
                         'type': row['wall_type'],
                         'description': row['description']
                     },
-                    'geometry': json.loads(row['geometry'])
+                    'geometry': raw_json(row['geometry'])
                 })
         
         # Get Graves with geometry
-        cursor.execute("""
+        cursor.execute(f"""
             SELECT 
                 'grave' as layer,
                 grave_uuid as id,
                 grave_no as label,
                 grave_type,
                 description,
-                ST_AsGeoJSON(ST_Transform(geometry, 4326)) as geometry
+                ST_AsGeoJSON({geometry_4326('mekan_grave', 'mekan_grave', schema)}) as geometry
             FROM mekan_grave
             WHERE geometry IS NOT NULL
         """)
@@ -482,18 +498,18 @@ def get_all_spatial():
                         'type': row['grave_type'],
                         'description': row['description']
                     },
-                    'geometry': json.loads(row['geometry'])
+                    'geometry': raw_json(row['geometry'])
                 })
         
         # Get Finds with geometry
-        cursor.execute("""
+        cursor.execute(f"""
             SELECT 
                 'find' as layer,
                 id,
                 find_number as label,
                 material_type,
                 description,
-                ST_AsGeoJSON(ST_Transform(geometry, 4326)) as geometry
+                ST_AsGeoJSON({geometry_4326('finds', 'finds', schema)}) as geometry
             FROM finds
             WHERE geometry IS NOT NULL
             LIMIT 500
@@ -509,7 +525,7 @@ def get_all_spatial():
                         'material': row['material_type'],
                         'description': row['description']
                     },
-                    'geometry': json.loads(row['geometry'])
+                    'geometry': raw_json(row['geometry'])
                 })
         
         return jsonify({
@@ -522,138 +538,49 @@ def get_all_spatial():
         return jsonify({'error': str(e)}), 500
     finally:
         cursor.close()
-        conn.close()
 
 # ============= RELATIONSHIP COUNTS =============
 @api_arch.route('/relationships/<mekan_no>', methods=['GET'])
 @login_required
 def get_relationships(mekan_no):
     """Get accurate relationship counts for a MEKAN"""
+    try:
+        mekan_no = int(mekan_no)
+    except ValueError:
+        return jsonify({'error': 'Invalid mekan_no'}), 400
+    
     conn = get_db()
     cursor = conn.cursor(cursor_factory=RealDictCursor)
     
     try:
-        # Get MEKAN year and area for matching
-        cursor.execute("""
-            SELECT mekan_year, mekan_alan 
-            FROM strat_unit 
-            WHERE mekan_no = %s
-            LIMIT 1
-        """, (mekan_no,))
-        mekan = cursor.fetchone()
-        
-        counts = {
-            'birim': 0,
-            'walls': 0,
-            'graves': 0,
-            'finds': 0
-        }
-        
-        if mekan:
-            # Count Birim units
-            cursor.execute("""
-                SELECT COUNT(*) as count
-                FROM mekan_birin b
-                JOIN strat_unit s ON b.su_uuid = s.su_uuid
-                WHERE s.mekan_no = %s
-            """, (mekan_no,))
-            counts['birim'] = cursor.fetchone()['count']
-            
-            # Count Walls
-            cursor.execute("""
-                SELECT COUNT(*) as count
-                FROM mekan_wall
-                WHERE wall_year = %s AND wall_alan = %s
-            """, (mekan['mekan_year'], mekan['mekan_alan']))
-            counts['walls'] = cursor.fetchone()['count']
-            
-            # Count Graves  
-            cursor.execute("""
-                SELECT COUNT(*) as count
-                FROM mekan_grave
-                WHERE grave_year = %s AND grave_alan = %s
-            """, (mekan['mekan_year'], mekan['mekan_alan']))
-            counts['graves'] = cursor.fetchone()['count']
-            
-            # Count Finds
-            cursor.execute("""
-                SELECT COUNT(*) as count
-                FROM finds f
-                JOIN strat_unit s ON f.su_uuid = s.su_uuid
-                WHERE s.mekan_no = %s
-            """, (mekan_no,))
-            counts['finds'] = cursor.fetchone()['count']
-        
-        return jsonify(counts)
+        # All four counts in one aggregate query
+        counts = relationship_counts(cursor, [mekan_no], 'finds')
+        return jsonify(counts.get(mekan_no, empty_counts()))
         
     except Exception as e:
         return jsonify({'error': str(e)}), 500
     finally:
         cursor.close()
-        conn.close()
 
 # ============= STATISTICS =============
 @api_arch.route('/statistics', methods=['GET'])
 @login_required
 def get_statistics():
-    """Get comprehensive statistics"""
-    conn = get_db()
-    cursor = conn.cursor(cursor_factory=RealDictCursor)
-    
+    """Get comprehensive statistics (cached; finds are counted from the finds table)"""
     try:
-        stats = {}
-        
-        # Total counts
-        cursor.execute("SELECT COUNT(*) as count FROM mekan_birin")
-        stats['total_birin'] = cursor.fetchone()['count']
-        
-        cursor.execute("SELECT COUNT(*) as count FROM mekan_wall")
-        stats['total_walls'] = cursor.fetchone()['count']
-        
-        cursor.execute("SELECT COUNT(*) as count FROM mekan_grave")
-        stats['total_graves'] = cursor.fetchone()['count']
-        
-        cursor.execute("SELECT COUNT(*) as count FROM finds")
-        stats['total_finds'] = cursor.fetchone()['count']
-        
-        # Birin by type
-        cursor.execute("""
-            SELECT birin_type, COUNT(*) as count
-            FROM mekan_birin
-            WHERE birin_type IS NOT NULL
-            GROUP BY birin_type
-            ORDER BY count DESC
-        """)
-        stats['birin_by_type'] = cursor.fetchall()
-        
-        # Finds by material
-        cursor.execute("""
-            SELECT material_type, COUNT(*) as count
-            FROM finds
-            WHERE material_type IS NOT NULL
-            GROUP BY material_type
-            ORDER BY count DESC
-            LIMIT 10
-        """)
-        stats['finds_by_material'] = cursor.fetchall()
-        
-        # Excavation years
-        cursor.execute("""
-            SELECT DISTINCT mekan_year as year
-            FROM strat_unit
-            WHERE mekan_year IS NOT NULL
-            ORDER BY mekan_year DESC
-        """)
-        stats['excavation_years'] = [row['year'] for row in cursor.fetchall()]
-        
-        # Media count
-        cursor.execute("SELECT COUNT(*) as count FROM media")
-        stats['total_media'] = cursor.fetchone()['count']
-        
-        return jsonify(stats)
+        return statistics_response(lambda stats: {
+            'total_birin': stats['total_birim'],
+            'total_walls': stats['total_walls'],
+            'total_graves': stats['total_graves'],
+            'total_finds': stats['total_finds'],
+            'birin_by_type': stats['birim_by_type'],
+            'finds_by_material': [
+                {'material_type': row['material'], 'count': row['count']}
+                for row in stats['finds_by_material'][:10]
+            ],
+            'excavation_years': stats['excavation_years'],
+            'total_media': stats['total_media']
+        }, finds_table='finds')
         
     except Exception as e:
         return jsonify({'error': str(e)}), 500
-    finally:
-        cursor.close()
-        conn.close()
\ No newline at end of file
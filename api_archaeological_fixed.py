@@ -3,151 +3,186 @@ API Routes for Archaeological Data - Fixed with Correct Tables
 Handles MEKAN entities with correct table names
 """
 
-from flask import Blueprint, jsonify, request, current_app, send_file
-from flask_login import login_required
-import psycopg2
+from flask import Blueprint, Response, jsonify, request, current_app, send_file, url_for
+from flask_login import login_required, current_user
 from psycopg2.extras import RealDictCursor
-import json
-import pandas as pd
-from reportlab.lib import colors
-from reportlab.lib.pagesizes import A4
-from reportlab.platypus import SimpleDocTemplate, Table, TableStyle, Paragraph, Spacer
-from reportlab.lib.styles import getSampleStyleSheet
-from reportlab.lib.units import inch
+from psycopg2 import DataError
+from database import get_db
+from pagination import KeysetOrder, Key, fetch_page, fetch_page_json, PaginationError
+from enrichment import attach_has_media, attach_relationship_counts, relationship_counts, empty_counts, WALL_MEKAN_JOIN
+from enrichment import has_media_column, counts_column
+from enrichment import SUMMARY_TABLE, SUMMARY_COLUMNS, MEDIA_LINKS, MEKAN_ROW_ORDER
+from schema_registry import get_schema, refresh_schema
+from fieldsets import projection, geometry_projection, parse_geometry, record_columns, FieldsetError
+from fieldsets import RECORD_EXCLUDED
+from search import search_clause, tsv_column, find_documents, DOCUMENT_TYPES
+from exporter import xlsx_response, export_response, write_xlsx, temp_export_path, stream_file
+from exporter import EXPORT_FORMATS, GEOJSON_COLUMN
+from export_jobs import get_export_jobs, public_job
+from functools import partial
+from json_response import raw_json
+from pdf_reports import prepare_record, render_record, write_combined_pdf, zip_chunks, MAX_SHEET_THUMBNAILS
+from thumbnails import get_thumbnails, is_image
+from site_statistics import statistics_response, invalidate_statistics
+from tiles import get_tile_cache, layer_source, valid_tile, TILE_LAYERS, MVT_MIMETYPE
+from spatial import feature_collection, parse_bbox, parse_zoom, parse_layers, SpatialQueryError
+from spatial import DEFAULT_LAYER_LIMIT, MAX_LAYER_LIMIT
 import io
+import json
+import os
+import re
 from datetime import datetime
 
 api_arch_fixed = Blueprint('api_arch_fixed', __name__, url_prefix='/api/v3')
 
-def get_db():
-    """Get database connection to Supabase"""
-    return psycopg2.connect(
-        host=current_app.config.get('host', 'aws-0-eu-central-1.pooler.supabase.com'),
-        port=current_app.config.get('port', 5432),
-        database=current_app.config.get('database', 'postgres'),
-        user=current_app.config.get('user', 'postgres.ctlqtgwyuknxpkssidcd'),
-        password=current_app.config.get('password', '6pRZELCQUoGFIcf')
+# ============= MEKAN (Strat Units) =============
+MEKAN_ORDER = KeysetOrder(
+    Key('mekan_year', 'mekan_year', descending=True, nulls_last=True),
+    Key('mekan_no', 'mekan_no', nulls_last=True),
+    Key('su_uuid', 'su_uuid')
+)
+
+# Default list columns (without ?fields=)
+MEKAN_COLUMNS = [
+    'su_uuid', 'mekan_no', 'mekan_year', 'mekan_alan', 'mekan_acma', 'mekan_type', 'mekan_plankare',
+    'mekan_tabaka', 'description', 'description_tr', 'mekan_koordinat_x as koordinat_x',
+    'mekan_koordinat_y as koordinat_y', 'mekan_koordinat_z as koordinat_z', 'created_at'
+]
+
+def mekan_count_order(relation):
+    """(select column, order) for ?sort=<relation>: most related items first"""
+    column = SUMMARY_COLUMNS[relation]
+    expr = f"COALESCE((SELECT rs.{column} FROM {SUMMARY_TABLE} rs WHERE rs.mekan_no = strat_unit.mekan_no), 0)"
+    return f",\n                {expr} as {column}", KeysetOrder(
+        Key(expr, column, descending=True),
+        Key('mekan_no', 'mekan_no', nulls_last=True),
+        Key('su_uuid', 'su_uuid')
     )
 
-# ============= MEKAN (Strat Units) =============
 @api_arch_fixed.route('/mekan', methods=['GET'])
 @login_required
 def get_mekan_units():
     """Get MEKAN units from strat_unit table"""
     page = request.args.get('page', 1, type=int)
     per_page = request.args.get('per_page', 50, type=int)
+    cursor_token = request.args.get('cursor')
+    count_strategy = request.args.get('count', 'auto')
     search = request.args.get('search', '')
+    include = request.args.get('include', '').split(',')
+    sort = request.args.get('sort')
+    render = request.args.get('render')
     
     conn = get_db()
     cursor = conn.cursor(cursor_factory=RealDictCursor)
     
     try:
-        query = """
+        schema = get_schema()
+        has_summary = schema.has_table(SUMMARY_TABLE)
+        # ?render=db: PostgreSQL renders the whole page (embedded counts need the summary table)
+        db_rendered = render == 'db' and ('counts' not in include or has_summary)
+        
+        # ?sort=finds|birim|walls|graves orders by the relationship summary
+        sort_select, order = "", MEKAN_ORDER
+        if sort:
+            if sort not in SUMMARY_COLUMNS:
+                return jsonify({'error': f"Invalid sort, use one of: {', '.join(SUMMARY_COLUMNS)}"}), 400
+            if not has_summary:
+                return jsonify({'error': 'Relationship summary is not installed'}), 400
+            sort_select, order = mekan_count_order(sort)
+        
+        # ?fields= / ?geometry= narrow the projection; sort, media and count keys are always kept
+        columns = projection(request.args, 'strat_unit', 'strat_unit', schema, MEKAN_COLUMNS,
+                             required=('su_uuid', 'mekan_no', 'mekan_year'), as_json=db_rendered)
+        query = f"""
             SELECT 
-                su_uuid,
-                mekan_no,
-                mekan_year,
-                mekan_alan,
-                mekan_acma,
-                mekan_type,
-                mekan_plankare,
-                mekan_tabaka,
-                description,
-                description_tr,
-                mekan_koordinat_x as koordinat_x,
-                mekan_koordinat_y as koordinat_y,
-                mekan_koordinat_z as koordinat_z,
-                created_at,
-                ST_AsGeoJSON(geom) as geometry
+                {columns}{sort_select}
             FROM strat_unit
             WHERE 1=1
         """
         params = []
         
         if search:
-            # Try exact match first for numeric searches
-            try:
-                search_int = int(search)
-                query += " AND (mekan_no = %s OR description ILIKE %s OR mekan_alan ILIKE %s)"
-                params.extend([search_int, f'%{search}%', f'%{search}%'])
-            except ValueError:
-                # Not a number, use ILIKE for all fields
-                query += " AND (mekan_no::text ILIKE %s OR description ILIKE %s OR mekan_alan ILIKE %s)"
-                params.extend([f'%{search}%', f'%{search}%', f'%{search}%'])
+            # Numeric terms match mekan_no exactly; text uses the trigram/full-text indexes
+            clause, clause_params = search_clause(
+                search, ['description', 'mekan_alan'], exact_columns=['mekan_no'],
+                tsv=tsv_column(None, 'strat_unit')
+            )
+            query += f" AND {clause}"
+            params.extend(clause_params)
+        
+        if db_rendered:
+            extra_columns = [has_media_column('mekan')]
+            if 'counts' in include:
+                extra_columns.append(counts_column())
+            body = fetch_page_json(cursor, query, params, order, page, per_page, cursor_token, count_strategy,
+                                   extra_columns)
+            return current_app.response_class(body, mimetype='application/json')
             
-        # Count total
-        count_query = f"SELECT COUNT(*) FROM ({query}) as t"
-        cursor.execute(count_query, params)
-        total = cursor.fetchone()['count']
-        
-        # Add pagination and order
-        query += " ORDER BY mekan_year DESC NULLS LAST, mekan_no NULLS LAST LIMIT %s OFFSET %s"
-        params.extend([per_page, (page - 1) * per_page])
-        
-        cursor.execute(query, params)
-        units = cursor.fetchall()
+        # Paginate: page/offset, or keyset when ?cursor= is given
+        units, page_info = fetch_page(cursor, query, params, order, page, per_page, cursor_token, count_strategy)
         
         # Log for debugging
         print(f"MEKAN Query executed: {query}")
         print(f"Params: {params}")
         print(f"Found {len(units)} MEKAN units")
         
-        # Convert geometry and check for media
+        # Convert geometry
         for unit in units:
             if unit.get('geometry'):
-                unit['geometry'] = json.loads(unit['geometry'])
-            
-            # Check if has media
-            cursor.execute("""
-                SELECT COUNT(*) as count FROM media 
-                WHERE su_uuid = %s
-            """, (unit['su_uuid'],))
-            unit['has_media'] = cursor.fetchone()['count'] > 0
+                unit['geometry'] = raw_json(unit['geometry'])
+        
+        # Check for media (one query for the whole page)
+        attach_has_media(cursor, units, 'mekan')
+        
+        # ?include=counts embeds relationship counts (one query for the whole page)
+        if 'counts' in include:
+            attach_relationship_counts(cursor, units, schema.finds_table(), has_summary)
         
         return jsonify({
             'data': units,
-            'total': total,
-            'page': page,
-            'per_page': per_page,
-            'total_pages': (total + per_page - 1) // per_page
+            **page_info
         })
         
+    except (PaginationError, FieldsetError) as e:
+        return jsonify({'error': str(e)}), 400
     except Exception as e:
         return jsonify({'error': str(e)}), 500
     finally:
         cursor.close()
-        conn.close()
 
 # ============= BIRIM =============
+BIRIM_ORDER = KeysetOrder(
+    Key('b.created_at', 'created_at', descending=True),
+    Key('b.birin_uuid', 'birin_uuid')
+)
+
+BIRIM_COLUMNS = [
+    'b.birin_uuid', 'b.birin_no', 'b.birin_type', 'b.description', 'b.description_tr', 'b.koordinat_x',
+    'b.koordinat_y', 'b.koordinat_z', 'b.dimensions', 'b.preservation_state', 'b.created_at',
+    's.mekan_no', 's.mekan_year', 's.mekan_alan'
+]
+BIRIM_JOINED = {'mekan_no': 's.mekan_no', 'mekan_year': 's.mekan_year', 'mekan_alan': 's.mekan_alan'}
+
 @api_arch_fixed.route('/birim', methods=['GET'])
 @login_required
 def get_birim_units():
     """Get Birim units from mekan_birin table"""
     page = request.args.get('page', 1, type=int)
     per_page = request.args.get('per_page', 50, type=int)
+    cursor_token = request.args.get('cursor')
+    count_strategy = request.args.get('count', 'auto')
     search = request.args.get('search', '')
+    db_rendered = request.args.get('render') == 'db'
     
     conn = get_db()
     cursor = conn.cursor(cursor_factory=RealDictCursor)
     
     try:
-        query = """
+        columns = projection(request.args, 'b', 'mekan_birin', get_schema(), BIRIM_COLUMNS, BIRIM_JOINED,
+                             required=('birin_uuid', 'created_at'), as_json=db_rendered)
+        query = f"""
             SELECT 
-                b.birin_uuid,
-                b.birin_no,
-                b.birin_type,
-                b.description,
-                b.description_tr,
-                b.koordinat_x,
-                b.koordinat_y,
-                b.koordinat_z,
-                b.dimensions,
-                b.preservation_state,
-                b.created_at,
-                s.mekan_no,
-                s.mekan_year,
-                s.mekan_alan,
-                ST_AsGeoJSON(b.geom) as geometry
+                {columns}
             FROM mekan_birin b
             LEFT JOIN strat_unit s ON b.su_uuid = s.su_uuid
             WHERE 1=1
@@ -155,140 +190,145 @@ def get_birim_units():
         params = []
         
         if search:
-            query += " AND (b.birin_no::text ILIKE %s OR b.description ILIKE %s)"
-            params.extend([f'%{search}%', f'%{search}%'])
+            clause, clause_params = search_clause(
+                search, ['b.description'], cast_columns=['b.birin_no'],
+                tsv=tsv_column('b', 'mekan_birin')
+            )
+            query += f" AND {clause}"
+            params.extend(clause_params)
             
-        # Count total
-        count_query = f"SELECT COUNT(*) FROM ({query}) as t"
-        cursor.execute(count_query, params)
-        total = cursor.fetchone()['count']
-        
-        # Add pagination
-        query += " ORDER BY b.created_at DESC LIMIT %s OFFSET %s"
-        params.extend([per_page, (page - 1) * per_page])
-        
-        cursor.execute(query, params)
-        units = cursor.fetchall()
+        # ?render=db: PostgreSQL renders the whole page
+        if db_rendered:
+            body = fetch_page_json(cursor, query, params, BIRIM_ORDER, page, per_page, cursor_token, count_strategy,
+                                   [has_media_column('birim')])
+            return current_app.response_class(body, mimetype='application/json')
+            
+        # Paginate: page/offset, or keyset when ?cursor= is given
+        units, page_info = fetch_page(cursor, query, params, BIRIM_ORDER, page, per_page, cursor_token, count_strategy)
         
-        # Convert geometry and check media
+        # Convert geometry
         for unit in units:
             if unit.get('geometry'):
-                unit['geometry'] = json.loads(unit['geometry'])
-            
-            # Check for media
-            cursor.execute("""
-                SELECT COUNT(*) as count FROM media 
-                WHERE birin_uuid = %s
-            """, (unit['birin_uuid'],))
-            unit['has_media'] = cursor.fetchone()['count'] > 0
+                unit['geometry'] = raw_json(unit['geometry'])
+        
+        # Check for media (one query for the whole page)
+        attach_has_media(cursor, units, 'birim')
         
         return jsonify({
             'data': units,
-            'total': total,
-            'page': page,
-            'per_page': per_page,
-            'total_pages': (total + per_page - 1) // per_page
+            **page_info
         })
         
+    except (PaginationError, FieldsetError) as e:
+        return jsonify({'error': str(e)}), 400
     except Exception as e:
         return jsonify({'error': str(e)}), 500
     finally:
         cursor.close()
-        conn.close()
 
 # ============= WALLS =============
+WALL_ORDER = KeysetOrder(
+    Key('w.wall_year', 'wall_year', descending=True, nulls_last=True),
+    Key('w.wall_no', 'wall_no'),
+    Key('w.wall_uuid', 'wall_uuid')
+)
+
 @api_arch_fixed.route('/walls', methods=['GET'])
 @login_required
 def get_walls():
     """Get Wall data from mekan_wall table"""
     page = request.args.get('page', 1, type=int)
     per_page = request.args.get('per_page', 50, type=int)
+    cursor_token = request.args.get('cursor')
+    count_strategy = request.args.get('count', 'auto')
     search = request.args.get('search', '')
+    db_rendered = request.args.get('render') == 'db'
     
     conn = get_db()
     cursor = conn.cursor(cursor_factory=RealDictCursor)
     
     try:
-        query = """
+        schema = get_schema()
+        columns = projection(request.args, 'w', 'mekan_wall', schema,
+                             record_columns('w', 'mekan_wall', schema, RECORD_EXCLUDED) + ['wm.mekan_no'],
+                             {'mekan_no': 'wm.mekan_no'}, required=('wall_uuid', 'wall_no', 'wall_year'),
+                             as_json=db_rendered)
+        query = f"""
             SELECT 
-                w.*,
-                ST_AsGeoJSON(w.geom) as geometry
+                {columns}
             FROM mekan_wall w
+        """ + WALL_MEKAN_JOIN + """
             WHERE 1=1
         """
         params = []
         
         if search:
-            query += " AND (w.wall_no ILIKE %s OR w.description ILIKE %s)"
-            params.extend([f'%{search}%', f'%{search}%'])
+            clause, clause_params = search_clause(
+                search, ['w.description'], cast_columns=['w.wall_no'],
+                tsv=tsv_column('w', 'mekan_wall')
+            )
+            query += f" AND {clause}"
+            params.extend(clause_params)
             
-        # Count total
-        count_query = f"SELECT COUNT(*) FROM ({query}) as t"
-        cursor.execute(count_query, params)
-        total = cursor.fetchone()['count']
-        
-        # Add pagination
-        query += " ORDER BY w.wall_year DESC NULLS LAST, w.wall_no LIMIT %s OFFSET %s"
-        params.extend([per_page, (page - 1) * per_page])
-        
-        cursor.execute(query, params)
-        walls = cursor.fetchall()
+        # ?render=db: PostgreSQL renders the whole page
+        if db_rendered:
+            body = fetch_page_json(cursor, query, params, WALL_ORDER, page, per_page, cursor_token, count_strategy,
+                                   [has_media_column('wall')])
+            return current_app.response_class(body, mimetype='application/json')
+            
+        # Paginate: page/offset, or keyset when ?cursor= is given
+        walls, page_info = fetch_page(cursor, query, params, WALL_ORDER, page, per_page, cursor_token, count_strategy)
         
-        # Process each wall
+        # Convert geometry
         for wall in walls:
             if wall.get('geometry'):
-                wall['geometry'] = json.loads(wall['geometry'])
-            
-            # Get parent MEKAN
-            if wall.get('wall_year') and wall.get('wall_alan'):
-                cursor.execute("""
-                    SELECT mekan_no FROM strat_unit 
-                    WHERE mekan_year = %s AND mekan_alan = %s
-                    LIMIT 1
-                """, (wall['wall_year'], wall['wall_alan']))
-                result = cursor.fetchone()
-                if result:
-                    wall['mekan_no'] = result['mekan_no']
-            
-            # Check for media
-            cursor.execute("""
-                SELECT COUNT(*) as count FROM media 
-                WHERE wall_uuid = %s
-            """, (wall['wall_uuid'],))
-            wall['has_media'] = cursor.fetchone()['count'] > 0
+                wall['geometry'] = raw_json(wall['geometry'])
+        
+        # Check for media (one query for the whole page)
+        attach_has_media(cursor, walls, 'wall')
         
         return jsonify({
             'data': walls,
-            'total': total,
-            'page': page,
-            'per_page': per_page,
-            'total_pages': (total + per_page - 1) // per_page
+            **page_info
         })
         
+    except (PaginationError, FieldsetError) as e:
+        return jsonify({'error': str(e)}), 400
     except Exception as e:
         return jsonify({'error': str(e)}), 500
     finally:
         cursor.close()
-        conn.close()
 
 # ============= GRAVES =============
+GRAVE_ORDER = KeysetOrder(
+    Key('g.grave_year', 'grave_year', descending=True, nulls_last=True),
+    Key('g.grave_no', 'grave_no', descending=True),
+    Key('g.grave_uuid', 'grave_uuid')
+)
+
 @api_arch_fixed.route('/graves', methods=['GET'])
 @login_required
 def get_graves():
     """Get Grave data from mekan_grave table"""
     page = request.args.get('page', 1, type=int)
     per_page = request.args.get('per_page', 50, type=int)
+    cursor_token = request.args.get('cursor')
+    count_strategy = request.args.get('count', 'auto')
     search = request.args.get('search', '')
+    db_rendered = request.args.get('render') == 'db'
     
     conn = get_db()
     cursor = conn.cursor(cursor_factory=RealDictCursor)
     
     try:
-        query = """
+        schema = get_schema()
+        columns = projection(request.args, 'g', 'mekan_grave', schema,
+                             record_columns('g', 'mekan_grave', schema, RECORD_EXCLUDED) + ['s.mekan_no'],
+                             {'mekan_no': 's.mekan_no'}, required=('grave_uuid', 'grave_no', 'grave_year'),
+                             as_json=db_rendered)
+        query = f"""
             SELECT 
-                g.*,
-                s.mekan_no,
-                ST_AsGeoJSON(g.geom) as geometry
+                {columns}
             FROM mekan_grave g
             LEFT JOIN strat_unit s ON g.su_uuid = s.su_uuid
             WHERE 1=1
@@ -296,377 +336,394 @@ def get_graves():
         params = []
         
         if search:
-            query += " AND (g.grave_no::text ILIKE %s OR g.description ILIKE %s)"
-            params.extend([f'%{search}%', f'%{search}%'])
+            clause, clause_params = search_clause(
+                search, ['g.description'], cast_columns=['g.grave_no'],
+                tsv=tsv_column('g', 'mekan_grave')
+            )
+            query += f" AND {clause}"
+            params.extend(clause_params)
             
-        # Count total
-        count_query = f"SELECT COUNT(*) FROM ({query}) as t"
-        cursor.execute(count_query, params)
-        total = cursor.fetchone()['count']
-        
-        # Add pagination
-        query += " ORDER BY g.grave_year DESC NULLS LAST, g.grave_no DESC LIMIT %s OFFSET %s"
-        params.extend([per_page, (page - 1) * per_page])
-        
-        cursor.execute(query, params)
-        graves = cursor.fetchall()
+        # ?render=db: PostgreSQL renders the whole page
+        if db_rendered:
+            body = fetch_page_json(cursor, query, params, GRAVE_ORDER, page, per_page, cursor_token, count_strategy,
+                                   [has_media_column('grave')])
+            return current_app.response_class(body, mimetype='application/json')
+            
+        # Paginate: page/offset, or keyset when ?cursor= is given
+        graves, page_info = fetch_page(cursor, query, params, GRAVE_ORDER, page, per_page, cursor_token, count_strategy)
         
         # Process each grave
         for grave in graves:
             if grave.get('geometry'):
-                grave['geometry'] = json.loads(grave['geometry'])
-            
-            # Check for media
-            cursor.execute("""
-                SELECT COUNT(*) as count FROM media 
-                WHERE grave_uuid = %s
-            """, (grave.get('grave_uuid'),))
-            grave['has_media'] = cursor.fetchone()['count'] > 0
+                grave['geometry'] = raw_json(grave['geometry'])
+        
+        # Check for media (one query for the whole page)
+        attach_has_media(cursor, graves, 'grave')
         
         return jsonify({
             'data': graves,
-            'total': total,
-            'page': page,
-            'per_page': per_page,
-            'total_pages': (total + per_page - 1) // per_page
+            **page_info
         })
         
+    except (PaginationError, FieldsetError) as e:
+        return jsonify({'error': str(e)}), 400
     except Exception as e:
         return jsonify({'error': str(e)}), 500
     finally:
         cursor.close()
-        conn.close()
 
 # ============= FINDS (BULUNTU) =============
+FIND_TIE_COLUMNS = {
+    'mekan_buluntu': ('buluntu_uuid', 'bul_uuid', 'id', 'bul_no'),
+    'finds': ('find_uuid', 'id', 'find_id')
+}
+FIND_JOINED = {'mekan_no': 's.mekan_no', 'mekan_year': 's.mekan_year', 'mekan_alan': 's.mekan_alan'}
+
+def find_order(table, alias, schema):
+    """Newest first; break ties on the first unique-looking column the table has"""
+    order_keys = [Key(f'{alias}.created_at', 'created_at', descending=True)]
+    tie_column = next((c for c in FIND_TIE_COLUMNS[table] if schema.has_column(table, c)), None)
+    if tie_column:
+        order_keys.append(Key(f'{alias}.{tie_column}', tie_column))
+    return KeysetOrder(*order_keys)
+
 @api_arch_fixed.route('/finds', methods=['GET'])
 @login_required
 def get_finds():
     """Get Finds data from mekan_buluntu table"""
     page = request.args.get('page', 1, type=int)
     per_page = request.args.get('per_page', 50, type=int)
+    cursor_token = request.args.get('cursor')
+    count_strategy = request.args.get('count', 'auto')
     search = request.args.get('search', '')
+    db_rendered = request.args.get('render') == 'db'
     
     conn = get_db()
     cursor = conn.cursor(cursor_factory=RealDictCursor)
     
     try:
-        # First check if mekan_buluntu exists, otherwise use finds
-        cursor.execute("""
-            SELECT EXISTS (
-                SELECT FROM information_schema.tables 
-                WHERE table_name = 'mekan_buluntu'
-            )
-        """)
-        use_buluntu = cursor.fetchone()['exists']
-        
-        if use_buluntu:
-            query = """
-                SELECT 
-                    b.*,
-                    s.mekan_no,
-                    s.mekan_year,
-                    s.mekan_alan,
-                    ST_AsGeoJSON(b.geom) as geometry
-                FROM mekan_buluntu b
-                LEFT JOIN strat_unit s ON b.su_uuid = s.su_uuid
-                WHERE 1=1
-            """
-            id_field = 'bul_no'
-        else:
-            query = """
-                SELECT 
-                    f.*,
-                    s.mekan_no,
-                    s.mekan_year,
-                    s.mekan_alan,
-                    ST_AsGeoJSON(f.geometry) as geometry
-                FROM finds f
-                LEFT JOIN strat_unit s ON f.su_uuid = s.su_uuid
-                WHERE 1=1
-            """
-            id_field = 'find_number'
-        
+        # Use mekan_buluntu if it exists, otherwise finds
+        schema = get_schema()
+        use_buluntu = schema.has_table('mekan_buluntu')
+        table, alias = ('mekan_buluntu', 'b') if use_buluntu else ('finds', 'f')
+        id_field = 'bul_no' if use_buluntu else 'find_number'
+        
+        order = find_order(table, alias, schema)
+        
+        # ?fields= / ?geometry= narrow the projection; sort and media keys are always kept
+        media_keys = [row_key for row_key, _, _ in MEDIA_LINKS['buluntu' if use_buluntu else 'find']]
+        required = [key.column for key in order.keys] + media_keys
+        columns = projection(request.args, alias, table, schema,
+                             record_columns(alias, table, schema, RECORD_EXCLUDED)
+                             + ['s.mekan_no', 's.mekan_year', 's.mekan_alan'],
+                             FIND_JOINED,
+                             required=required, as_json=db_rendered)
+        query = f"""
+            SELECT 
+                {columns}
+            FROM {table} {alias}
+            LEFT JOIN strat_unit s ON {alias}.su_uuid = s.su_uuid
+            WHERE 1=1
+        """
         params = []
         
         if search:
             if use_buluntu:
-                query += f" AND (b.aciklama ILIKE %s OR b.malzemesi ILIKE %s)"
+                clause, clause_params = search_clause(
+                    search, ['b.aciklama', 'b.malzemesi'], tsv=tsv_column('b', 'mekan_buluntu')
+                )
             else:
-                query += f" AND (f.description ILIKE %s OR f.material_type ILIKE %s)"
-            params.extend([f'%{search}%', f'%{search}%'])
+                clause, clause_params = search_clause(
+                    search, ['f.description', 'f.material_type'], tsv=tsv_column('f', 'finds')
+                )
+            query += f" AND {clause}"
+            params.extend(clause_params)
+        
+        # ?render=db: PostgreSQL renders the whole page
+        if db_rendered:
+            body = fetch_page_json(cursor, query, params, order, page, per_page, cursor_token, count_strategy,
+                                   [has_media_column('buluntu' if use_buluntu else 'find', 'p', table, schema)])
+            return current_app.response_class(body, mimetype='application/json')
             
-        # Count total
-        count_query = f"SELECT COUNT(*) FROM ({query}) as t"
-        cursor.execute(count_query, params)
-        total = cursor.fetchone()['count']
-        
-        # Add pagination
-        query += " ORDER BY created_at DESC LIMIT %s OFFSET %s"
-        params.extend([per_page, (page - 1) * per_page])
-        
-        cursor.execute(query, params)
-        finds = cursor.fetchall()
+        # Paginate: page/offset, or keyset when ?cursor= is given
+        finds, page_info = fetch_page(cursor, query, params, order, page, per_page, cursor_token, count_strategy)
         
         # Process each find
         for find in finds:
             if find.get('geometry'):
-                find['geometry'] = json.loads(find['geometry'])
-            
-            # Check for media
-            if use_buluntu:
-                cursor.execute("""
-                    SELECT COUNT(*) as count FROM media 
-                    WHERE su_uuid = %s OR birin_uuid = %s
-                """, (find.get('su_uuid'), find.get('birin_uuid')))
-            else:
-                cursor.execute("""
-                    SELECT COUNT(*) as count FROM media 
-                    WHERE find_id = %s
-                """, (find.get('find_id'),))
-            find['has_media'] = cursor.fetchone()['count'] > 0
+                find['geometry'] = raw_json(find['geometry'])
+        
+        # Check for media (one query for the whole page)
+        attach_has_media(cursor, finds, 'buluntu' if use_buluntu else 'find')
         
         return jsonify({
             'data': finds,
-            'total': total,
-            'page': page,
-            'per_page': per_page,
-            'total_pages': (total + per_page - 1) // per_page
+            **page_info
         })
         
+    except (PaginationError, FieldsetError) as e:
+        return jsonify({'error': str(e)}), 400
     except Exception as e:
         return jsonify({'error': str(e)}), 500
     finally:
         cursor.close()
-        conn.close()
 
 # ============= RELATIONSHIPS =============
+# Largest batch accepted by POST /relationships (a few list pages)
+MAX_RELATIONSHIP_BATCH = 500
+
 @api_arch_fixed.route('/relationships/<mekan_no>', methods=['GET'])
 @login_required
 def get_relationships(mekan_no):
     """Get accurate relationship counts for a MEKAN"""
+    try:
+        mekan_no = int(mekan_no)
+    except ValueError:
+        return jsonify({'error': 'Invalid mekan_no'}), 400
+    
     conn = get_db()
     cursor = conn.cursor(cursor_factory=RealDictCursor)
     
     try:
-        # Get MEKAN details
-        cursor.execute("""
-            SELECT mekan_year, mekan_alan, su_uuid 
-            FROM strat_unit 
-            WHERE mekan_no = %s
-            LIMIT 1
-        """, (mekan_no,))
-        mekan = cursor.fetchone()
-        
-        counts = {
-            'birim': 0,
-            'walls': 0,
-            'graves': 0,
-            'finds': 0
-        }
-        
-        if mekan:
-            # Count Birim
-            cursor.execute("""
-                SELECT COUNT(*) as count
-                FROM mekan_birin b
-                JOIN strat_unit s ON b.su_uuid = s.su_uuid
-                WHERE s.mekan_no = %s
-            """, (mekan_no,))
-            counts['birim'] = cursor.fetchone()['count']
-            
-            # Count Walls
-            cursor.execute("""
-                SELECT COUNT(*) as count
-                FROM mekan_wall
-                WHERE wall_year = %s AND wall_alan = %s
-            """, (mekan['mekan_year'], mekan['mekan_alan']))
-            counts['walls'] = cursor.fetchone()['count']
-            
-            # Count Graves
-            cursor.execute("""
-                SELECT COUNT(*) as count
-                FROM mekan_grave
-                WHERE grave_year = %s AND grave_alan = %s
-            """, (mekan['mekan_year'], mekan['mekan_alan']))
-            counts['graves'] = cursor.fetchone()['count']
-            
-            # Count Finds (check both tables)
-            cursor.execute("""
-                SELECT EXISTS (
-                    SELECT FROM information_schema.tables 
-                    WHERE table_name = 'mekan_buluntu'
-                )
-            """)
-            if cursor.fetchone()['exists']:
-                cursor.execute("""
-                    SELECT COUNT(*) as count
-                    FROM mekan_buluntu b
-                    JOIN strat_unit s ON b.su_uuid = s.su_uuid
-                    WHERE s.mekan_no = %s
-                """, (mekan_no,))
-            else:
-                cursor.execute("""
-                    SELECT COUNT(*) as count
-                    FROM finds f
-                    JOIN strat_unit s ON f.su_uuid = s.su_uuid
-                    WHERE s.mekan_no = %s
-                """, (mekan_no,))
-            counts['finds'] = cursor.fetchone()['count']
-        
-        return jsonify(counts)
+        schema = get_schema()
+        counts = relationship_counts(cursor, [mekan_no], schema.finds_table(), schema.has_table(SUMMARY_TABLE))
+        return jsonify(counts.get(mekan_no, empty_counts()))
         
     except Exception as e:
         return jsonify({'error': str(e)}), 500
     finally:
         cursor.close()
-        conn.close()
 
-# ============= MEDIA =============
-@api_arch_fixed.route('/media/<entity_type>/<entity_id>', methods=['GET'])
+@api_arch_fixed.route('/relationships', methods=['POST'])
 @login_required
-def get_entity_media(entity_type, entity_id):
-    """Get media files for an entity"""
+def get_relationships_batch():
+    """Relationship counts for many MEKAN in one round-trip"""
+    data = request.get_json(silent=True) or {}
+    mekan_nos = data.get('mekan_no', [])
+    
+    if not isinstance(mekan_nos, list):
+        return jsonify({'error': 'mekan_no must be a list'}), 400
+    if len(mekan_nos) > MAX_RELATIONSHIP_BATCH:
+        return jsonify({'error': f'At most {MAX_RELATIONSHIP_BATCH} mekan_no per request'}), 400
+    try:
+        mekan_nos = [int(n) for n in mekan_nos]
+    except (TypeError, ValueError):
+        return jsonify({'error': 'Invalid mekan_no'}), 400
+    
     conn = get_db()
     cursor = conn.cursor(cursor_factory=RealDictCursor)
     
     try:
-        # Build query based on entity type
-        if entity_type == 'mekan':
-            # Get ALL UUIDs for this mekan (there might be duplicates)
-            try:
-                cursor.execute("SELECT su_uuid FROM strat_unit WHERE mekan_no::text = %s", (str(entity_id),))
-            except:
-                cursor.execute("SELECT su_uuid FROM strat_unit WHERE mekan_no = %s", (entity_id,))
-            results = cursor.fetchall()
-            if results:
-                # Get media for ALL matching UUIDs
-                uuid_list = [r['su_uuid'] for r in results]
-                placeholders = ','.join(['%s'] * len(uuid_list))
-                query = f"""
-                    SELECT DISTINCT id, filename, original_filename, file_url, description, 
-                           media_type, created_at, photographer, date_taken
-                    FROM media 
-                    WHERE su_uuid IN ({placeholders})
-                    ORDER BY created_at DESC
-                """
-                params = tuple(uuid_list)
-            else:
-                return jsonify({'entity_type': entity_type, 'entity_id': entity_id, 'media': [], 'total': 0})
-                
-        elif entity_type == 'birim':
-            # Get UUID for the birim
-            cursor.execute("SELECT birin_uuid FROM mekan_birin WHERE birin_no::text = %s", (entity_id,))
-            result = cursor.fetchone()
-            if result:
-                query = """
-                    SELECT id, filename, original_filename, file_url, description,
-                           media_type, created_at, photographer, date_taken
-                    FROM media 
-                    WHERE birin_uuid = %s
-                    ORDER BY created_at DESC
-                """
-                params = (result['birin_uuid'],)
-            else:
-                return jsonify({'entity_type': entity_type, 'entity_id': entity_id, 'media': [], 'total': 0})
-                
-        elif entity_type == 'wall':
-            # Get UUID for the wall
-            cursor.execute("SELECT wall_uuid FROM mekan_wall WHERE wall_no = %s", (entity_id,))
+        schema = get_schema()
+        counts = relationship_counts(cursor, mekan_nos, schema.finds_table(), schema.has_table(SUMMARY_TABLE))
+        return jsonify({
+            'counts': {str(n): counts.get(n, empty_counts()) for n in mekan_nos}
+        })
+        
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+    finally:
+        cursor.close()
+
+# ============= MEDIA =============
+def entity_media(cursor, entity_type, entity_id):
+    """Media rows of an entity with public_url and display_name; None for an unknown entity type"""
+    # Build query based on entity type
+    if entity_type == 'mekan':
+        # Get ALL UUIDs for this mekan (there might be duplicates)
+        try:
+            cursor.execute("SELECT su_uuid FROM strat_unit WHERE mekan_no::text = %s", (str(entity_id),))
+        except:
+            cursor.execute("SELECT su_uuid FROM strat_unit WHERE mekan_no = %s", (entity_id,))
+        results = cursor.fetchall()
+        if results:
+            # Get media for ALL matching UUIDs
+            uuid_list = [r['su_uuid'] for r in results]
+            placeholders = ','.join(['%s'] * len(uuid_list))
+            query = f"""
+                SELECT DISTINCT id, filename, original_filename, file_url, description, 
+                       media_type, created_at, photographer, date_taken
+                FROM media 
+                WHERE su_uuid IN ({placeholders})
+                ORDER BY created_at DESC
+            """
+            params = tuple(uuid_list)
+        else:
+            return []
+            
+    elif entity_type == 'birim':
+        # Get UUID for the birim
+        cursor.execute("SELECT birin_uuid FROM mekan_birin WHERE birin_no::text = %s", (entity_id,))
+        result = cursor.fetchone()
+        if result:
+            query = """
+                SELECT id, filename, original_filename, file_url, description,
+                       media_type, created_at, photographer, date_taken
+                FROM media 
+                WHERE birin_uuid = %s
+                ORDER BY created_at DESC
+            """
+            params = (result['birin_uuid'],)
+        else:
+            return []
+            
+    elif entity_type == 'wall':
+        # Get UUID for the wall
+        cursor.execute("SELECT wall_uuid FROM mekan_wall WHERE wall_no = %s", (entity_id,))
+        result = cursor.fetchone()
+        if result:
+            query = """
+                SELECT id, filename, original_filename, file_url, description,
+                       media_type, created_at, photographer, date_taken
+                FROM media 
+                WHERE wall_uuid = %s
+                ORDER BY created_at DESC
+            """
+            params = (result['wall_uuid'],)
+        else:
+            return []
+            
+    elif entity_type == 'grave':
+        # Get UUID for the grave
+        cursor.execute("SELECT grave_uuid FROM mekan_grave WHERE grave_no::text = %s", (entity_id,))
+        result = cursor.fetchone()
+        if result:
+            query = """
+                SELECT id, filename, original_filename, file_url, description,
+                       media_type, created_at, photographer, date_taken
+                FROM media 
+                WHERE grave_uuid = %s
+                ORDER BY created_at DESC
+            """
+            params = (result['grave_uuid'],)
+        else:
+            return []
+            
+    elif entity_type == 'find':
+        # Check if using mekan_buluntu or finds table
+        if get_schema().has_table('mekan_buluntu'):
+            # Get UUID for the buluntu
+            cursor.execute("SELECT su_uuid, birin_uuid FROM mekan_buluntu WHERE bul_no::text = %s", (entity_id,))
             result = cursor.fetchone()
             if result:
                 query = """
                     SELECT id, filename, original_filename, file_url, description,
                            media_type, created_at, photographer, date_taken
                     FROM media 
-                    WHERE wall_uuid = %s
+                    WHERE su_uuid = %s OR birin_uuid = %s
                     ORDER BY created_at DESC
                 """
-                params = (result['wall_uuid'],)
+                params = (result['su_uuid'], result['birin_uuid'])
             else:
-                return jsonify({'entity_type': entity_type, 'entity_id': entity_id, 'media': [], 'total': 0})
-                
-        elif entity_type == 'grave':
-            # Get UUID for the grave
-            cursor.execute("SELECT grave_uuid FROM mekan_grave WHERE grave_no::text = %s", (entity_id,))
+                return []
+        else:
+            # Use finds table
+            cursor.execute("SELECT find_id FROM finds WHERE find_number::text = %s", (entity_id,))
             result = cursor.fetchone()
             if result:
                 query = """
                     SELECT id, filename, original_filename, file_url, description,
                            media_type, created_at, photographer, date_taken
                     FROM media 
-                    WHERE grave_uuid = %s
+                    WHERE find_id = %s
                     ORDER BY created_at DESC
                 """
-                params = (result['grave_uuid'],)
+                params = (result['find_id'],)
             else:
-                return jsonify({'entity_type': entity_type, 'entity_id': entity_id, 'media': [], 'total': 0})
-                
-        elif entity_type == 'find':
-            # Check if using mekan_buluntu or finds table
-            cursor.execute("""
-                SELECT EXISTS (
-                    SELECT FROM information_schema.tables 
-                    WHERE table_name = 'mekan_buluntu'
-                )
-            """)
-            if cursor.fetchone()['exists']:
-                # Get UUID for the buluntu
-                cursor.execute("SELECT su_uuid, birin_uuid FROM mekan_buluntu WHERE bul_no::text = %s", (entity_id,))
-                result = cursor.fetchone()
-                if result:
-                    query = """
-                        SELECT id, filename, original_filename, file_url, description,
-                               media_type, created_at, photographer, date_taken
-                        FROM media 
-                        WHERE su_uuid = %s OR birin_uuid = %s
-                        ORDER BY created_at DESC
-                    """
-                    params = (result['su_uuid'], result['birin_uuid'])
-                else:
-                    return jsonify({'entity_type': entity_type, 'entity_id': entity_id, 'media': [], 'total': 0})
+                return []
+    else:
+        return None
+        
+    cursor.execute(query, params)
+    return add_media_urls(entity_type, cursor.fetchall())
+
+def add_media_urls(entity_type, media_files):
+    """Set public_url and display_name on media rows"""
+    # Construct URLs for each media file
+    for media in media_files:
+        # Use the file_url from database if available (it has the complete path)
+        if media.get('file_url'):
+            media['public_url'] = media['file_url']
+        elif media.get('filename'):
+            # Fallback: construct URL from filename
+            # The files are stored in the mekan-media bucket on Supabase
+            # Try to guess the path structure based on entity type
+            if entity_type == 'mekan':
+                # Format: mekan/YYYY/filename
+                media['public_url'] = f"https://ctlqtgwyuknxpkssidcd.supabase.co/storage/v1/object/public/mekan-media/mekan/2025/{media['filename']}"
+            elif entity_type == 'grave':
+                media['public_url'] = f"https://ctlqtgwyuknxpkssidcd.supabase.co/storage/v1/object/public/mekan-media/grave/2025/{media['filename']}"
             else:
-                # Use finds table
-                cursor.execute("SELECT find_id FROM finds WHERE find_number::text = %s", (entity_id,))
-                result = cursor.fetchone()
-                if result:
-                    query = """
-                        SELECT id, filename, original_filename, file_url, description,
-                               media_type, created_at, photographer, date_taken
-                        FROM media 
-                        WHERE find_id = %s
-                        ORDER BY created_at DESC
-                    """
-                    params = (result['find_id'],)
-                else:
-                    return jsonify({'entity_type': entity_type, 'entity_id': entity_id, 'media': [], 'total': 0})
+                # Generic path
+                media['public_url'] = f"https://ctlqtgwyuknxpkssidcd.supabase.co/storage/v1/object/public/mekan-media/{media['filename']}"
         else:
+            media['public_url'] = None
+        
+        # Add display name
+        media['display_name'] = media.get('original_filename') or media.get('filename') or 'Unnamed file'
+    
+    return media_files
+
+def record_media(cursor, entity_type, media_links, record):
+    """Media rows of an already loaded record, matched on its MEDIA_LINKS keys"""
+    links = [(media_col, record[row_key]) for row_key, media_col, _ in MEDIA_LINKS[media_links]
+             if record.get(row_key) is not None]
+    if not links:
+        return []
+    cursor.execute(f"""
+        SELECT DISTINCT id, filename, original_filename, file_url, description,
+               media_type, created_at, photographer, date_taken
+        FROM media
+        WHERE {' OR '.join(f'{media_col} = %s' for media_col, _ in links)}
+        ORDER BY created_at DESC
+    """, [value for _, value in links])
+    return add_media_urls(entity_type, cursor.fetchall())
+
+def records_media(cursor, entity_type, media_links, records):
+    """record_media() for many records in one query: a list of media rows per record"""
+    links = MEDIA_LINKS[media_links]
+    parts = []
+    params = []
+    for row_key, media_col, array_type in links:
+        keys = list({record[row_key] for record in records if record.get(row_key) is not None})
+        if not keys:
+            continue
+        cast = f"::{array_type}" if array_type else ""
+        parts.append(f"""
+            SELECT %s AS link, {media_col}::text AS key, id, filename, original_filename, file_url,
+                   description, media_type, created_at, photographer, date_taken
+            FROM media
+            WHERE {media_col} = ANY(%s{cast})
+        """)
+        params.extend([row_key, keys])
+    
+    by_key = {}
+    if parts:
+        cursor.execute(" UNION ALL ".join(parts) + " ORDER BY created_at DESC", params)
+        for media in cursor.fetchall():
+            by_key.setdefault((media.pop('link'), media.pop('key')), []).append(media)
+    
+    result = []
+    for record in records:
+        media_files = {}
+        for row_key, _, _ in links:
+            if record.get(row_key) is not None:
+                for media in by_key.get((row_key, str(record[row_key])), []):
+                    media_files.setdefault(media['id'], dict(media))
+        result.append(add_media_urls(entity_type, list(media_files.values())))
+    return result
+
+@api_arch_fixed.route('/media/<entity_type>/<entity_id>', methods=['GET'])
+@login_required
+def get_entity_media(entity_type, entity_id):
+    """Get media files for an entity"""
+    conn = get_db()
+    cursor = conn.cursor(cursor_factory=RealDictCursor)
+    
+    try:
+        media_files = entity_media(cursor, entity_type, entity_id)
+        if media_files is None:
             return jsonify({'error': 'Invalid entity type'}), 400
-            
-        cursor.execute(query, params)
-        media_files = cursor.fetchall()
-        
-        # Construct URLs for each media file
-        for media in media_files:
-            # Use the file_url from database if available (it has the complete path)
-            if media.get('file_url'):
-                media['public_url'] = media['file_url']
-            elif media.get('filename'):
-                # Fallback: construct URL from filename
-                # The files are stored in the mekan-media bucket on Supabase
-                # Try to guess the path structure based on entity type
-                if entity_type == 'mekan':
-                    # Format: mekan/YYYY/filename
-                    media['public_url'] = f"https://ctlqtgwyuknxpkssidcd.supabase.co/storage/v1/object/public/mekan-media/mekan/2025/{media['filename']}"
-                elif entity_type == 'grave':
-                    media['public_url'] = f"https://ctlqtgwyuknxpkssidcd.supabase.co/storage/v1/object/public/mekan-media/grave/2025/{media['filename']}"
-                else:
-                    # Generic path
-                    media['public_url'] = f"https://ctlqtgwyuknxpkssidcd.supabase.co/storage/v1/object/public/mekan-media/{media['filename']}"
-            else:
-                media['public_url'] = None
-            
-            # Add display name
-            media['display_name'] = media.get('original_filename') or media.get('filename') or 'Unnamed file'
         
         return jsonify({
             'entity_type': entity_type,
@@ -679,196 +736,512 @@ def get_entity_media(entity_type, entity_id):
         return jsonify({'error': str(e)}), 500
     finally:
         cursor.close()
-        conn.close()
 
-# ============= EXPORT TO EXCEL =============
-@api_arch_fixed.route('/export/<entity_type>/excel', methods=['GET'])
+# ============= DETAIL =============
+UUID_PATTERN = re.compile(r'^[0-9a-fA-F]{8}-([0-9a-fA-F]{4}-){3}[0-9a-fA-F]{12}$')
+
+# Summary of the parent MEKAN embedded with ?include=mekan
+PARENT_MEKAN_FIELDS = ('su_uuid', 'mekan_no', 'mekan_year', 'mekan_alan', 'mekan_acma', 'mekan_type')
+
+def detail_columns(alias, table, schema, geometry_mode, as_json=False):
+    """Select list of a full record: every column except geometry/search ones, plus the geometry mode"""
+    columns = record_columns(alias, table, schema, RECORD_EXCLUDED)
+    geometry = geometry_projection(alias, table, geometry_mode, schema, as_json)
+    if geometry:
+        columns.append(geometry)
+    return columns
+
+def detail_source(collection, schema):
+    """
+    Table, uuid/number key columns, media entity, parent MEKAN condition
+    (over `x` and strat_unit `p`) and order of a detail collection. Numbers
+    can repeat (e.g. wall_no per year/alan), so a lookup by number returns
+    the newest match, first in the list order; uuids are unique
+    """
+    if collection == 'mekan':
+        return {'table': 'strat_unit', 'uuid': 'su_uuid', 'number': 'mekan_no',
+                'entity': 'mekan', 'media': 'mekan', 'parent': None,
+                'order': f'ORDER BY x.{MEKAN_ROW_ORDER}'}
+    elif collection == 'birim':
+        return {'table': 'mekan_birin', 'uuid': 'birin_uuid', 'number': 'birin_no',
+                'entity': 'birim', 'media': 'birim', 'parent': 'p.su_uuid = x.su_uuid',
+                'order': 'ORDER BY x.created_at DESC, x.birin_uuid'}
+    elif collection == 'walls':
+        # Walls belong to the first MEKAN of their year/alan, as in WALL_MEKAN_JOIN
+        return {'table': 'mekan_wall', 'uuid': 'wall_uuid', 'number': 'wall_no',
+                'entity': 'wall', 'media': 'wall',
+                'parent': 'p.mekan_year = x.wall_year AND p.mekan_alan = x.wall_alan',
+                'order': 'ORDER BY x.wall_year DESC NULLS LAST, x.wall_uuid'}
+    elif collection == 'graves':
+        return {'table': 'mekan_grave', 'uuid': 'grave_uuid', 'number': 'grave_no',
+                'entity': 'grave', 'media': 'grave', 'parent': 'p.su_uuid = x.su_uuid',
+                'order': 'ORDER BY x.grave_year DESC NULLS LAST, x.grave_uuid'}
+    elif collection == 'finds':
+        if schema.has_table('mekan_buluntu'):
+            return {'table': 'mekan_buluntu', 'uuid': 'bul_uuid', 'number': 'bul_no',
+                    'entity': 'find', 'media': 'buluntu', 'parent': 'p.su_uuid = x.su_uuid',
+                    'order': find_order('mekan_buluntu', 'x', schema).order_by()}
+        return {'table': 'finds', 'uuid': 'find_uuid', 'number': 'find_number',
+                'entity': 'find', 'media': 'find', 'parent': 'p.su_uuid = x.su_uuid',
+                'order': find_order('finds', 'x', schema).order_by()}
+    return None
+
+@api_arch_fixed.route('/<any(mekan, birim, walls, graves, finds):collection>/<entity_id>', methods=['GET'])
 @login_required
-def export_to_excel(entity_type):
-    """Export entity data to Excel"""
+def get_entity_detail(collection, entity_id):
+    """One record by uuid or number; ?include=media,counts,mekan embeds related data"""
+    include = request.args.get('include', '').split(',')
+    
     conn = get_db()
     cursor = conn.cursor(cursor_factory=RealDictCursor)
     
     try:
-        # Get data based on entity type
-        if entity_type == 'mekan':
-            query = "SELECT * FROM strat_unit ORDER BY mekan_year DESC, mekan_no"
-        elif entity_type == 'birim':
-            query = """
-                SELECT b.*, s.mekan_no, s.mekan_year, s.mekan_alan
-                FROM mekan_birin b
+        schema = get_schema()
+        source = detail_source(collection, schema)
+        table = source['table']
+        if not schema.has_table(table):
+            return jsonify({'error': f'Table {table} does not exist'}), 404
+        key = source['number']
+        if UUID_PATTERN.match(entity_id) and schema.has_column(table, source['uuid']):
+            key = source['uuid']
+        
+        columns = detail_columns('x', table, schema, parse_geometry(request.args.get('geometry')))
+        embed_parent = 'mekan' in include and source['parent'] is not None
+        if embed_parent:
+            fields = ', '.join(f"'{field}', p.{field}" for field in PARENT_MEKAN_FIELDS)
+            columns.append(f"""(
+                SELECT json_build_object({fields}) FROM strat_unit p
+                WHERE {source['parent']}
+                ORDER BY p.mekan_no LIMIT 1
+            ) AS parent_mekan""")
+        
+        # The id is passed untyped, so PostgreSQL reads it as the key column's type and uses its index
+        try:
+            cursor.execute(f"""
+                SELECT {', '.join(columns)}
+                FROM {table} x
+                WHERE x.{key} = %s
+                {source['order']}
+                LIMIT 1
+            """, (entity_id,))
+            record = cursor.fetchone()
+        except DataError:
+            # e.g. a non-numeric id for an integer key
+            conn.rollback()
+            record = None
+        if record is None:
+            return jsonify({'error': 'Record not found'}), 404
+        
+        if record.get('geometry'):
+            record['geometry'] = raw_json(record['geometry'])
+        
+        response = {'entity_type': collection, 'data': record}
+        if embed_parent:
+            response['mekan'] = record.pop('parent_mekan')
+        if 'media' in include:
+            response['media'] = record_media(cursor, source['entity'], source['media'], record)
+        if 'counts' in include and collection == 'mekan':
+            counts = relationship_counts(cursor, [record['mekan_no']], schema.finds_table(),
+                                         schema.has_table(SUMMARY_TABLE))
+            response['counts'] = counts.get(record['mekan_no'], empty_counts())
+        
+        return jsonify(response)
+        
+    except FieldsetError as e:
+        return jsonify({'error': str(e)}), 400
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+    finally:
+        cursor.close()
+
+# ============= MEKAN DOSSIER =============
+# Child lists of a dossier, each paged with ?<child>_page=
+DOSSIER_CHILDREN = ('birim', 'walls', 'graves', 'finds', 'media')
+DOSSIER_PER_PAGE = 20
+MAX_DOSSIER_PER_PAGE = 200
+
+MEDIA_ORDER = KeysetOrder(
+    Key('media.created_at', 'created_at', descending=True),
+    Key('media.id', 'id')
+)
+
+def dossier_children(schema, geometry_mode):
+    """Child list name -> (table, alias, condition, order, columns); conditions follow relationship_counts()"""
+    finds_table = schema.finds_table()
+    finds_alias = 'b' if finds_table == 'mekan_buluntu' else 'f'
+    by_su = "{alias}.su_uuid IN (SELECT su_uuid FROM strat_unit WHERE mekan_no = %(mekan_no)s)"
+    children = {
+        'birim': ('mekan_birin', 'b', by_su.format(alias='b'), BIRIM_ORDER),
+        'walls': ('mekan_wall', 'w', "w.wall_year = %(mekan_year)s AND w.wall_alan = %(mekan_alan)s", WALL_ORDER),
+        'graves': ('mekan_grave', 'g', "g.grave_year = %(mekan_year)s AND g.grave_alan = %(mekan_alan)s", GRAVE_ORDER),
+        'finds': (finds_table, finds_alias, by_su.format(alias=finds_alias), find_order(finds_table, finds_alias, schema))
+    }
+    return {
+        name: (table, alias, condition, order, detail_columns(alias, table, schema, geometry_mode, as_json=True))
+        for name, (table, alias, condition, order) in children.items()
+        if schema.has_table(table)
+    }
+
+def dossier_query(children):
+    """
+    One statement returning, for each child list and the MEKAN's media, the
+    total and the requested page as JSON text rendered by PostgreSQL
+    """
+    lists = dict(children)
+    lists['media'] = ('media', 'media', "media.su_uuid IN (SELECT su_uuid FROM strat_unit WHERE mekan_no = %(mekan_no)s)",
+                      MEDIA_ORDER, ['media.id', 'media.filename', 'media.original_filename', 'media.file_url',
+                                    'media.description', 'media.media_type', 'media.created_at',
+                                    'media.photographer', 'media.date_taken'])
+    parts = []
+    for name, (table, alias, condition, order, columns) in lists.items():
+        parts.append(f"""
+            (SELECT COUNT(*) FROM {table} {alias} WHERE {condition}) AS {name}_total,
+            (SELECT COALESCE(json_agg(r {order.order_by_columns('r')}), '[]')::text FROM (
+                SELECT {', '.join(columns)}
+                FROM {table} {alias}
+                WHERE {condition}
+                {order.order_by()}
+                LIMIT %(per_page)s OFFSET %({name}_offset)s
+            ) r) AS {name}_data""")
+    return "SELECT " + ",".join(parts)
+
+@api_arch_fixed.route('/mekan/<mekan_no>/dossier', methods=['GET'])
+@login_required
+def get_mekan_dossier(mekan_no):
+    """A MEKAN with its birim, walls, graves, finds and media, each list paged independently"""
+    try:
+        mekan_no = int(mekan_no)
+    except ValueError:
+        return jsonify({'error': 'Invalid mekan_no'}), 400
+    per_page = max(1, min(request.args.get('per_page', DOSSIER_PER_PAGE, type=int), MAX_DOSSIER_PER_PAGE))
+    pages = {name: max(1, request.args.get(f'{name}_page', 1, type=int)) for name in DOSSIER_CHILDREN}
+    
+    conn = get_db()
+    cursor = conn.cursor(cursor_factory=RealDictCursor)
+    
+    try:
+        schema = get_schema()
+        geometry_mode = parse_geometry(request.args.get('geometry'))
+        
+        # The MEKAN itself; when the number is reused, the row relationship_counts() uses,
+        # so the walls/graves matched on its year/alan agree with the counts
+        cursor.execute(f"""
+            SELECT {', '.join(detail_columns('x', 'strat_unit', schema, geometry_mode))}
+            FROM strat_unit x
+            WHERE x.mekan_no = %s
+            ORDER BY x.{MEKAN_ROW_ORDER}
+            LIMIT 1
+        """, (mekan_no,))
+        mekan = cursor.fetchone()
+        if mekan is None:
+            return jsonify({'error': 'MEKAN not found'}), 404
+        if mekan.get('geometry'):
+            mekan['geometry'] = raw_json(mekan['geometry'])
+        
+        # All child lists and the media in one round-trip
+        children = dossier_children(schema, geometry_mode)
+        params = {
+            'mekan_no': mekan_no,
+            'mekan_year': mekan.get('mekan_year'),
+            'mekan_alan': mekan.get('mekan_alan'),
+            'per_page': per_page,
+            **{f'{name}_offset': (page - 1) * per_page for name, page in pages.items()}
+        }
+        cursor.execute(dossier_query(children), params)
+        row = cursor.fetchone()
+        
+        response = {'mekan': mekan}
+        for name in list(children) + ['media']:
+            total = row[f'{name}_total']
+            response[name] = {
+                'data': raw_json(row[f'{name}_data']),
+                'total': total,
+                'page': pages[name],
+                'per_page': per_page,
+                'total_pages': (total + per_page - 1) // per_page
+            }
+        
+        # Media rows need their public URLs, so that list is decoded here
+        response['media']['data'] = add_media_urls('mekan', json.loads(row['media_data']))
+        
+        return jsonify(response)
+        
+    except FieldsetError as e:
+        return jsonify({'error': str(e)}), 400
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+    finally:
+        cursor.close()
+
+# ============= EXPORT TO EXCEL =============
+def export_query(entity_type, schema):
+    """Full-table export query for an entity type, or None if unknown"""
+    def columns(alias, table):
+        return ", ".join(record_columns(alias, table, schema))
+    
+    if entity_type == 'mekan':
+        return f"SELECT {columns('s', 'strat_unit')} FROM strat_unit s ORDER BY s.mekan_year DESC, s.mekan_no"
+    elif entity_type == 'birim':
+        return f"""
+            SELECT {columns('b', 'mekan_birin')}, s.mekan_no, s.mekan_year, s.mekan_alan
+            FROM mekan_birin b
+            LEFT JOIN strat_unit s ON b.su_uuid = s.su_uuid
+            ORDER BY b.created_at DESC
+        """
+    elif entity_type == 'walls':
+        return f"SELECT {columns('w', 'mekan_wall')} FROM mekan_wall w ORDER BY w.wall_year DESC, w.wall_no"
+    elif entity_type == 'graves':
+        return f"""
+            SELECT {columns('g', 'mekan_grave')}, s.mekan_no
+            FROM mekan_grave g
+            LEFT JOIN strat_unit s ON g.su_uuid = s.su_uuid
+            ORDER BY g.grave_year DESC, g.grave_no
+        """
+    elif entity_type == 'finds':
+        # Check which table to use
+        if schema.has_table('mekan_buluntu'):
+            return f"""
+                SELECT {columns('b', 'mekan_buluntu')}, s.mekan_no, s.mekan_year
+                FROM mekan_buluntu b
                 LEFT JOIN strat_unit s ON b.su_uuid = s.su_uuid
                 ORDER BY b.created_at DESC
             """
-        elif entity_type == 'walls':
-            query = "SELECT * FROM mekan_wall ORDER BY wall_year DESC, wall_no"
-        elif entity_type == 'graves':
-            query = """
-                SELECT g.*, s.mekan_no
-                FROM mekan_grave g
-                LEFT JOIN strat_unit s ON g.su_uuid = s.su_uuid
-                ORDER BY g.grave_year DESC, g.grave_no
-            """
-        elif entity_type == 'finds':
-            # Check which table to use
-            cursor.execute("""
-                SELECT EXISTS (
-                    SELECT FROM information_schema.tables 
-                    WHERE table_name = 'mekan_buluntu'
-                )
-            """)
-            if cursor.fetchone()['exists']:
-                query = """
-                    SELECT b.*, s.mekan_no, s.mekan_year
-                    FROM mekan_buluntu b
-                    LEFT JOIN strat_unit s ON b.su_uuid = s.su_uuid
-                    ORDER BY b.created_at DESC
-                """
-            else:
-                query = """
-                    SELECT f.*, s.mekan_no, s.mekan_year
-                    FROM finds f
-                    LEFT JOIN strat_unit s ON f.su_uuid = s.su_uuid
-                    ORDER BY f.created_at DESC
-                """
-        else:
+        return f"""
+            SELECT {columns('f', 'finds')}, s.mekan_no, s.mekan_year
+            FROM finds f
+            LEFT JOIN strat_unit s ON f.su_uuid = s.su_uuid
+            ORDER BY f.created_at DESC
+        """
+    return None
+
+@api_arch_fixed.route('/export/<entity_type>/excel', methods=['GET'])
+@login_required
+def export_to_excel(entity_type):
+    """Export entity data to Excel"""
+    try:
+        query = export_query(entity_type, get_schema())
+        if query is None:
             return jsonify({'error': 'Invalid entity type'}), 400
         
-        # Create DataFrame
-        df = pd.read_sql_query(query, conn)
+        # Rows are read in batches from a server-side cursor and written in
+        # constant-memory mode, so memory stays flat regardless of table size
+        return xlsx_response(
+            get_db(), query, None,
+            sheet_name=entity_type.capitalize(),
+            download_name=f'{entity_type}_{datetime.now().strftime("%Y%m%d_%H%M%S")}.xlsx'
+        )
         
-        # Remove geometry columns for Excel export
-        geometry_cols = [col for col in df.columns if 'geom' in col.lower()]
-        df = df.drop(columns=geometry_cols, errors='ignore')
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+# ============= EXPORT FORMATS =============
+# Main table of each export entity, for its geometry column
+EXPORT_TABLES = {
+    'mekan': 'strat_unit',
+    'birim': 'mekan_birin',
+    'walls': 'mekan_wall',
+    'graves': 'mekan_grave'
+}
+
+def format_export_query(entity_type, fmt, schema):
+    """export_query() plus the geometry as WKT (csv/parquet) or GeoJSON (geojsonseq)"""
+    query = export_query(entity_type, schema)
+    if query is None or fmt == 'excel':
+        return query
+    
+    table = schema.finds_table() if entity_type == 'finds' else EXPORT_TABLES[entity_type]
+    column = schema.geometry_column(table)
+    if column is None:
+        return query
+    if fmt == 'geojsonseq':
+        return f"SELECT q.*, ST_AsGeoJSON(q.{column}) AS {GEOJSON_COLUMN} FROM ({query}) q"
+    return f"SELECT q.*, ST_AsText(q.{column}) AS wkt FROM ({query}) q"
+
+def export_download_name(entity_type, fmt):
+    return f'{entity_type}_{datetime.now().strftime("%Y%m%d_%H%M%S")}{EXPORT_FORMATS[fmt]["suffix"]}'
+
+@api_arch_fixed.route('/export/<entity_type>/<fmt>', methods=['GET'])
+@login_required
+def export_entity(entity_type, fmt):
+    """Export entity data as CSV (streamed), Parquet or GeoJSONSeq"""
+    if fmt not in EXPORT_FORMATS:
+        return jsonify({'error': f"Invalid format, use one of: {', '.join(EXPORT_FORMATS)}"}), 400
+    
+    try:
+        query = format_export_query(entity_type, fmt, get_schema())
+        if query is None:
+            return jsonify({'error': 'Invalid entity type'}), 400
         
-        # Create Excel file in memory
-        output = io.BytesIO()
-        with pd.ExcelWriter(output, engine='xlsxwriter') as writer:
-            df.to_excel(writer, sheet_name=entity_type.capitalize(), index=False)
-            
-            # Auto-adjust column widths
-            worksheet = writer.sheets[entity_type.capitalize()]
-            for i, col in enumerate(df.columns):
-                max_len = max(df[col].astype(str).map(len).max(), len(col)) + 2
-                worksheet.set_column(i, i, min(max_len, 50))
+        return export_response(get_db(), query, None, fmt, export_download_name(entity_type, fmt))
         
-        output.seek(0)
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+@api_arch_fixed.route('/export/<entity_type>/<fmt>', methods=['POST'])
+@login_required
+def queue_export(entity_type, fmt):
+    """Queue an export in any format as a background job (poll /exports/<job_id>)"""
+    if fmt not in EXPORT_FORMATS:
+        return jsonify({'error': f"Invalid format, use one of: {', '.join(EXPORT_FORMATS)}"}), 400
+    
+    try:
+        query = format_export_query(entity_type, fmt, get_schema())
+        if query is None:
+            return jsonify({'error': 'Invalid entity type'}), 400
         
-        return send_file(
-            output,
-            mimetype='application/vnd.openxmlformats-officedocument.spreadsheetml.sheet',
-            as_attachment=True,
-            download_name=f'{entity_type}_{datetime.now().strftime("%Y%m%d_%H%M%S")}.xlsx'
+        spec = EXPORT_FORMATS[fmt]
+        writer = partial(write_xlsx, sheet_name=entity_type.capitalize()) if fmt == 'excel' else spec['writer']
+        job = get_export_jobs().submit(
+            get_db(), f'{entity_type}.{fmt}', query, None, writer,
+            spec['suffix'], spec['mimetype'], export_download_name(entity_type, fmt)
         )
+        return export_job_response(job), 202
         
     except Exception as e:
         return jsonify({'error': str(e)}), 500
-    finally:
-        cursor.close()
-        conn.close()
+
+# ============= EXPORT JOBS =============
+def export_job_response(job):
+    data = public_job(job)
+    data['status_url'] = url_for('api_arch_fixed.get_export_job', job_id=job['id'])
+    if job['status'] == 'done':
+        data['download_url'] = url_for('api_arch_fixed.download_export_job', job_id=job['id'])
+    return jsonify(data)
+
+@api_arch_fixed.route('/exports/<job_id>', methods=['GET'])
+@login_required
+def get_export_job(job_id):
+    """Status and progress (rows written) of an export job"""
+    job = get_export_jobs().get(job_id)
+    if job is None:
+        return jsonify({'error': 'Export job not found'}), 404
+    return export_job_response(job)
+
+@api_arch_fixed.route('/exports/<job_id>/download', methods=['GET'])
+@login_required
+def download_export_job(job_id):
+    """Download the file of a finished export job"""
+    jobs = get_export_jobs()
+    job = jobs.get(job_id)
+    if job is None:
+        return jsonify({'error': 'Export job not found'}), 404
+    if job['status'] != 'done':
+        return jsonify({'error': f"Export job is {job['status']}"}), 409
+    
+    path = jobs.artifact(job)
+    if path is None:
+        return jsonify({'error': 'Export has expired'}), 410
+    return send_file(path, mimetype=job['mimetype'], as_attachment=True, download_name=job['download_name'])
 
 # ============= EXPORT TO PDF =============
+# Most records in one batch PDF/ZIP request
+MAX_PDF_BATCH = 1000
+
+# Filters accepted by the batch PDF endpoint
+PDF_FILTERS = ('year', 'alan', 'mekan_no')
+
+def pdf_source(entity_type, schema):
+    """Record query, id column, filter columns and media links of a PDF entity type, or None if unknown"""
+    def columns(alias, table):
+        return ", ".join(record_columns(alias, table, schema, RECORD_EXCLUDED))
+    
+    if entity_type == 'mekan':
+        return {'query': f"SELECT {columns('s', 'strat_unit')} FROM strat_unit s", 'id': 's.mekan_no',
+                'year': 's.mekan_year', 'alan': 's.mekan_alan', 'mekan_no': 's.mekan_no',
+                'media': 'mekan'}
+    elif entity_type == 'birim':
+        return {'query': f"""
+                    SELECT {columns('b', 'mekan_birin')}, s.mekan_no, s.mekan_year
+                    FROM mekan_birin b
+                    LEFT JOIN strat_unit s ON b.su_uuid = s.su_uuid
+                """, 'id': 'b.birin_no',
+                'year': 's.mekan_year', 'alan': 's.mekan_alan', 'mekan_no': 's.mekan_no', 'media': 'birim'}
+    elif entity_type == 'wall':
+        return {'query': f"SELECT {columns('w', 'mekan_wall')} FROM mekan_wall w", 'id': 'w.wall_no',
+                'year': 'w.wall_year', 'alan': 'w.wall_alan', 'mekan_no': None, 'media': 'wall'}
+    elif entity_type == 'grave':
+        return {'query': f"""
+                    SELECT {columns('g', 'mekan_grave')}, s.mekan_no
+                    FROM mekan_grave g
+                    LEFT JOIN strat_unit s ON g.su_uuid = s.su_uuid
+                """, 'id': 'g.grave_no',
+                'year': 'g.grave_year', 'alan': 'g.grave_alan', 'mekan_no': 's.mekan_no', 'media': 'grave'}
+    elif entity_type == 'find':
+        if schema.has_table('mekan_buluntu'):
+            return {'query': f"""
+                        SELECT {columns('b', 'mekan_buluntu')}, s.mekan_no
+                        FROM mekan_buluntu b
+                        LEFT JOIN strat_unit s ON b.su_uuid = s.su_uuid
+                    """, 'id': 'b.bul_no',
+                    'year': 's.mekan_year', 'alan': 's.mekan_alan', 'mekan_no': 's.mekan_no', 'media': 'buluntu'}
+        return {'query': f"""
+                    SELECT {columns('f', 'finds')}, s.mekan_no
+                    FROM finds f
+                    LEFT JOIN strat_unit s ON f.su_uuid = s.su_uuid
+                """, 'id': 'f.find_number',
+                'year': 's.mekan_year', 'alan': 's.mekan_alan', 'mekan_no': 's.mekan_no', 'media': 'find'}
+    return None
+
+def fetch_pdf_records(cursor, source, ids=None, filters=None, limit=MAX_PDF_BATCH):
+    """The matching records, fetched in one query and ordered by id"""
+    query = f"{source['query']} WHERE TRUE"
+    params = []
+    if ids is not None:
+        query += f" AND {source['id']}::text = ANY(%s)"
+        params.append([str(i) for i in ids])
+    for name, value in (filters or {}).items():
+        query += f" AND {source[name]} = %s"
+        params.append(value)
+    query += f" ORDER BY {source['id']} LIMIT %s"
+    params.append(limit)
+    
+    cursor.execute(query, params)
+    return cursor.fetchall()
+
+def pdf_items(cursor, entity_type, source, records):
+    """
+    (entity_type, entity_id, fields, images) render items for fetched records.
+    The media of all records are read with one query and the thumbnails of
+    the whole batch are built in one parallel pass (cache hits are not fetched)
+    """
+    images = [
+        [media for media in media_files if is_image(media) and media['public_url']][:MAX_SHEET_THUMBNAILS]
+        for media_files in records_media(cursor, entity_type, source['media'], records)
+    ]
+    paths = get_thumbnails().get_many([media['public_url'] for record_images in images for media in record_images])
+    
+    id_column = source['id'].split('.')[-1]
+    items = []
+    offset = 0
+    for record, record_images in zip(records, images):
+        record_paths = paths[offset:offset + len(record_images)]
+        offset += len(record_images)
+        items.append((entity_type, record[id_column], prepare_record(record, RECORD_EXCLUDED), [
+            (path, media['display_name']) for media, path in zip(record_images, record_paths) if path
+        ]))
+    return items
+
 @api_arch_fixed.route('/export/<entity_type>/<entity_id>/pdf', methods=['GET'])
 @login_required
 def export_to_pdf(entity_type, entity_id):
     """Export single entity record to PDF"""
-    conn = get_db()
-    cursor = conn.cursor(cursor_factory=RealDictCursor)
+    cursor = get_db().cursor(cursor_factory=RealDictCursor)
     
     try:
-        # Get entity data
-        if entity_type == 'mekan':
-            cursor.execute("SELECT * FROM strat_unit WHERE mekan_no = %s", (entity_id,))
-        elif entity_type == 'birim':
-            cursor.execute("""
-                SELECT b.*, s.mekan_no, s.mekan_year
-                FROM mekan_birin b
-                LEFT JOIN strat_unit s ON b.su_uuid = s.su_uuid
-                WHERE b.birin_no::text = %s
-            """, (entity_id,))
-        elif entity_type == 'wall':
-            cursor.execute("SELECT * FROM mekan_wall WHERE wall_no = %s", (entity_id,))
-        elif entity_type == 'grave':
-            cursor.execute("""
-                SELECT g.*, s.mekan_no
-                FROM mekan_grave g
-                LEFT JOIN strat_unit s ON g.su_uuid = s.su_uuid
-                WHERE g.grave_no::text = %s
-            """, (entity_id,))
-        elif entity_type == 'find':
-            cursor.execute("""
-                SELECT EXISTS (
-                    SELECT FROM information_schema.tables 
-                    WHERE table_name = 'mekan_buluntu'
-                )
-            """)
-            if cursor.fetchone()['exists']:
-                cursor.execute("""
-                    SELECT b.*, s.mekan_no
-                    FROM mekan_buluntu b
-                    LEFT JOIN strat_unit s ON b.su_uuid = s.su_uuid
-                    WHERE b.buluntu_no::text = %s
-                """, (entity_id,))
-            else:
-                cursor.execute("""
-                    SELECT f.*, s.mekan_no
-                    FROM finds f
-                    LEFT JOIN strat_unit s ON f.su_uuid = s.su_uuid
-                    WHERE f.find_number::text = %s
-                """, (entity_id,))
-        else:
+        source = pdf_source(entity_type, get_schema())
+        if source is None:
             return jsonify({'error': 'Invalid entity type'}), 400
         
-        record = cursor.fetchone()
-        if not record:
+        records = fetch_pdf_records(cursor, source, ids=[entity_id], limit=1)
+        if not records:
             return jsonify({'error': 'Record not found'}), 404
         
-        # Create PDF
-        buffer = io.BytesIO()
-        doc = SimpleDocTemplate(buffer, pagesize=A4)
-        story = []
-        styles = getSampleStyleSheet()
-        
-        # Title
-        title = Paragraph(f"{entity_type.upper()} - {entity_id}", styles['Title'])
-        story.append(title)
-        story.append(Spacer(1, 0.2*inch))
-        
-        # Create data table
-        data = []
-        for key, value in record.items():
-            if key not in ['geometry', 'geom'] and value is not None:
-                # Format field names
-                field_name = key.replace('_', ' ').title()
-                data.append([field_name, str(value)])
-        
-        if data:
-            table = Table(data, colWidths=[2.5*inch, 4*inch])
-            table.setStyle(TableStyle([
-                ('BACKGROUND', (0, 0), (0, -1), colors.lightgrey),
-                ('TEXTCOLOR', (0, 0), (-1, -1), colors.black),
-                ('ALIGN', (0, 0), (-1, -1), 'LEFT'),
-                ('FONTNAME', (0, 0), (0, -1), 'Helvetica-Bold'),
-                ('FONTSIZE', (0, 0), (-1, -1), 10),
-                ('GRID', (0, 0), (-1, -1), 1, colors.black),
-                ('VALIGN', (0, 0), (-1, -1), 'TOP'),
-            ]))
-            story.append(table)
-        
-        # Add timestamp
-        story.append(Spacer(1, 0.5*inch))
-        timestamp = Paragraph(
-            f"Generated: {datetime.now().strftime('%Y-%m-%d %H:%M:%S')}", 
-            styles['Normal']
-        )
-        story.append(timestamp)
-        
-        # Build PDF
-        doc.build(story)
-        buffer.seek(0)
+        # Thumbnails come from the disk cache; only misses are fetched from storage
+        item = pdf_items(cursor, entity_type, source, records)[0]
         
+        # A single sheet renders in-process; batches go through the process pool
         return send_file(
-            buffer,
+            io.BytesIO(render_record(item)),
             mimetype='application/pdf',
             as_attachment=True,
             download_name=f'{entity_type}_{entity_id}_{datetime.now().strftime("%Y%m%d_%H%M%S")}.pdf'
@@ -878,7 +1251,178 @@ def export_to_pdf(entity_type, entity_id):
         return jsonify({'error': str(e)}), 500
     finally:
         cursor.close()
-        conn.close()
+
+@api_arch_fixed.route('/export/<entity_type>/pdf', methods=['POST'])
+@login_required
+def export_batch_pdf(entity_type):
+    """
+    Export many records as one PDF with a table of contents, or as a ZIP of
+    per-record PDFs.
+    
+    Body: {"ids": [...]} or {"filters": {"year": .., "alan": .., "mekan_no": ..}},
+    plus "output": "pdf" (default) or "zip".
+    """
+    data = request.get_json(silent=True) or {}
+    ids = data.get('ids')
+    filters = data.get('filters') or {}
+    output = data.get('output', 'pdf')
+    
+    if output not in ('pdf', 'zip'):
+        return jsonify({'error': 'output must be "pdf" or "zip"'}), 400
+    if ids is not None and (not isinstance(ids, list) or not ids):
+        return jsonify({'error': 'ids must be a non-empty list'}), 400
+    if ids is not None and len(ids) > MAX_PDF_BATCH:
+        return jsonify({'error': f'At most {MAX_PDF_BATCH} ids per request'}), 400
+    if not isinstance(filters, dict) or any(name not in PDF_FILTERS for name in filters):
+        return jsonify({'error': f"filters may only contain: {', '.join(PDF_FILTERS)}"}), 400
+    if ids is None and not filters:
+        return jsonify({'error': 'Provide ids or filters'}), 400
+    
+    cursor = get_db().cursor(cursor_factory=RealDictCursor)
+    try:
+        source = pdf_source(entity_type, get_schema())
+        if source is None:
+            return jsonify({'error': 'Invalid entity type'}), 400
+        unsupported = [name for name in filters if source[name] is None]
+        if unsupported:
+            return jsonify({'error': f"Filter not available for {entity_type}: {', '.join(unsupported)}"}), 400
+        
+        # One row over the cap tells a full batch from a truncated one
+        records = fetch_pdf_records(cursor, source, ids=ids, filters=filters, limit=MAX_PDF_BATCH + 1)
+        if not records:
+            return jsonify({'error': 'No records found'}), 404
+        if len(records) > MAX_PDF_BATCH:
+            return jsonify({
+                'error': f'More than {MAX_PDF_BATCH} records match; narrow the filters or split the request'
+            }), 413
+        items = pdf_items(cursor, entity_type, source, records)
+        
+        stamp = datetime.now().strftime("%Y%m%d_%H%M%S")
+        current_app.logger.info("Batch PDF %s: %d records as %s", entity_type, len(items), output)
+        if output == 'zip':
+            return Response(zip_chunks(items), mimetype='application/zip', headers={
+                'Content-Disposition': f'attachment; filename="{entity_type}_{stamp}.zip"'
+            })
+        
+        path = temp_export_path('.pdf')
+        try:
+            write_combined_pdf(path, f"{entity_type.upper()} - {len(items)} records", items)
+        except Exception:
+            os.remove(path)
+            raise
+        return stream_file(path, 'application/pdf', f'{entity_type}_{stamp}.pdf')
+        
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+    finally:
+        cursor.close()
+
+# ============= SPATIAL =============
+@api_arch_fixed.route('/spatial', methods=['GET'])
+@login_required
+def get_spatial():
+    """
+    GeoJSON features inside ?bbox=west,south,east,north (EPSG:4326) for
+    ?zoom=, optionally only ?layers=birim,walls; at most ?limit= per layer
+    """
+    try:
+        bbox = parse_bbox(request.args.get('bbox'))
+        zoom = parse_zoom(request.args.get('zoom'))
+        layers = parse_layers(request.args.get('layers'))
+        limit = min(request.args.get('limit', DEFAULT_LAYER_LIMIT, type=int), MAX_LAYER_LIMIT)
+    except SpatialQueryError as e:
+        return jsonify({'error': str(e)}), 400
+    
+    cursor = get_db().cursor()
+    try:
+        body = feature_collection(cursor, get_schema(), bbox, zoom, layers, max(limit, 1))
+        return current_app.response_class(body, mimetype='application/geo+json')
+        
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+    finally:
+        cursor.close()
+
+# ============= VECTOR TILES =============
+@api_arch_fixed.route('/tiles/<layer>/<int:z>/<int:x>/<int:y>.pbf', methods=['GET'])
+@login_required
+def get_tile(layer, z, x, y):
+    """Mapbox Vector Tile of a map layer; ?fields=label,type limits the attributes"""
+    if not valid_tile(z, x, y):
+        return jsonify({'error': 'Invalid tile coordinates'}), 400
+    
+    try:
+        schema = get_schema()
+        source = layer_source(layer, schema)
+        if source is None:
+            return jsonify({'error': f"Invalid layer, use one of: {', '.join(TILE_LAYERS)}"}), 400
+        
+        table, column, attributes = source
+        fields = request.args.get('fields')
+        if fields:
+            names = [name.strip() for name in fields.split(',') if name.strip()]
+            unknown = [name for name in names if name not in attributes]
+            if unknown:
+                return jsonify({'error': f"Unknown fields: {', '.join(unknown)}"}), 400
+            attributes = {name: attributes[name] for name in names}
+        
+        tile, cached = get_tile_cache().get(get_db(), schema, layer, (table, column, attributes), z, x, y)
+        if not tile:
+            return '', 204
+        
+        response = Response(tile, mimetype=MVT_MIMETYPE)
+        response.headers['X-Tile-Cache'] = 'hit' if cached else 'miss'
+        response.headers['Cache-Control'] = 'private, max-age=60'
+        return response
+        
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+# ============= GLOBAL SEARCH =============
+@api_arch_fixed.route('/search', methods=['GET'])
+@login_required
+def global_search():
+    """Ranked typeahead search over MEKAN, birim, walls, graves, finds and media"""
+    term = request.args.get('q', '').strip()
+    limit = min(request.args.get('limit', 20, type=int), 100)
+    types = [t for t in request.args.get('types', '').split(',') if t]
+    
+    invalid = [t for t in types if t not in DOCUMENT_TYPES]
+    if invalid:
+        return jsonify({'error': f"Invalid types: {', '.join(invalid)}"}), 400
+    if len(term) < 2:
+        return jsonify({'query': term, 'results': []})
+    
+    conn = get_db()
+    cursor = conn.cursor(cursor_factory=RealDictCursor)
+    
+    try:
+        results = find_documents(cursor, term, types, limit)
+        return jsonify({'query': term, 'results': results})
+        
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+    finally:
+        cursor.close()
+
+# ============= SCHEMA REGISTRY =============
+@api_arch_fixed.route('/schema', methods=['GET'])
+@login_required
+def get_schema_registry():
+    """Show the cached table/column registry used by the handlers"""
+    return jsonify(get_schema().snapshot())
+
+@api_arch_fixed.route('/schema/refresh', methods=['POST'])
+@login_required
+def refresh_schema_registry():
+    """Reload the schema registry (admin only), e.g. after a migration"""
+    if not current_user.permissions.get('can_manage_users'):
+        return jsonify({'error': 'Permission denied'}), 403
+    
+    try:
+        return jsonify(refresh_schema().snapshot())
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
 
 # ============= TEST ENDPOINT =============
 @api_arch_fixed.route('/test', methods=['GET'])
@@ -918,75 +1462,33 @@ def test_data():
         return jsonify({'error': str(e), 'traceback': str(e.__traceback__)}), 500
     finally:
         cursor.close()
-        conn.close()
 
 # ============= STATISTICS =============
 @api_arch_fixed.route('/statistics', methods=['GET'])
 @login_required
 def get_statistics():
-    """Get accurate statistics"""
-    conn = get_db()
-    cursor = conn.cursor(cursor_factory=RealDictCursor)
-    
+    """Get accurate statistics (cached for STATISTICS_TTL seconds, with ETag)"""
     try:
-        stats = {}
-        
-        # Count MEKAN units
-        cursor.execute("SELECT COUNT(*) as count FROM strat_unit")
-        stats['total_mekan'] = cursor.fetchone()['count']
-        
-        # Count Birim
-        cursor.execute("SELECT COUNT(*) as count FROM mekan_birin")
-        stats['total_birim'] = cursor.fetchone()['count']
-        
-        # Count Walls
-        cursor.execute("SELECT COUNT(*) as count FROM mekan_wall")
-        stats['total_walls'] = cursor.fetchone()['count']
-        
-        # Count Graves
-        cursor.execute("SELECT COUNT(*) as count FROM mekan_grave")
-        stats['total_graves'] = cursor.fetchone()['count']
-        
-        # Count Finds
-        cursor.execute("""
-            SELECT EXISTS (
-                SELECT FROM information_schema.tables 
-                WHERE table_name = 'mekan_buluntu'
-            )
-        """)
-        if cursor.fetchone()['exists']:
-            cursor.execute("SELECT COUNT(*) as count FROM mekan_buluntu")
-        else:
-            cursor.execute("SELECT COUNT(*) as count FROM finds")
-        stats['total_finds'] = cursor.fetchone()['count']
-        
-        # Media count
-        cursor.execute("SELECT COUNT(*) as count FROM media")
-        stats['total_media'] = cursor.fetchone()['count']
-        
-        # Years
-        cursor.execute("""
-            SELECT DISTINCT mekan_year as year
-            FROM strat_unit
-            WHERE mekan_year IS NOT NULL
-            ORDER BY mekan_year DESC
-        """)
-        stats['excavation_years'] = [row['year'] for row in cursor.fetchall()]
-        
-        # Birim by type
-        cursor.execute("""
-            SELECT birin_type, COUNT(*) as count
-            FROM mekan_birin
-            WHERE birin_type IS NOT NULL
-            GROUP BY birin_type
-            ORDER BY count DESC
-        """)
-        stats['birim_by_type'] = cursor.fetchall()
-        
-        return jsonify(stats)
+        return statistics_response(lambda stats: {
+            'total_mekan': stats['total_strat_units'],
+            'total_birim': stats['total_birim'],
+            'total_walls': stats['total_walls'],
+            'total_graves': stats['total_graves'],
+            'total_finds': stats['total_finds'],
+            'total_media': stats['total_media'],
+            'excavation_years': stats['excavation_years'],
+            'birim_by_type': stats['birim_by_type']
+        })
         
     except Exception as e:
         return jsonify({'error': str(e)}), 500
-    finally:
-        cursor.close()
-        conn.close()
\ No newline at end of file
+
+@api_arch_fixed.route('/statistics/refresh', methods=['POST'])
+@login_required
+def refresh_statistics():
+    """Drop the cached statistics (admin only), e.g. after an import"""
+    if not current_user.permissions.get('can_manage_users'):
+        return jsonify({'error': 'Permission denied'}), 403
+    
+    invalidate_statistics()
+    return get_statistics()
@@ -3,15 +3,19 @@ API Routes for Archaeological Data Management
 Provides RESTful endpoints for querying and managing archaeological data
 """
 
-from flask import Blueprint, jsonify, request, send_file, current_app
+from flask import Blueprint, jsonify, request, send_file, current_app, url_for
 from flask_login import login_required, current_user
-import psycopg2
 from psycopg2.extras import RealDictCursor, Json
-import pandas as pd
+from database import get_db
+from schema_registry import get_schema, geometry_4326
+from pagination import KeysetOrder, Key, fetch_page, PaginationError
+from exporter import xlsx_response, write_xlsx, XLSX_MIMETYPE
+from export_jobs import get_export_jobs, public_job
+from functools import partial
 import json
+from json_response import raw_json
 from datetime import datetime
 import io
-import xlsxwriter
 from reportlab.lib import colors
 from reportlab.lib.pagesizes import letter, A4
 from reportlab.platypus import SimpleDocTemplate, Table, TableStyle, Paragraph, Spacer, PageBreak
@@ -20,15 +24,11 @@ from reportlab.lib.units import inch
 
 api_bp = Blueprint('api', __name__, url_prefix='/api')
 
-def get_db():
-    """Get database connection"""
-    return psycopg2.connect(
-        host=current_app.config.get('DB_HOST', 'localhost'),
-        port=current_app.config.get('DB_PORT', 5433),
-        database=current_app.config.get('DB_NAME', 'hybrid_strat'),
-        user=current_app.config.get('DB_USER', 'postgres'),
-        password=current_app.config.get('DB_PASSWORD', 'postgres')
-    )
+US_ORDER = KeysetOrder(
+    Key('year', 'year', descending=True),
+    Key('us', 'us_number', descending=True),
+    Key('id', 'id')
+)
 
 @api_bp.route('/stratigraphic_units', methods=['GET'])
 @login_required
@@ -42,6 +42,8 @@ def get_stratigraphic_units():
     search = request.args.get('search')
     page = request.args.get('page', 1, type=int)
     per_page = request.args.get('per_page', 50, type=int)
+    cursor_token = request.args.get('cursor')
+    count_strategy = request.args.get('count', 'auto')
     
     conn = get_db()
     cursor = conn.cursor(cursor_factory=RealDictCursor)
@@ -89,34 +91,29 @@ def get_stratigraphic_units():
             query += " AND (us::text LIKE %s OR interpretation ILIKE %s OR definition ILIKE %s)"
             params.extend([f'%{search}%', f'%{search}%', f'%{search}%'])
             
-        # Get total count
-        count_query = f"SELECT COUNT(*) FROM ({query}) as t"
-        cursor.execute(count_query, params)
-        total = cursor.fetchone()['count']
-        
-        # Add pagination
-        query += " ORDER BY year DESC, us DESC LIMIT %s OFFSET %s"
-        params.extend([per_page, (page - 1) * per_page])
-        
-        cursor.execute(query, params)
-        units = cursor.fetchall()
+        # Paginate: page/offset, or keyset when ?cursor= is given
+        units, page_info = fetch_page(cursor, query, params, US_ORDER, page, per_page, cursor_token, count_strategy)
         
         # Convert geometry from string to dict
         for unit in units:
             if unit['geometry']:
-                unit['geometry'] = json.loads(unit['geometry'])
+                unit['geometry'] = raw_json(unit['geometry'])
         
         return jsonify({
             'data': units,
-            'total': total,
-            'page': page,
-            'per_page': per_page,
-            'total_pages': (total + per_page - 1) // per_page
+            **page_info
         })
         
+    except PaginationError as e:
+        return jsonify({'error': str(e)}), 400
     finally:
         cursor.close()
-        conn.close()
+
+MEKAN_ORDER = KeysetOrder(
+    Key('year', 'year', descending=True),
+    Key('mekan_no', 'mekan_no', descending=True),
+    Key('id', 'id')
+)
 
 @api_bp.route('/mekan_units', methods=['GET'])
 @login_required
@@ -128,6 +125,8 @@ def get_mekan_units():
     search = request.args.get('search')
     page = request.args.get('page', 1, type=int)
     per_page = request.args.get('per_page', 50, type=int)
+    cursor_token = request.args.get('cursor')
+    count_strategy = request.args.get('count', 'auto')
     
     conn = get_db()
     cursor = conn.cursor(cursor_factory=RealDictCursor)
@@ -166,34 +165,29 @@ def get_mekan_units():
             query += " AND (mekan_no::text LIKE %s OR can_no::text LIKE %s OR description ILIKE %s)"
             params.extend([f'%{search}%', f'%{search}%', f'%{search}%'])
             
-        # Get total count
-        count_query = f"SELECT COUNT(*) FROM ({query}) as t"
-        cursor.execute(count_query, params)
-        total = cursor.fetchone()['count']
-        
-        # Add pagination
-        query += " ORDER BY year DESC, mekan_no DESC LIMIT %s OFFSET %s"
-        params.extend([per_page, (page - 1) * per_page])
-        
-        cursor.execute(query, params)
-        units = cursor.fetchall()
+        # Paginate: page/offset, or keyset when ?cursor= is given
+        units, page_info = fetch_page(cursor, query, params, MEKAN_ORDER, page, per_page, cursor_token, count_strategy)
         
         # Convert geometry
         for unit in units:
             if unit['geometry']:
-                unit['geometry'] = json.loads(unit['geometry'])
+                unit['geometry'] = raw_json(unit['geometry'])
         
         return jsonify({
             'data': units,
-            'total': total,
-            'page': page,
-            'per_page': per_page,
-            'total_pages': (total + per_page - 1) // per_page
+            **page_info
         })
         
+    except PaginationError as e:
+        return jsonify({'error': str(e)}), 400
     finally:
         cursor.close()
-        conn.close()
+
+FIND_ORDER = KeysetOrder(
+    Key('year', 'year', descending=True),
+    Key('find_number', 'find_number', descending=True),
+    Key('find_id', 'find_id')
+)
 
 @api_bp.route('/finds', methods=['GET'])
 @login_required
@@ -206,6 +200,8 @@ def get_finds():
     search = request.args.get('search')
     page = request.args.get('page', 1, type=int)
     per_page = request.args.get('per_page', 50, type=int)
+    cursor_token = request.args.get('cursor')
+    count_strategy = request.args.get('count', 'auto')
     
     conn = get_db()
     cursor = conn.cursor(cursor_factory=RealDictCursor)
@@ -254,34 +250,23 @@ def get_finds():
             query += " AND (find_number::text LIKE %s OR description ILIKE %s OR material ILIKE %s)"
             params.extend([f'%{search}%', f'%{search}%', f'%{search}%'])
             
-        # Get total count
-        count_query = f"SELECT COUNT(*) FROM ({query}) as t"
-        cursor.execute(count_query, params)
-        total = cursor.fetchone()['count']
-        
-        # Add pagination
-        query += " ORDER BY year DESC, find_number DESC LIMIT %s OFFSET %s"
-        params.extend([per_page, (page - 1) * per_page])
-        
-        cursor.execute(query, params)
-        finds = cursor.fetchall()
+        # Paginate: page/offset, or keyset when ?cursor= is given
+        finds, page_info = fetch_page(cursor, query, params, FIND_ORDER, page, per_page, cursor_token, count_strategy)
         
         # Convert geometry
         for find in finds:
             if find['geometry']:
-                find['geometry'] = json.loads(find['geometry'])
+                find['geometry'] = raw_json(find['geometry'])
         
         return jsonify({
             'data': finds,
-            'total': total,
-            'page': page,
-            'per_page': per_page,
-            'total_pages': (total + per_page - 1) // per_page
+            **page_info
         })
         
+    except PaginationError as e:
+        return jsonify({'error': str(e)}), 400
     finally:
         cursor.close()
-        conn.close()
 
 @api_bp.route('/relationships', methods=['GET'])
 @login_required
@@ -341,7 +326,6 @@ def get_relationships():
         
     finally:
         cursor.close()
-        conn.close()
 
 @api_bp.route('/statistics', methods=['GET'])
 @login_required
@@ -407,7 +391,44 @@ def get_statistics():
         
     finally:
         cursor.close()
-        conn.close()
+
+# Header style of the Excel exports
+EXCEL_HEADER_FORMAT = {
+    'bold': True,
+    'bg_color': '#366092',
+    'font_color': 'white',
+    'border': 1
+}
+
+def export_filter_query(data_type, filters):
+    """(query, params) for a filtered export of the given data type, or None"""
+    if data_type == 'us':
+        query = """
+            SELECT * FROM stratigraphic_units
+            WHERE 1=1
+        """
+        filter_columns = ['site', 'year', 'area']
+    elif data_type == 'mekan':
+        query = """
+            SELECT * FROM mekan_data
+            WHERE 1=1
+        """
+        filter_columns = ['site', 'year']
+    elif data_type == 'finds':
+        query = """
+            SELECT * FROM finds_catalog
+            WHERE 1=1
+        """
+        filter_columns = ['site', 'year', 'category']
+    else:
+        return None
+    
+    params = []
+    for column in filter_columns:
+        if filters.get(column):
+            query += f" AND {column} = %s"
+            params.append(filters[column])
+    return query, params
 
 @api_bp.route('/export/excel', methods=['POST'])
 @login_required
@@ -419,105 +440,73 @@ def export_excel():
     data_type = request.json.get('type', 'us')
     filters = request.json.get('filters', {})
     
-    conn = get_db()
+    export = export_filter_query(data_type, filters)
+    if export is None:
+        return jsonify({'error': 'Invalid data type'}), 400
+    query, params = export
     
-    try:
-        # Get data based on type
-        if data_type == 'us':
-            query = """
-                SELECT * FROM stratigraphic_units
-                WHERE 1=1
-            """
-            params = []
-            if filters.get('site'):
-                query += " AND site = %s"
-                params.append(filters['site'])
-            if filters.get('year'):
-                query += " AND year = %s"
-                params.append(filters['year'])
-            if filters.get('area'):
-                query += " AND area = %s"
-                params.append(filters['area'])
-                
-            df = pd.read_sql_query(query, conn, params=params)
-            
-        elif data_type == 'mekan':
-            query = """
-                SELECT * FROM mekan_data
-                WHERE 1=1
-            """
-            params = []
-            if filters.get('site'):
-                query += " AND site = %s"
-                params.append(filters['site'])
-            if filters.get('year'):
-                query += " AND year = %s"
-                params.append(filters['year'])
-                
-            df = pd.read_sql_query(query, conn, params=params)
-            
-        elif data_type == 'finds':
-            query = """
-                SELECT * FROM finds_catalog
-                WHERE 1=1
-            """
-            params = []
-            if filters.get('site'):
-                query += " AND site = %s"
-                params.append(filters['site'])
-            if filters.get('year'):
-                query += " AND year = %s"
-                params.append(filters['year'])
-            if filters.get('category'):
-                query += " AND category = %s"
-                params.append(filters['category'])
-                
-            df = pd.read_sql_query(query, conn, params=params)
-        else:
-            return jsonify({'error': 'Invalid data type'}), 400
-            
-        # Remove geometry column if present
-        if 'geom' in df.columns:
-            df = df.drop('geom', axis=1)
-            
-        # Create Excel file
-        output = io.BytesIO()
-        with pd.ExcelWriter(output, engine='xlsxwriter') as writer:
-            df.to_excel(writer, sheet_name='Data', index=False)
-            
-            # Get workbook and worksheet
-            workbook = writer.book
-            worksheet = writer.sheets['Data']
-            
-            # Add formatting
-            header_format = workbook.add_format({
-                'bold': True,
-                'bg_color': '#366092',
-                'font_color': 'white',
-                'border': 1
-            })
-            
-            # Write headers with formatting
-            for col_num, value in enumerate(df.columns.values):
-                worksheet.write(0, col_num, value, header_format)
-                
-            # Adjust column widths
-            for i, col in enumerate(df.columns):
-                column_len = df[col].astype(str).map(len).max()
-                column_len = max(column_len, len(col))
-                worksheet.set_column(i, i, min(column_len + 2, 50))
-        
-        output.seek(0)
-        
-        return send_file(
-            output,
-            mimetype='application/vnd.openxmlformats-officedocument.spreadsheetml.sheet',
-            as_attachment=True,
-            download_name=f'{data_type}_export_{datetime.now().strftime("%Y%m%d_%H%M%S")}.xlsx'
-        )
+    # Streamed from a server-side cursor into a constant-memory workbook on disk
+    return xlsx_response(
+        get_db(), query, params,
+        sheet_name='Data',
+        download_name=f'{data_type}_export_{datetime.now().strftime("%Y%m%d_%H%M%S")}.xlsx',
+        header_format=EXCEL_HEADER_FORMAT
+    )
+
+@api_bp.route('/export/excel/jobs', methods=['POST'])
+@login_required
+def queue_export_excel():
+    """Queue an Excel export as a background job (poll /export/jobs/<job_id>)"""
+    if not current_user.permissions.get('can_export'):
+        return jsonify({'error': 'Permission denied'}), 403
         
-    finally:
-        conn.close()
+    data_type = request.json.get('type', 'us')
+    filters = request.json.get('filters', {})
+    
+    export = export_filter_query(data_type, filters)
+    if export is None:
+        return jsonify({'error': 'Invalid data type'}), 400
+    query, params = export
+    
+    job = get_export_jobs().submit(
+        get_db(), f'{data_type}.excel', query, params,
+        partial(write_xlsx, sheet_name='Data', header_format=EXCEL_HEADER_FORMAT),
+        '.xlsx', XLSX_MIMETYPE,
+        f'{data_type}_export_{datetime.now().strftime("%Y%m%d_%H%M%S")}.xlsx'
+    )
+    return export_job_response(job), 202
+
+def export_job_response(job):
+    data = public_job(job)
+    data['status_url'] = url_for('api.get_export_job', job_id=job['id'])
+    if job['status'] == 'done':
+        data['download_url'] = url_for('api.download_export_job', job_id=job['id'])
+    return jsonify(data)
+
+@api_bp.route('/export/jobs/<job_id>', methods=['GET'])
+@login_required
+def get_export_job(job_id):
+    """Status and progress (rows written) of an export job"""
+    job = get_export_jobs().get(job_id)
+    if job is None:
+        return jsonify({'error': 'Export job not found'}), 404
+    return export_job_response(job)
+
+@api_bp.route('/export/jobs/<job_id>/download', methods=['GET'])
+@login_required
+def download_export_job(job_id):
+    """Download the file of a finished export job"""
+    jobs = get_export_jobs()
+    job = jobs.get(job_id)
+    if job is None:
+        return jsonify({'error': 'Export job not found'}), 404
+    if job['status'] != 'done':
+        return jsonify({'error': f"Export job is {job['status']}"}), 409
+    
+    path = jobs.artifact(job)
+    if path is None:
+        return jsonify({'error': 'Export has expired'}), 410
+    return send_file(path, mimetype=job['mimetype'], as_attachment=True, download_name=job['download_name'])
 
 @api_bp.route('/export/pdf', methods=['POST'])
 @login_required
@@ -617,7 +606,6 @@ def export_pdf():
         
     finally:
         cursor.close()
-        conn.close()
 
 @api_bp.route('/spatial/features', methods=['GET'])
 @login_required
@@ -631,22 +619,22 @@ def get_spatial_features():
     
     try:
         features = []
+        schema = get_schema()
         
         # Parse bounds if provided
-        where_clause = ""
         params = []
         if bounds:
             try:
                 b = json.loads(bounds)
-                where_clause = """
-                    AND ST_Intersects(
-                        geom,
-                        ST_MakeEnvelope(%s, %s, %s, %s, 3997)
-                    )
-                """
-                params = [b['west'], b['south'], b['east'], b['north']]
-            except:
-                pass
+                params = [float(b['west']), float(b['south']), float(b['east']), float(b['north'])]
+            except (ValueError, KeyError, TypeError):
+                return jsonify({'error': 'bounds must be JSON with numeric west, south, east and north'}), 400
+
+        def in_bounds(table):
+            # Bounds come from the map in WGS84: geom_4326 after migration 006, ST_Transform() before
+            if not params:
+                return ""
+            return f"AND {geometry_4326(table, table, schema)} && ST_MakeEnvelope(%s, %s, %s, %s, 4326)"
         
         # Get US features
         if data_type in ['all', 'us']:
@@ -660,9 +648,9 @@ def get_spatial_features():
                     year,
                     interpretation,
                     period,
-                    ST_AsGeoJSON(ST_Transform(geom, 4326)) as geometry
+                    ST_AsGeoJSON({geometry_4326('strat_unit', 'strat_unit', schema)}) as geometry
                 FROM strat_unit
-                WHERE geom IS NOT NULL {where_clause}
+                WHERE geom IS NOT NULL {in_bounds('strat_unit')}
             """
             cursor.execute(query, params)
             for row in cursor.fetchall():
@@ -678,7 +666,7 @@ def get_spatial_features():
                         'interpretation': row['interpretation'],
                         'period': row['period']
                     },
-                    'geometry': json.loads(row['geometry']) if row['geometry'] else None
+                    'geometry': raw_json(row['geometry'])
                 })
         
         # Get MEKAN features
@@ -694,9 +682,9 @@ def get_spatial_features():
                     year,
                     description,
                     period,
-                    ST_AsGeoJSON(ST_Transform(geom, 4326)) as geometry
+                    ST_AsGeoJSON({geometry_4326('mekan_birin', 'mekan_birin', schema)}) as geometry
                 FROM mekan_birin
-                WHERE geom IS NOT NULL {where_clause}
+                WHERE geom IS NOT NULL {in_bounds('mekan_birin')}
             """
             cursor.execute(query, params)
             for row in cursor.fetchall():
@@ -715,7 +703,7 @@ def get_spatial_features():
                         'description': row['description'],
                         'period': row['period']
                     },
-                    'geometry': json.loads(row['geometry']) if row['geometry'] else None
+                    'geometry': raw_json(row['geometry'])
                 })
         
         # Get finds features
@@ -731,9 +719,9 @@ def get_spatial_features():
                     category,
                     material,
                     description,
-                    ST_AsGeoJSON(ST_Transform(geom, 4326)) as geometry
+                    ST_AsGeoJSON({geometry_4326('finds', 'finds', schema)}) as geometry
                 FROM finds
-                WHERE geom IS NOT NULL {where_clause}
+                WHERE geom IS NOT NULL {in_bounds('finds')}
             """
             cursor.execute(query, params)
             for row in cursor.fetchall():
@@ -750,7 +738,7 @@ def get_spatial_features():
                         'material': row['material'],
                         'description': row['description']
                     },
-                    'geometry': json.loads(row['geometry']) if row['geometry'] else None
+                    'geometry': raw_json(row['geometry'])
                 })
         
         return jsonify({
@@ -760,7 +748,6 @@ def get_spatial_features():
         
     finally:
         cursor.close()
-        conn.close()
 
 @api_bp.route('/search/global', methods=['GET'])
 @login_required
@@ -836,5 +823,4 @@ def global_search():
         return jsonify({'results': results})
         
     finally:
-        cursor.close()
-        conn.close()
\ No newline at end of file
+        cursor.close()
\ No newline at end of file
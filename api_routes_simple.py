@@ -5,22 +5,14 @@ Works with actual Supabase table structure
 
 from flask import Blueprint, jsonify, request, current_app
 from flask_login import login_required, current_user
-import psycopg2
 from psycopg2.extras import RealDictCursor
-import json
+from database import get_db
+from pagination import KeysetOrder, Key, fetch_page, PaginationError
+from site_statistics import statistics_response
+from json_response import raw_json
 
 api_bp = Blueprint('api', __name__, url_prefix='/api')
 
-def get_db():
-    """Get database connection"""
-    return psycopg2.connect(
-        host=current_app.config.get('host', 'aws-0-eu-central-1.pooler.supabase.com'),
-        port=current_app.config.get('port', 5432),
-        database=current_app.config.get('database', 'postgres'),
-        user=current_app.config.get('user', 'postgres.ctlqtgwyuknxpkssidcd'),
-        password=current_app.config.get('password', '6pRZELCQUoGFIcf')
-    )
-
 @api_bp.route('/test_connection', methods=['GET'])
 @login_required
 def test_connection():
@@ -30,17 +22,23 @@ def test_connection():
         cursor = conn.cursor()
         cursor.execute("SELECT 1")
         cursor.close()
-        conn.close()
         return jsonify({'status': 'Connected successfully'})
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
+STRAT_UNIT_ORDER = KeysetOrder(
+    Key('created_at', 'created_at', descending=True),
+    Key('su_uuid', 'su_uuid')
+)
+
 @api_bp.route('/strat_units', methods=['GET'])
 @login_required
 def get_strat_units():
     """Get stratigraphic units"""
     page = request.args.get('page', 1, type=int)
     per_page = request.args.get('per_page', 50, type=int)
+    cursor_token = request.args.get('cursor')
+    count_strategy = request.args.get('count', 'auto')
     search = request.args.get('search', '')
     
     conn = get_db()
@@ -75,31 +73,25 @@ def get_strat_units():
             query += " AND (code ILIKE %s OR description ILIKE %s OR std_code ILIKE %s)"
             params.extend([f'%{search}%', f'%{search}%', f'%{search}%'])
             
-        # Count total
-        count_query = f"SELECT COUNT(*) FROM ({query}) as t"
-        cursor.execute(count_query, params)
-        total = cursor.fetchone()['count']
-        
-        # Add pagination
-        query += " ORDER BY created_at DESC LIMIT %s OFFSET %s"
-        params.extend([per_page, (page - 1) * per_page])
-        
-        cursor.execute(query, params)
-        units = cursor.fetchall()
+        # Paginate: page/offset, or keyset when ?cursor= is given
+        units, page_info = fetch_page(cursor, query, params, STRAT_UNIT_ORDER, page, per_page, cursor_token, count_strategy)
         
         return jsonify({
             'data': units,
-            'total': total,
-            'page': page,
-            'per_page': per_page,
-            'total_pages': (total + per_page - 1) // per_page
+            **page_info
         })
         
+    except PaginationError as e:
+        return jsonify({'error': str(e)}), 400
     except Exception as e:
         return jsonify({'error': str(e)}), 500
     finally:
         cursor.close()
-        conn.close()
+
+MEKAN_ORDER = KeysetOrder(
+    Key('created_at', 'created_at', descending=True),
+    Key('birin_uuid', 'birin_uuid')
+)
 
 @api_bp.route('/mekan_units', methods=['GET'])
 @login_required
@@ -107,6 +99,8 @@ def get_mekan_units():
     """Get MEKAN units"""
     page = request.args.get('page', 1, type=int)
     per_page = request.args.get('per_page', 50, type=int)
+    cursor_token = request.args.get('cursor')
+    count_strategy = request.args.get('count', 'auto')
     search = request.args.get('search', '')
     
     conn = get_db()
@@ -140,36 +134,30 @@ def get_mekan_units():
             query += " AND (birin_no::text ILIKE %s OR description ILIKE %s OR birin_type ILIKE %s)"
             params.extend([f'%{search}%', f'%{search}%', f'%{search}%'])
             
-        # Count total
-        count_query = f"SELECT COUNT(*) FROM ({query}) as t"
-        cursor.execute(count_query, params)
-        total = cursor.fetchone()['count']
-        
-        # Add pagination
-        query += " ORDER BY created_at DESC LIMIT %s OFFSET %s"
-        params.extend([per_page, (page - 1) * per_page])
-        
-        cursor.execute(query, params)
-        units = cursor.fetchall()
+        # Paginate: page/offset, or keyset when ?cursor= is given
+        units, page_info = fetch_page(cursor, query, params, MEKAN_ORDER, page, per_page, cursor_token, count_strategy)
         
         # Convert geometry
         for unit in units:
             if unit.get('geometry'):
-                unit['geometry'] = json.loads(unit['geometry'])
+                unit['geometry'] = raw_json(unit['geometry'])
         
         return jsonify({
             'data': units,
-            'total': total,
-            'page': page,
-            'per_page': per_page,
-            'total_pages': (total + per_page - 1) // per_page
+            **page_info
         })
         
+    except PaginationError as e:
+        return jsonify({'error': str(e)}), 400
     except Exception as e:
         return jsonify({'error': str(e)}), 500
     finally:
         cursor.close()
-        conn.close()
+
+FIND_ORDER = KeysetOrder(
+    Key('created_at', 'created_at', descending=True),
+    Key('find_uuid', 'find_uuid')
+)
 
 @api_bp.route('/finds', methods=['GET'])
 @login_required
@@ -177,6 +165,8 @@ def get_finds():
     """Get finds"""
     page = request.args.get('page', 1, type=int)
     per_page = request.args.get('per_page', 50, type=int)
+    cursor_token = request.args.get('cursor')
+    count_strategy = request.args.get('count', 'auto')
     search = request.args.get('search', '')
     
     conn = get_db()
@@ -216,99 +206,42 @@ def get_finds():
             query += " AND (find_id ILIKE %s OR description ILIKE %s OR material ILIKE %s)"
             params.extend([f'%{search}%', f'%{search}%', f'%{search}%'])
             
-        # Count total
-        count_query = f"SELECT COUNT(*) FROM ({query}) as t"
-        cursor.execute(count_query, params)
-        total = cursor.fetchone()['count']
-        
-        # Add pagination
-        query += " ORDER BY created_at DESC LIMIT %s OFFSET %s"
-        params.extend([per_page, (page - 1) * per_page])
-        
-        cursor.execute(query, params)
-        finds = cursor.fetchall()
+        # Paginate: page/offset, or keyset when ?cursor= is given
+        finds, page_info = fetch_page(cursor, query, params, FIND_ORDER, page, per_page, cursor_token, count_strategy)
         
         # Convert geometry
         for find in finds:
             if find.get('geometry'):
-                find['geometry'] = json.loads(find['geometry'])
+                find['geometry'] = raw_json(find['geometry'])
         
         return jsonify({
             'data': finds,
-            'total': total,
-            'page': page,
-            'per_page': per_page,
-            'total_pages': (total + per_page - 1) // per_page
+            **page_info
         })
         
+    except PaginationError as e:
+        return jsonify({'error': str(e)}), 400
     except Exception as e:
         return jsonify({'error': str(e)}), 500
     finally:
         cursor.close()
-        conn.close()
 
 @api_bp.route('/statistics', methods=['GET'])
 @login_required
 def get_statistics():
-    """Get database statistics"""
-    conn = get_db()
-    cursor = conn.cursor(cursor_factory=RealDictCursor)
-    
+    """Get database statistics (cached; finds are counted from the finds table)"""
     try:
-        stats = {}
-        
-        # Count strat units
-        cursor.execute("SELECT COUNT(*) as count FROM strat_unit")
-        stats['total_strat_units'] = cursor.fetchone()['count']
-        
-        # Count mekan units
-        cursor.execute("SELECT COUNT(*) as count FROM mekan_birin")
-        stats['total_mekan'] = cursor.fetchone()['count']
-        
-        # Count finds
-        cursor.execute("SELECT COUNT(*) as count FROM finds")
-        stats['total_finds'] = cursor.fetchone()['count']
-        
-        # Count by year for strat_unit
-        cursor.execute("""
-            SELECT mekan_year as year, COUNT(*) as count
-            FROM strat_unit
-            WHERE mekan_year IS NOT NULL
-            GROUP BY mekan_year
-            ORDER BY mekan_year DESC
-            LIMIT 10
-        """)
-        stats['units_by_year'] = cursor.fetchall()
-        
-        # Count by material for finds
-        cursor.execute("""
-            SELECT material, COUNT(*) as count
-            FROM finds
-            WHERE material IS NOT NULL
-            GROUP BY material
-            ORDER BY count DESC
-            LIMIT 10
-        """)
-        stats['finds_by_material'] = cursor.fetchall()
-        
-        # Count by type for mekan
-        cursor.execute("""
-            SELECT birin_type, COUNT(*) as count
-            FROM mekan_birin
-            WHERE birin_type IS NOT NULL
-            GROUP BY birin_type
-            ORDER BY count DESC
-            LIMIT 10
-        """)
-        stats['mekan_by_type'] = cursor.fetchall()
-        
-        return jsonify(stats)
+        return statistics_response(lambda stats: {
+            'total_strat_units': stats['total_strat_units'],
+            'total_mekan': stats['total_birim'],
+            'total_finds': stats['total_finds'],
+            'units_by_year': stats['units_by_year'][:10],
+            'finds_by_material': stats['finds_by_material'][:10],
+            'mekan_by_type': stats['birim_by_type'][:10]
+        }, finds_table='finds')
         
     except Exception as e:
         return jsonify({'error': str(e)}), 500
-    finally:
-        cursor.close()
-        conn.close()
 
 @api_bp.route('/tables', methods=['GET'])
 @login_required
@@ -346,5 +279,4 @@ def get_tables():
     except Exception as e:
         return jsonify({'error': str(e)}), 500
     finally:
-        cursor.close()
-        conn.close()
\ No newline at end of file
+        cursor.close()
\ No newline at end of file
@@ -6,13 +6,26 @@ Web interface for managing users, roles, and permissions
 from flask import Flask, render_template, request, redirect, url_for, session, flash, jsonify
 from flask_login import LoginManager, UserMixin, login_user, logout_user, login_required, current_user
 from flask_cors import CORS
-import psycopg2
 from psycopg2.extras import RealDictCursor
 import bcrypt
 import secrets
 from datetime import datetime, timedelta
 import os
+import tempfile
 from functools import wraps
+import click
+import database
+import schema_registry
+import export_jobs
+import thumbnails
+import site_statistics
+import tiles
+import migrate
+import search_index
+import relationship_summary
+import geometry_backfill
+import json_response
+from database import get_db
 from api_routes_simple import api_bp
 from api_archaeological import api_arch
 from api_archaeological_fixed import api_arch_fixed
@@ -42,6 +55,49 @@ DB_CONFIG = {
 # Set config for blueprint access
 app.config.update(DB_CONFIG)
 
+# Connection pool shared by the app routes and all API blueprints
+app.config.update(
+    DB_POOL_MIN_SIZE=int(os.getenv('DB_POOL_MIN_SIZE', 1)),
+    DB_POOL_MAX_SIZE=int(os.getenv('DB_POOL_MAX_SIZE', 10)),
+    DB_POOL_TIMEOUT=float(os.getenv('DB_POOL_TIMEOUT', 10)),
+    DB_POOL_MAX_LIFETIME=float(os.getenv('DB_POOL_MAX_LIFETIME', 1800)),
+    DB_POOL_HEALTH_CHECK_INTERVAL=float(os.getenv('DB_POOL_HEALTH_CHECK_INTERVAL', 30))
+)
+database.init_app(app)
+
+# Table/column capability registry, refreshed every SCHEMA_REGISTRY_TTL seconds
+app.config['SCHEMA_REGISTRY_TTL'] = float(os.getenv('SCHEMA_REGISTRY_TTL', 300))
+schema_registry.init_app(app)
+
+# Dashboard statistics, cached per worker for STATISTICS_TTL seconds
+app.config['STATISTICS_TTL'] = float(os.getenv('STATISTICS_TTL', 60))
+site_statistics.init_app(app)
+
+# Background export jobs: worker threads per process, artifacts cached for EXPORT_TTL seconds
+app.config.update(
+    EXPORT_DIR=os.getenv('EXPORT_DIR', os.path.join(tempfile.gettempdir(), 'mekan_exports')),
+    EXPORT_WORKERS=int(os.getenv('EXPORT_WORKERS', 2)),
+    EXPORT_TTL=float(os.getenv('EXPORT_TTL', 3600))
+)
+export_jobs.init_app(app)
+
+# Media thumbnails for PDF sheets: disk cache bounded to THUMBNAIL_CACHE_BYTES, LRU eviction
+app.config.update(
+    THUMBNAIL_DIR=os.getenv('THUMBNAIL_DIR', os.path.join(tempfile.gettempdir(), 'mekan_thumbnails')),
+    THUMBNAIL_CACHE_BYTES=int(os.getenv('THUMBNAIL_CACHE_BYTES', 256 * 1024 * 1024)),
+    THUMBNAIL_WORKERS=int(os.getenv('THUMBNAIL_WORKERS', 4)),
+    THUMBNAIL_SOURCE_DIR=os.getenv('THUMBNAIL_SOURCE_DIR')
+)
+thumbnails.init_app(app)
+
+# Vector tile cache, invalidated per tile from the tile_invalidations change log
+app.config['TILE_DIR'] = os.getenv('TILE_DIR', os.path.join(tempfile.gettempdir(), 'mekan_tiles'))
+tiles.init_app(app)
+
+# JSON responses: orjson when installed (JSON_ENCODER=auto), or forced to 'orjson'/'json'
+app.config['JSON_ENCODER'] = os.getenv('JSON_ENCODER', 'auto')
+json_response.init_app(app)
+
 # Register API blueprints
 app.register_blueprint(api_bp)
 app.register_blueprint(api_arch)
@@ -62,10 +118,6 @@ class User(UserMixin):
         self.role_name = user_data.get('role_name')
         self.permissions = user_data
 
-def get_db():
-    """Get database connection"""
-    return psycopg2.connect(**DB_CONFIG)
-
 @login_manager.user_loader
 def load_user(user_id):
     """Load user for Flask-Login"""
@@ -87,7 +139,6 @@ def load_user(user_id):
         return User(user_data) if user_data else None
     finally:
         cursor.close()
-        conn.close()
 
 def admin_required(f):
     """Decorator for admin-only routes"""
@@ -143,7 +194,6 @@ def index():
                              recent_activity=recent_activity)
     finally:
         cursor.close()
-        conn.close()
 
 @app.route('/login', methods=['GET', 'POST'])
 def login():
@@ -194,7 +244,6 @@ def login():
                 
         finally:
             cursor.close()
-            conn.close()
             
     return render_template('login.html')
 
@@ -213,7 +262,6 @@ def logout():
         conn.commit()
     finally:
         cursor.close()
-        conn.close()
         
     logout_user()
     flash('Logged out successfully', 'success')
@@ -243,7 +291,6 @@ def users():
         return render_template('users.html', users=users, roles=roles)
     finally:
         cursor.close()
-        conn.close()
 
 @app.route('/users/<int:user_id>/edit', methods=['GET', 'POST'])
 @login_required
@@ -302,7 +349,6 @@ def edit_user(user_id):
         
     finally:
         cursor.close()
-        conn.close()
 
 @app.route('/tokens')
 @login_required
@@ -326,7 +372,6 @@ def tokens():
         return render_template('tokens.html', tokens=tokens)
     finally:
         cursor.close()
-        conn.close()
 
 @app.route('/tokens/create', methods=['POST'])
 @login_required
@@ -377,7 +422,6 @@ def create_token():
         
     finally:
         cursor.close()
-        conn.close()
 
 @app.route('/tokens/<int:token_id>/revoke', methods=['POST'])
 @login_required
@@ -404,7 +448,6 @@ def revoke_token(token_id):
         
     finally:
         cursor.close()
-        conn.close()
         
     return redirect(url_for('tokens'))
 
@@ -430,7 +473,6 @@ def roles():
         return render_template('roles.html', roles=roles)
     finally:
         cursor.close()
-        conn.close()
 
 @app.route('/activity')
 @login_required
@@ -466,7 +508,6 @@ def activity():
                              total_pages=(total + per_page - 1) // per_page)
     finally:
         cursor.close()
-        conn.close()
 
 @app.route('/api/stats')
 @login_required
@@ -477,35 +518,26 @@ def api_stats():
     try:
         stats = {}
         
+        # Per-day counts come from the statistics rollup once it is migrated
+        schema = schema_registry.get_schema()
+        
         # User stats
-        cursor.execute(
-            """
-            SELECT DATE(created_at) as date, COUNT(*) as count
-            FROM system_users
-            WHERE created_at > NOW() - INTERVAL '30 days'
-            GROUP BY DATE(created_at)
-            ORDER BY date
-            """
-        )
-        stats['new_users'] = cursor.fetchall()
+        stats['new_users'] = site_statistics.daily_counts(cursor, 'system_users', 30, schema)
         
         # Activity stats
-        cursor.execute(
-            """
-            SELECT DATE(created_at) as date, COUNT(*) as count
-            FROM user_activity_log
-            WHERE created_at > NOW() - INTERVAL '7 days'
-            GROUP BY DATE(created_at)
-            ORDER BY date
-            """
-        )
-        stats['activity'] = cursor.fetchall()
+        stats['activity'] = site_statistics.daily_counts(cursor, 'user_activity_log', 7, schema)
         
         return jsonify(stats)
         
     finally:
         cursor.close()
-        conn.close()
+
+@app.route('/api/db/pool')
+@login_required
+@admin_required
+def api_db_pool():
+    """Connection pool metrics for sizing gunicorn workers (admin only)"""
+    return jsonify(database.get_pool().stats())
 
 @app.route('/archaeological')
 @login_required
@@ -541,8 +573,44 @@ def create_initial_admin():
             
     finally:
         cursor.close()
-        conn.close()
+
+@app.cli.command('migrate')
+def migrate_command():
+    """Apply pending SQL migrations (flask --app app migrate)"""
+    applied = migrate.apply_migrations(get_db())
+    schema_registry.refresh_schema()
+    print(f"Applied {len(applied)} migration(s)" if applied else "Database is up to date")
+
+@app.cli.command('search-index')
+def search_index_command():
+    """Install the search_documents triggers and rebuild the index"""
+    conn = get_db()
+    schema = schema_registry.refresh_schema()
+    search_index.install_triggers(conn, schema)
+    counts = search_index.rebuild(conn, schema)
+    print(f"Indexed {sum(counts.values())} documents")
+
+@app.cli.command('reconcile-relationships')
+@click.option('--check', is_flag=True, help='Only report drift, do not rebuild')
+def reconcile_relationships_command(check):
+    """Rebuild mekan_relationship_summary and report rows that had drifted"""
+    finds_table = schema_registry.refresh_schema().finds_table()
+    drift = relationship_summary.reconcile(get_db(), finds_table, rebuild=not check)
+    if check and drift:
+        raise SystemExit(1)
+
+@app.cli.command('rebuild-statistics')
+def rebuild_statistics_command():
+    """Recompute the statistics_rollup counters from scratch"""
+    site_statistics.rebuild_rollup(get_db())
+
+@app.cli.command('backfill-geometry')
+@click.option('--batch-size', default=geometry_backfill.BACKFILL_BATCH_SIZE, help='Rows updated per transaction')
+def backfill_geometry_command(batch_size):
+    """Fill geom_4326 for rows that are missing it"""
+    geometry_backfill.backfill(get_db(), schema_registry.refresh_schema(), batch_size=batch_size)
 
 if __name__ == '__main__':
-    create_initial_admin()
+    with app.app_context():
+        create_initial_admin()
     app.run(debug=True, host='0.0.0.0', port=5001)
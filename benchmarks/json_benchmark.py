@@ -0,0 +1,99 @@
+#!/usr/bin/env python3
+"""
+JSON benchmark: encode time of one 1,000-row list page (MEKAN-like rows with
+a PostGIS GeoJSON polygon each), as the list endpoints build it.
+
+Compares the previous path (json.loads of every geometry, then the stdlib
+encoder) with the raw passthrough of json_response, on the stdlib encoder
+and on orjson when it is installed. No database is needed:
+
+    python benchmarks/json_benchmark.py
+"""
+
+import json
+import os
+import random
+import sys
+import time
+from datetime import datetime
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+import json_response
+from json_response import RawJSON, default, dumps_stdlib, dumps_orjson
+
+ROWS = int(os.getenv('BENCH_ROWS', 1000))
+VERTICES = int(os.getenv('BENCH_VERTICES', 200))
+REPEAT = 20
+
+
+def geometry_text(rng):
+    """ST_AsGeoJSON-style polygon text"""
+    x, y = rng.uniform(36.0, 37.0), rng.uniform(37.0, 38.0)
+    ring = [[round(x + rng.uniform(-0.001, 0.001), 8), round(y + rng.uniform(-0.001, 0.001), 8)]
+            for _ in range(VERTICES)]
+    ring.append(ring[0])
+    return json.dumps({'type': 'Polygon', 'coordinates': [ring]}, separators=(',', ':'))
+
+
+def rows():
+    """RealDictCursor-like rows as fetched from the database, geometry still text"""
+    rng = random.Random(42)
+    return [{
+        'su_uuid': f'00000000-0000-0000-0000-{n:012d}',
+        'mekan_no': n,
+        'mekan_year': 2000 + n % 25,
+        'mekan_alan': f'Area {chr(65 + n % 12)}',
+        'description': 'mudbrick wall collapse over burnt floor, ash lenses and pottery',
+        'created_at': datetime(2023, 5, 1 + n % 28),
+        'has_media': n % 3 == 0,
+        'geometry': geometry_text(rng)
+    } for n in range(ROWS)]
+
+
+def dumps_previous(obj):
+    """What Flask's default provider did before json_response"""
+    return json.dumps(obj, default=default, ensure_ascii=False, separators=(',', ':'))
+
+
+def page(data):
+    return {'data': data, 'pagination': {'limit': ROWS, 'next_cursor': 'eyJ2IjpbMTAwMF19', 'has_next': True}}
+
+
+def time_encode(prepare, encode, source):
+    """Median ms over REPEAT runs of preparing the rows (per-row geometry handling) and encoding the page"""
+    timings = []
+    size = 0
+    for _ in range(REPEAT):
+        data = [dict(row) for row in source]
+        start = time.perf_counter()
+        for row in data:
+            row['geometry'] = prepare(row['geometry'])
+        body = encode(page(data))
+        timings.append((time.perf_counter() - start) * 1000)
+        size = len(body)
+    return sorted(timings)[len(timings) // 2], size
+
+
+def main():
+    print(f"Building {ROWS} rows with {VERTICES}-vertex geometries...")
+    source = rows()
+
+    cases = [
+        ('json.loads + json.dumps', json.loads, dumps_previous),
+        ('raw passthrough + stdlib', RawJSON, dumps_stdlib),
+    ]
+    if json_response.orjson is not None:
+        cases.append(('json.loads + orjson', json.loads, dumps_orjson))
+        cases.append(('raw passthrough + orjson', json_response.orjson.Fragment, dumps_orjson))
+    else:
+        print("orjson is not installed; only the stdlib encoder is measured")
+
+    print()
+    print(f"{'encoder':<26} {'median ms':>10} {'body KB':>10}")
+    for label, prepare, encode in cases:
+        elapsed, size = time_encode(prepare, encode, source)
+        print(f"{label:<26} {elapsed:>10.1f} {size / 1024:>10.0f}")
+
+
+if __name__ == '__main__':
+    main()
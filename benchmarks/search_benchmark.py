@@ -0,0 +1,135 @@
+#!/usr/bin/env python3
+"""
+Search benchmark: latency of the strat_unit `search` predicate before and
+after migrations/001_search_indexes.sql, on a synthetic 500k-row table.
+
+Everything is created in a scratch schema that is dropped at the end, so it
+is safe to run against a development database:
+
+    POSTGRES_HOST=localhost POSTGRES_PASSWORD=... python benchmarks/search_benchmark.py
+"""
+
+import os
+import sys
+import time
+import psycopg2
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+from search import search_clause
+from migrate import MIGRATIONS_DIR
+
+SCHEMA = 'bench_search'
+ROWS = int(os.getenv('BENCH_ROWS', 500000))
+REPEAT = 5
+
+# (label, search term) - numeric id, rare word, common word, Turkish word
+TERMS = [
+    ('numeric id', '4217'),
+    ('rare word', 'obsidian'),
+    ('common word', 'wall'),
+    ('turkish word', 'duvar'),
+]
+
+WORDS_EN = ['wall', 'floor', 'fill', 'pit', 'ash', 'mudbrick', 'plaster', 'burnt', 'collapse',
+            'hearth', 'bone', 'pottery', 'layer', 'clay', 'stone', 'oven', 'bin', 'platform']
+WORDS_TR = ['duvar', 'taban', 'dolgu', 'çukur', 'kül', 'kerpiç', 'sıva', 'yanık', 'yıkıntı',
+            'ocak', 'kemik', 'çanak', 'tabaka', 'kil', 'taş', 'fırın', 'silo', 'platform']
+
+
+def connect():
+    return psycopg2.connect(
+        host=os.getenv('POSTGRES_HOST', 'localhost'),
+        port=os.getenv('POSTGRES_PORT', 5432),
+        database=os.getenv('POSTGRES_DATABASE', 'postgres'),
+        user=os.getenv('POSTGRES_USER', 'postgres'),
+        password=os.getenv('POSTGRES_PASSWORD', '')
+    )
+
+
+def create_dataset(cursor):
+    """Synthetic strat_unit with random English/Turkish descriptions"""
+    cursor.execute(f"DROP SCHEMA IF EXISTS {SCHEMA} CASCADE")
+    cursor.execute(f"CREATE SCHEMA {SCHEMA}")
+    cursor.execute(f"SET search_path TO {SCHEMA}, public")
+    cursor.execute("""
+        CREATE TABLE strat_unit (
+            mekan_no INTEGER PRIMARY KEY,
+            mekan_year INTEGER,
+            mekan_alan TEXT,
+            description TEXT,
+            description_tr TEXT
+        )
+    """)
+    cursor.execute("""
+        INSERT INTO strat_unit
+        SELECT
+            n,
+            2000 + n %% 25,
+            'Area ' || chr(65 + n %% 12),
+            (SELECT string_agg(w, ' ') FROM (
+                SELECT (%(en)s::text[])[1 + floor(random() * array_length(%(en)s::text[], 1))::int] AS w
+                FROM generate_series(1, 12) WHERE n > 0) s)
+                || CASE WHEN n %% 997 = 0 THEN ' obsidian blade' ELSE '' END,
+            (SELECT string_agg(w, ' ') FROM (
+                SELECT (%(tr)s::text[])[1 + floor(random() * array_length(%(tr)s::text[], 1))::int] AS w
+                FROM generate_series(1, 12) WHERE n > 0) s)
+        FROM generate_series(1, %(rows)s) n
+    """, {'en': WORDS_EN, 'tr': WORDS_TR, 'rows': ROWS})
+    cursor.execute("ANALYZE strat_unit")
+
+
+def search_query(term, tsv):
+    clause, params = search_clause(term, ['description', 'mekan_alan'], exact_columns=['mekan_no'], tsv=tsv)
+    return f"SELECT mekan_no FROM strat_unit WHERE {clause} ORDER BY mekan_no LIMIT 50", params
+
+
+def time_query(cursor, query, params):
+    """Median wall time in ms over REPEAT runs, plus the top plan node"""
+    timings = []
+    for _ in range(REPEAT):
+        start = time.perf_counter()
+        cursor.execute(query, params)
+        cursor.fetchall()
+        timings.append((time.perf_counter() - start) * 1000)
+    cursor.execute(f"EXPLAIN {query}", params)
+    plan = ' / '.join(row[0].strip() for row in cursor.fetchall() if 'Scan' in row[0])
+    return sorted(timings)[len(timings) // 2], plan
+
+
+def run(cursor, tsv):
+    results = {}
+    for label, term in TERMS:
+        query, params = search_query(term, tsv)
+        results[label] = time_query(cursor, query, params)
+    return results
+
+
+def main():
+    conn = connect()
+    conn.autocommit = True
+    cursor = conn.cursor()
+    try:
+        print(f"Creating {ROWS} synthetic strat_unit rows in schema {SCHEMA}...")
+        create_dataset(cursor)
+
+        before = run(cursor, tsv=None)
+
+        print("Applying 001_search_indexes.sql...")
+        with open(os.path.join(MIGRATIONS_DIR, '001_search_indexes.sql'), encoding='utf-8') as f:
+            cursor.execute(f.read())
+        cursor.execute("ANALYZE strat_unit")
+
+        after = run(cursor, tsv='search_tsv')
+
+        print()
+        print(f"{'term':<14} {'before ms':>10} {'after ms':>10}  plan after")
+        for label, _ in TERMS:
+            print(f"{label:<14} {before[label][0]:>10.1f} {after[label][0]:>10.1f}  {after[label][1]}")
+    finally:
+        cursor.execute(f"DROP SCHEMA IF EXISTS {SCHEMA} CASCADE")
+        cursor.close()
+        conn.close()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,116 @@
+"""
+List Total Counts
+Selectable strategies for the `total` of paginated lists: exact, cached or planner estimate
+"""
+
+import threading
+import time
+
+# ?count= values accepted by the list endpoints
+COUNT_STRATEGIES = ('auto', 'exact', 'cached', 'estimate')
+
+# Unfiltered lists whose planner estimate is at least this large report the estimate
+ESTIMATE_THRESHOLD = 10000
+
+# Seconds an exact count stays valid in the per-process cache
+COUNT_CACHE_TTL = 30
+COUNT_CACHE_MAX_ENTRIES = 512
+
+
+def strip_projection(query):
+    """Replace the top-level SELECT list with `1` so counts skip geometry and projection"""
+    upper = query.upper()
+    select_at = upper.find('SELECT')
+    depth = 0
+    i = select_at + len('SELECT')
+    while i < len(query):
+        ch = query[i]
+        if ch == '(':
+            depth += 1
+        elif ch == ')':
+            depth -= 1
+        elif depth == 0 and upper.startswith('FROM', i) \
+                and not (upper[i - 1].isalnum() or upper[i - 1] == '_') \
+                and (i + 4 == len(upper) or not (upper[i + 4].isalnum() or upper[i + 4] == '_')):
+            return "SELECT 1 " + query[i:]
+        i += 1
+    return query
+
+
+class CountCache:
+    """Thread-safe TTL cache of exact counts keyed by query text and filter values"""
+
+    def __init__(self, ttl=COUNT_CACHE_TTL, max_entries=COUNT_CACHE_MAX_ENTRIES):
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self._entries = {}
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry and time.monotonic() - entry[1] < self.ttl:
+                return entry[0]
+            self._entries.pop(key, None)
+            return None
+
+    def set(self, key, total):
+        with self._lock:
+            if len(self._entries) >= self.max_entries:
+                # Drop the oldest entry
+                oldest = min(self._entries, key=lambda k: self._entries[k][1])
+                del self._entries[oldest]
+            self._entries[key] = (total, time.monotonic())
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+
+count_cache = CountCache()
+
+
+def _first_value(row):
+    return list(row.values())[0] if isinstance(row, dict) else row[0]
+
+
+def exact_count(cursor, query, params):
+    cursor.execute(f"SELECT COUNT(*) FROM ({strip_projection(query)}) as t", params)
+    return _first_value(cursor.fetchone())
+
+
+def estimated_count(cursor, query, params):
+    """Planner row estimate from EXPLAIN; no rows are read"""
+    cursor.execute(f"EXPLAIN (FORMAT JSON) {strip_projection(query)}", params)
+    plan = _first_value(cursor.fetchone())
+    return int(plan[0]['Plan']['Plan Rows'])
+
+
+def count_rows(cursor, query, params, strategy='auto'):
+    """
+    Return (total, strategy_used) for a filtered list query.
+
+    'auto' reports the planner estimate for unfiltered lists that are large,
+    otherwise a cached exact count.
+    """
+    if strategy not in COUNT_STRATEGIES:
+        raise ValueError(f"Invalid count strategy, use one of: {', '.join(COUNT_STRATEGIES)}")
+
+    if strategy == 'estimate':
+        return estimated_count(cursor, query, params), 'estimate'
+
+    if strategy == 'auto' and not params:
+        estimate = estimated_count(cursor, query, params)
+        if estimate >= ESTIMATE_THRESHOLD:
+            return estimate, 'estimate'
+
+    if strategy == 'exact':
+        return exact_count(cursor, query, params), 'exact'
+
+    key = (query, tuple(str(p) for p in params))
+    total = count_cache.get(key)
+    if total is not None:
+        return total, 'cached'
+    total = exact_count(cursor, query, params)
+    count_cache.set(key, total)
+    return total, 'exact'
@@ -0,0 +1,260 @@
+"""
+Shared PostgreSQL Connection Pool
+Process-wide, thread-safe pool used by the app routes and all API blueprints
+"""
+
+from flask import current_app, g
+import psycopg2
+from psycopg2 import extensions
+from collections import deque
+import threading
+import time
+
+# Connection settings read from app.config (same keys as DB_CONFIG in app.py)
+DB_DEFAULTS = {
+    'host': 'aws-0-eu-central-1.pooler.supabase.com',
+    'port': 5432,
+    'database': 'postgres',
+    'user': 'postgres.ctlqtgwyuknxpkssidcd',
+    'password': '6pRZELCQUoGFIcf'
+}
+
+# Pool settings, overridable through app.config / environment
+POOL_DEFAULTS = {
+    'DB_POOL_MIN_SIZE': 1,
+    'DB_POOL_MAX_SIZE': 10,
+    'DB_POOL_TIMEOUT': 10,
+    'DB_POOL_MAX_LIFETIME': 1800,
+    'DB_POOL_HEALTH_CHECK_INTERVAL': 30
+}
+
+
+class PoolTimeout(Exception):
+    """Raised when no connection becomes available within the pool timeout"""
+
+
+class ConnectionPool:
+    """Thread-safe pool of psycopg2 connections with health checks and recycling"""
+
+    def __init__(self, connect_kwargs, min_size=1, max_size=10, timeout=10,
+                 max_lifetime=1800, health_check_interval=30):
+        self.connect_kwargs = connect_kwargs
+        self.min_size = min_size
+        self.max_size = max_size
+        self.timeout = timeout
+        self.max_lifetime = max_lifetime
+        self.health_check_interval = health_check_interval
+
+        self._cond = threading.Condition()
+        self._idle = deque()      # (conn, created_at, last_used)
+        self._in_use = {}         # id(conn) -> created_at
+        self._opening = 0
+        self._checking = 0        # idle connections being health-checked outside the lock
+        self._closed = False
+
+        self._checkouts = 0
+        self._checkout_failures = 0
+        self._wait_time_total = 0.0
+        self._wait_time_max = 0.0
+        self._recycled = 0
+        self._discarded = 0
+
+        for _ in range(min_size):
+            self._idle.append((self._connect(), time.monotonic(), time.monotonic()))
+
+    def _connect(self):
+        return psycopg2.connect(**self.connect_kwargs)
+
+    def _size(self):
+        return len(self._idle) + len(self._in_use) + self._opening + self._checking
+
+    def _check_health(self, conn, created_at, last_used):
+        """Return None if conn is usable, else 'recycled' (too old) or 'broken' (closed or failed a ping)"""
+        if conn.closed:
+            return 'broken'
+        now = time.monotonic()
+        if self.max_lifetime and now - created_at > self.max_lifetime:
+            return 'recycled'
+        if now - last_used >= self.health_check_interval:
+            try:
+                cursor = conn.cursor()
+                cursor.execute("SELECT 1")
+                cursor.close()
+                conn.rollback()
+            except psycopg2.Error:
+                return 'broken'
+        return None
+
+    @staticmethod
+    def _close_quietly(conn):
+        try:
+            conn.close()
+        except psycopg2.Error:
+            pass
+
+    def getconn(self):
+        """Check out a healthy connection, waiting up to self.timeout seconds"""
+        started = time.monotonic()
+        deadline = started + self.timeout
+
+        while True:
+            candidate = None
+            with self._cond:
+                while True:
+                    if self._idle:
+                        candidate = self._idle.pop()
+                        self._checking += 1
+                        break
+
+                    if self._size() < self.max_size:
+                        self._opening += 1
+                        break
+
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        self._checkout_failures += 1
+                        raise PoolTimeout(
+                            f"No database connection available after {self.timeout}s "
+                            f"({len(self._in_use)} in use, max {self.max_size})"
+                        )
+                    self._cond.wait(remaining)
+
+            if candidate is None:
+                break
+
+            # Ping outside the lock so other checkouts and returns are not blocked
+            conn, created_at, last_used = candidate
+            problem = self._check_health(conn, created_at, last_used)
+            if problem:
+                self._close_quietly(conn)
+            with self._cond:
+                self._checking -= 1
+                if problem is None:
+                    self._in_use[id(conn)] = created_at
+                    self._record_checkout(started)
+                    return conn
+                if problem == 'recycled':
+                    self._recycled += 1
+                self._discarded += 1
+                self._cond.notify()
+
+        # Open the new connection outside the lock so other threads are not blocked
+        try:
+            conn = self._connect()
+        except Exception:
+            with self._cond:
+                self._opening -= 1
+                self._checkout_failures += 1
+                self._cond.notify()
+            raise
+
+        with self._cond:
+            self._opening -= 1
+            self._in_use[id(conn)] = time.monotonic()
+            self._record_checkout(started)
+        return conn
+
+    def _record_checkout(self, started):
+        waited = time.monotonic() - started
+        self._checkouts += 1
+        self._wait_time_total += waited
+        self._wait_time_max = max(self._wait_time_max, waited)
+
+    def putconn(self, conn, discard=False):
+        """Return a connection to the pool, rolling back any open transaction"""
+        with self._cond:
+            created_at = self._in_use.pop(id(conn), None)
+
+        if created_at is None:
+            # Not ours (or already returned)
+            return
+
+        if not discard and not conn.closed:
+            try:
+                if conn.get_transaction_status() != extensions.TRANSACTION_STATUS_IDLE:
+                    conn.rollback()
+            except psycopg2.Error:
+                discard = True
+
+        with self._cond:
+            if discard or conn.closed or self._closed:
+                self._discarded += 1
+                self._close_quietly(conn)
+            else:
+                self._idle.append((conn, created_at, time.monotonic()))
+            self._cond.notify()
+
+    def closeall(self):
+        """Close every idle connection; in-use connections are closed on return"""
+        with self._cond:
+            self._closed = True
+            while self._idle:
+                conn, _, _ = self._idle.pop()
+                self._close_quietly(conn)
+            self._cond.notify_all()
+
+    def stats(self):
+        """Snapshot of pool metrics"""
+        with self._cond:
+            checkouts = self._checkouts
+            return {
+                'in_use': len(self._in_use),
+                'idle': len(self._idle),
+                'size': self._size(),
+                'min_size': self.min_size,
+                'max_size': self.max_size,
+                'checkouts': checkouts,
+                'checkout_failures': self._checkout_failures,
+                'wait_time_total_ms': round(self._wait_time_total * 1000, 2),
+                'wait_time_avg_ms': round(self._wait_time_total * 1000 / checkouts, 2) if checkouts else 0.0,
+                'wait_time_max_ms': round(self._wait_time_max * 1000, 2),
+                'recycled': self._recycled,
+                'discarded': self._discarded
+            }
+
+
+_pool_lock = threading.Lock()
+
+
+def init_app(app):
+    """Register pool defaults and the per-request release hook on the app"""
+    for key, value in POOL_DEFAULTS.items():
+        app.config.setdefault(key, value)
+    app.extensions['db_pool'] = None
+    app.teardown_appcontext(release_db)
+
+
+def get_pool(app=None):
+    """Return the app's pool, creating it on first use (after gunicorn forks)"""
+    app = app or current_app._get_current_object()
+    pool = app.extensions.get('db_pool')
+    if pool is None:
+        with _pool_lock:
+            pool = app.extensions.get('db_pool')
+            if pool is None:
+                config = app.config
+                pool = ConnectionPool(
+                    {key: config.get(key, default) for key, default in DB_DEFAULTS.items()},
+                    min_size=int(config.get('DB_POOL_MIN_SIZE', POOL_DEFAULTS['DB_POOL_MIN_SIZE'])),
+                    max_size=int(config.get('DB_POOL_MAX_SIZE', POOL_DEFAULTS['DB_POOL_MAX_SIZE'])),
+                    timeout=float(config.get('DB_POOL_TIMEOUT', POOL_DEFAULTS['DB_POOL_TIMEOUT'])),
+                    max_lifetime=float(config.get('DB_POOL_MAX_LIFETIME', POOL_DEFAULTS['DB_POOL_MAX_LIFETIME'])),
+                    health_check_interval=float(config.get(
+                        'DB_POOL_HEALTH_CHECK_INTERVAL', POOL_DEFAULTS['DB_POOL_HEALTH_CHECK_INTERVAL']))
+                )
+                app.extensions['db_pool'] = pool
+    return pool
+
+
+def get_db():
+    """Get the pooled connection borrowed for the current app context"""
+    if 'db_conn' not in g:
+        g.db_conn = get_pool().getconn()
+    return g.db_conn
+
+
+def release_db(exception=None):
+    """Give the app context's connection back to the pool"""
+    conn = g.pop('db_conn', None)
+    if conn is not None:
+        get_pool().putconn(conn)
@@ -0,0 +1,191 @@
+"""
+Page Enrichment Stages
+Set-based lookups that decorate a whole page of list rows in one query
+"""
+
+# ============= MEDIA PRESENCE =============
+# Entity -> list of (row key, media column, SQL array type) links.
+# A row has media if ANY of its links matches a media row.
+MEDIA_LINKS = {
+    'mekan': [('su_uuid', 'su_uuid', 'uuid[]')],
+    'birim': [('birin_uuid', 'birin_uuid', 'uuid[]')],
+    'wall': [('wall_uuid', 'wall_uuid', 'uuid[]')],
+    'grave': [('grave_uuid', 'grave_uuid', 'uuid[]')],
+    'buluntu': [('su_uuid', 'su_uuid', 'uuid[]'), ('birin_uuid', 'birin_uuid', 'uuid[]')],
+    'find': [('find_id', 'find_id', None)]
+}
+
+
+def attach_has_media(cursor, rows, entity_type):
+    """Set row['has_media'] for every row of a page with a single media query"""
+    links = MEDIA_LINKS[entity_type]
+    if not rows:
+        return rows
+
+    parts = []
+    params = []
+    for row_key, media_col, array_type in links:
+        keys = list({row[row_key] for row in rows if row.get(row_key) is not None})
+        if not keys:
+            continue
+        cast = f"::{array_type}" if array_type else ""
+        parts.append(f"""
+            SELECT DISTINCT %s AS link, {media_col}::text AS key
+            FROM media
+            WHERE {media_col} = ANY(%s{cast})
+        """)
+        params.extend([row_key, keys])
+
+    found = set()
+    if parts:
+        cursor.execute(" UNION ALL ".join(parts), params)
+        found = {(r['link'], r['key']) for r in cursor.fetchall()}
+
+    for row in rows:
+        row['has_media'] = any(
+            row.get(row_key) is not None and (row_key, str(row[row_key])) in found
+            for row_key, _, _ in links
+        )
+    return rows
+
+
+def has_media_column(entity_type, alias='p', table=None, schema=None):
+    """
+    attach_has_media() as a SQL column over the result row `alias`
+    (db-rendered pages). With table/schema, links whose row column the
+    table does not have are skipped, as attach_has_media() does.
+    """
+    links = [
+        f"m.{media_col} = {alias}.{row_key}" for row_key, media_col, _ in MEDIA_LINKS[entity_type]
+        if schema is None or schema.has_column(table, row_key)
+    ]
+    if not links:
+        return "FALSE AS has_media"
+    return f"EXISTS (SELECT 1 FROM media m WHERE {' OR '.join(links)}) AS has_media"
+
+# ============= WALL -> MEKAN =============
+# Walls are linked to a MEKAN by year/alan. Joined against this deduplicated
+# mapping so a whole page resolves its parent MEKAN inside the list query,
+# keeping the first mekan_no for each year/alan pair.
+WALL_MEKAN_JOIN = """
+    LEFT JOIN (
+        SELECT DISTINCT ON (mekan_year, mekan_alan)
+            mekan_year, mekan_alan, mekan_no
+        FROM strat_unit
+        WHERE mekan_year IS NOT NULL AND mekan_alan IS NOT NULL
+        ORDER BY mekan_year, mekan_alan, mekan_no
+    ) wm ON wm.mekan_year = w.wall_year AND wm.mekan_alan = w.wall_alan
+"""
+
+# ============= RELATIONSHIP COUNTS =============
+# A mekan_no can appear on several strat_unit rows; the one with the lowest
+# su_uuid represents the MEKAN (its year/alan link walls and graves). The
+# summary triggers (migrations/003) use the same rule.
+MEKAN_ROW_ORDER = 'su_uuid'
+
+# Birim and finds hang off a MEKAN through su_uuid; walls and graves share
+# its year/alan. All four are counted for a set of MEKAN in one statement.
+RELATION_TYPES = ('birim', 'walls', 'graves', 'finds')
+
+# Trigger-maintained copy of the counts (migrations/003); relation -> column
+SUMMARY_TABLE = 'mekan_relationship_summary'
+SUMMARY_COLUMNS = {
+    'birim': 'birim_count',
+    'walls': 'wall_count',
+    'graves': 'grave_count',
+    'finds': 'find_count'
+}
+
+
+def empty_counts():
+    return {relation: 0 for relation in RELATION_TYPES}
+
+
+def relationship_counts(cursor, mekan_nos, finds_table='finds', summary=False):
+    """
+    {mekan_no: {birim, walls, graves, finds}} for many MEKAN in one query.
+
+    With summary=True the counts are read from mekan_relationship_summary
+    (an index lookup) instead of being aggregated from the four tables.
+    """
+    mekan_nos = list(set(mekan_nos))
+    if not mekan_nos:
+        return {}
+
+    if summary:
+        cursor.execute(f"""
+            SELECT mekan_no, {', '.join(f'{col} AS {rel}' for rel, col in SUMMARY_COLUMNS.items())}
+            FROM {SUMMARY_TABLE}
+            WHERE mekan_no = ANY(%s)
+        """, (mekan_nos,))
+    else:
+        cursor.execute(f"""
+            WITH m AS (
+                SELECT DISTINCT ON (mekan_no) mekan_no, mekan_year, mekan_alan
+                FROM strat_unit
+                WHERE mekan_no = ANY(%(mekan_nos)s)
+                ORDER BY mekan_no, {MEKAN_ROW_ORDER}
+            ),
+            birim_counts AS (
+                SELECT s.mekan_no, COUNT(*) AS n
+                FROM mekan_birin b
+                JOIN strat_unit s ON b.su_uuid = s.su_uuid
+                WHERE s.mekan_no = ANY(%(mekan_nos)s)
+                GROUP BY s.mekan_no
+            ),
+            find_counts AS (
+                SELECT s.mekan_no, COUNT(*) AS n
+                FROM {finds_table} f
+                JOIN strat_unit s ON f.su_uuid = s.su_uuid
+                WHERE s.mekan_no = ANY(%(mekan_nos)s)
+                GROUP BY s.mekan_no
+            ),
+            wall_counts AS (
+                SELECT wall_year, wall_alan, COUNT(*) AS n
+                FROM mekan_wall
+                WHERE (wall_year, wall_alan) IN (SELECT mekan_year, mekan_alan FROM m)
+                GROUP BY wall_year, wall_alan
+            ),
+            grave_counts AS (
+                SELECT grave_year, grave_alan, COUNT(*) AS n
+                FROM mekan_grave
+                WHERE (grave_year, grave_alan) IN (SELECT mekan_year, mekan_alan FROM m)
+                GROUP BY grave_year, grave_alan
+            )
+            SELECT
+                m.mekan_no,
+                COALESCE(birim_counts.n, 0) AS birim,
+                COALESCE(wall_counts.n, 0) AS walls,
+                COALESCE(grave_counts.n, 0) AS graves,
+                COALESCE(find_counts.n, 0) AS finds
+            FROM m
+            LEFT JOIN birim_counts ON birim_counts.mekan_no = m.mekan_no
+            LEFT JOIN find_counts ON find_counts.mekan_no = m.mekan_no
+            LEFT JOIN wall_counts ON wall_counts.wall_year = m.mekan_year AND wall_counts.wall_alan = m.mekan_alan
+            LEFT JOIN grave_counts ON grave_counts.grave_year = m.mekan_year AND grave_counts.grave_alan = m.mekan_alan
+        """, {'mekan_nos': mekan_nos})
+
+    return {
+        row['mekan_no']: {relation: row[relation] for relation in RELATION_TYPES}
+        for row in cursor.fetchall()
+    }
+
+
+def counts_column(alias='p'):
+    """Relationship counts from the summary table as a json column (db-rendered pages)"""
+    fields = ', '.join(f"'{rel}', rs.{col}" for rel, col in SUMMARY_COLUMNS.items())
+    zeros = ', '.join(f"'{rel}', 0" for rel in SUMMARY_COLUMNS)
+    return f"""COALESCE(
+        (SELECT json_build_object({fields}) FROM {SUMMARY_TABLE} rs WHERE rs.mekan_no = {alias}.mekan_no),
+        json_build_object({zeros})
+    ) AS counts"""
+
+
+def attach_relationship_counts(cursor, rows, finds_table='finds', summary=False):
+    """Set row['counts'] for every MEKAN row of a page with a single query"""
+    counts = relationship_counts(
+        cursor, [row['mekan_no'] for row in rows if row.get('mekan_no') is not None], finds_table, summary
+    )
+    for row in rows:
+        row['counts'] = counts.get(row.get('mekan_no'), empty_counts())
+    return rows
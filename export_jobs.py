@@ -0,0 +1,234 @@
+"""
+Background Export Jobs
+Builds exports in a local worker pool, reports progress and caches finished artifacts on disk
+"""
+
+from flask import current_app
+from concurrent.futures import ThreadPoolExecutor
+from database import get_pool
+from counting import estimated_count
+from exporter import iter_batches
+import hashlib
+import json
+import os
+import re
+import tempfile
+import threading
+import time
+import uuid
+
+# Seconds between progress writes while a job is running
+PROGRESS_INTERVAL = 1.0
+
+JOB_ID_PATTERN = re.compile(r'[0-9a-f]{32}')
+
+
+def source_tables(query):
+    """Tables read by an export query (FROM / JOIN targets)"""
+    return sorted(set(re.findall(r'\b(?:FROM|JOIN)\s+([A-Za-z_][A-Za-z0-9_]*)', query, re.IGNORECASE)))
+
+
+def data_version(conn, tables):
+    """
+    Write counters of the source tables from pg_stat_user_tables.
+
+    They change on every committed insert/update/delete, so an unchanged
+    version means the export would produce the same file. The statistics
+    can lag a write by a moment.
+    """
+    cursor = conn.cursor()
+    try:
+        cursor.execute("SELECT pg_stat_clear_snapshot()")
+        cursor.execute("""
+            SELECT relname, n_tup_ins, n_tup_upd, n_tup_del
+            FROM pg_stat_user_tables
+            WHERE relname = ANY(%s) AND schemaname = ANY(current_schemas(false))
+            ORDER BY relname
+        """, (tables,))
+        return [list(row) for row in cursor.fetchall()]
+    finally:
+        cursor.close()
+
+
+class ExportJobs:
+    """
+    Export jobs run on a thread pool inside the worker process.
+
+    Job state is kept as JSON next to the artifacts, so status and download
+    requests can be answered by any gunicorn worker.
+    """
+
+    def __init__(self, app, directory, workers=2, ttl=3600):
+        self.app = app
+        self.directory = directory
+        self.workers = workers
+        self.ttl = ttl
+        self._executor = None
+        self._inflight = {}       # cache key -> job id
+        self._lock = threading.Lock()
+        os.makedirs(directory, exist_ok=True)
+
+    def _get_executor(self):
+        # Created on first use so the threads belong to the forked worker
+        with self._lock:
+            if self._executor is None:
+                self._executor = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix='export')
+            return self._executor
+
+    def _job_path(self, job_id):
+        return os.path.join(self.directory, f"job_{job_id}.json")
+
+    def _artifact_path(self, key, suffix):
+        return os.path.join(self.directory, f"artifact_{key}{suffix}")
+
+    def _write_json(self, path, data):
+        # Atomic replace so readers never see a half-written file
+        tmp = f"{path}.{uuid.uuid4().hex}.tmp"
+        with open(tmp, 'w', encoding='utf-8') as f:
+            json.dump(data, f)
+        os.replace(tmp, path)
+
+    def _read_json(self, path):
+        try:
+            with open(path, encoding='utf-8') as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return None
+
+    def _is_fresh(self, path):
+        return os.path.exists(path) and time.time() - os.path.getmtime(path) < self.ttl
+
+    def get(self, job_id):
+        """Job state, or None for unknown/expired ids"""
+        if not JOB_ID_PATTERN.fullmatch(job_id or ''):
+            return None
+        return self._read_json(self._job_path(job_id))
+
+    def artifact(self, job):
+        """Path of a finished job's file, or None once it has expired"""
+        path = job.get('file')
+        if job.get('status') != 'done' or not path or not self._is_fresh(path):
+            return None
+        return path
+
+    def purge(self):
+        """Delete jobs and artifacts older than the TTL"""
+        now = time.time()
+        for name in os.listdir(self.directory):
+            path = os.path.join(self.directory, name)
+            try:
+                if now - os.path.getmtime(path) > self.ttl:
+                    os.remove(path)
+            except OSError:
+                pass
+
+    def submit(self, conn, name, query, params, writer, suffix, mimetype, download_name):
+        """
+        Queue an export and return its job state.
+
+        writer(path, batches, progress=...) writes the file and returns the row
+        count. An identical export whose source tables have not changed reuses
+        the cached artifact (or the job already building it).
+        """
+        self.purge()
+        version = data_version(conn, source_tables(query))
+        key = hashlib.sha256(
+            json.dumps([name, suffix, query, params, version], default=str).encode('utf-8')
+        ).hexdigest()
+        artifact = self._artifact_path(key, suffix)
+
+        job = {
+            'id': uuid.uuid4().hex,
+            'name': name,
+            'status': 'queued',
+            'rows_written': 0,
+            'rows_estimate': None,
+            'download_name': download_name,
+            'mimetype': mimetype,
+            'file': artifact,
+            'cached': False,
+            'error': None,
+            'created_at': time.time(),
+            'finished_at': None
+        }
+
+        meta = self._read_json(f"{artifact}.json")
+        if meta and self._is_fresh(artifact):
+            job.update(status='done', cached=True, rows_written=meta['rows'], finished_at=time.time())
+            self._write_json(self._job_path(job['id']), job)
+            return job
+
+        # Checking for a running copy and registering this one happen under
+        # one lock, so identical concurrent requests start a single job
+        executor = self._get_executor()
+        with self._lock:
+            running = self._inflight.get(key)
+            if running:
+                current = self.get(running)
+                if current and current['status'] in ('queued', 'running'):
+                    return current
+            self._write_json(self._job_path(job['id']), job)
+            self._inflight[key] = job['id']
+        executor.submit(self._run, job, key, query, params, writer)
+        return job
+
+    def _run(self, job, key, query, params, writer):
+        pool = get_pool(self.app)
+        part = f"{job['file']}.{job['id']}.part"
+        conn = None
+        try:
+            conn = pool.getconn()
+            job['status'] = 'running'
+            cursor = conn.cursor()
+            job['rows_estimate'] = estimated_count(cursor, query, params)
+            cursor.close()
+            self._write_json(self._job_path(job['id']), job)
+
+            last_write = [time.monotonic()]
+
+            def progress(rows):
+                job['rows_written'] = rows
+                if time.monotonic() - last_write[0] >= PROGRESS_INTERVAL:
+                    self._write_json(self._job_path(job['id']), job)
+                    last_write[0] = time.monotonic()
+
+            rows = writer(part, iter_batches(conn, query, params), progress=progress)
+            os.replace(part, job['file'])
+            self._write_json(f"{job['file']}.json", {'rows': rows})
+            job.update(status='done', rows_written=rows)
+            self.app.logger.info("Export job %s (%s): %d rows", job['id'], job['name'], rows)
+
+        except Exception as e:
+            job.update(status='failed', error=str(e))
+            self.app.logger.exception("Export job %s (%s) failed", job['id'], job['name'])
+            if os.path.exists(part):
+                os.remove(part)
+        finally:
+            if conn is not None:
+                pool.putconn(conn)
+            job['finished_at'] = time.time()
+            self._write_json(self._job_path(job['id']), job)
+            with self._lock:
+                self._inflight.pop(key, None)
+
+
+def init_app(app):
+    """Register export job settings; the worker pool starts on first use"""
+    app.config.setdefault('EXPORT_DIR', os.path.join(tempfile.gettempdir(), 'mekan_exports'))
+    app.config.setdefault('EXPORT_WORKERS', 2)
+    app.config.setdefault('EXPORT_TTL', 3600)
+    app.extensions['export_jobs'] = ExportJobs(
+        app,
+        app.config['EXPORT_DIR'],
+        workers=int(app.config['EXPORT_WORKERS']),
+        ttl=float(app.config['EXPORT_TTL'])
+    )
+
+
+def get_export_jobs():
+    return current_app.extensions['export_jobs']
+
+
+def public_job(job):
+    """Job state as returned by the API (without the server-side path)"""
+    return {k: v for k, v in job.items() if k != 'file'}
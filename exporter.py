@@ -0,0 +1,331 @@
+"""
+Streaming Export Engine
+Reads query results in batches from a server-side cursor and writes Excel, CSV,
+Parquet or GeoJSONSeq with flat memory use
+"""
+
+from flask import Response, current_app, stream_with_context
+from decimal import Decimal
+from datetime import date, time, timedelta
+import csv
+import io
+import json
+import os
+import tempfile
+import uuid
+import xlsxwriter
+
+# Rows fetched per round-trip from the server-side cursor
+EXPORT_BATCH_SIZE = 2000
+
+# Column widths are estimated from the first rows only
+WIDTH_SAMPLE_ROWS = 500
+MAX_COLUMN_WIDTH = 50
+
+# Size of the chunks streamed back to the client
+STREAM_CHUNK_SIZE = 64 * 1024
+
+XLSX_MIMETYPE = 'application/vnd.openxmlformats-officedocument.spreadsheetml.sheet'
+
+
+def iter_batches(conn, query, params=None, batch_size=EXPORT_BATCH_SIZE):
+    """Yield (columns, rows) batches from a named (server-side) cursor; columns are cursor.description entries"""
+    cursor = conn.cursor(name=f"export_{uuid.uuid4().hex}")
+    cursor.itersize = batch_size
+    try:
+        cursor.execute(query, params)
+        while True:
+            rows = cursor.fetchmany(batch_size)
+            # The first batch is yielded even when empty so the header can be written
+            yield cursor.description, rows
+            if len(rows) < batch_size:
+                break
+    finally:
+        cursor.close()
+
+
+def is_geometry_column(name):
+    return 'geom' in name.lower()
+
+
+def kept_columns(columns):
+    """Indexes and names of the non-geometry columns"""
+    keep = [i for i, col in enumerate(columns) if not is_geometry_column(col.name)]
+    return keep, [columns[i].name for i in keep]
+
+
+def cell_value(value):
+    """Convert a database value to something xlsxwriter can write"""
+    if value is None or isinstance(value, (str, int, float, bool, date, time, timedelta)):
+        return value
+    if isinstance(value, Decimal):
+        return float(value)
+    return str(value)         # uuid, json, arrays, ...
+
+
+def column_widths(columns, rows):
+    """Widths from the header and a bounded sample of rows"""
+    widths = [len(col) for col in columns]
+    for row in rows[:WIDTH_SAMPLE_ROWS]:
+        for i, value in enumerate(row):
+            if value is not None:
+                widths[i] = max(widths[i], len(str(value)))
+    return [min(width + 2, MAX_COLUMN_WIDTH) for width in widths]
+
+
+def write_xlsx(path, batches, sheet_name='Data', header_format=None, progress=None):
+    """
+    Write (columns, rows) batches to an .xlsx file in constant memory.
+
+    Geometry columns are dropped. Returns the number of data rows written;
+    progress(rows_written) is called after every batch.
+    """
+    workbook = xlsxwriter.Workbook(path, {
+        'constant_memory': True,
+        'remove_timezone': True,
+        'default_date_format': 'yyyy-mm-dd hh:mm:ss'
+    })
+    worksheet = workbook.add_worksheet(sheet_name[:31])
+    header = workbook.add_format(header_format) if header_format else None
+
+    keep = None
+    row_num = 0
+    for columns, rows in batches:
+        if keep is None:
+            keep, names = kept_columns(columns)
+            sample = [[row[i] for i in keep] for row in rows[:WIDTH_SAMPLE_ROWS]]
+            for i, width in enumerate(column_widths(names, sample)):
+                worksheet.set_column(i, i, width)
+            worksheet.write_row(0, 0, names, header)
+
+        for row in rows:
+            row_num += 1
+            worksheet.write_row(row_num, 0, [cell_value(row[i]) for i in keep])
+        if progress:
+            progress(row_num)
+
+    workbook.close()
+    return row_num
+
+
+# ============= CSV =============
+def csv_value(value):
+    if value is None:
+        return ''
+    if isinstance(value, (date, time)):
+        return value.isoformat()
+    if isinstance(value, (dict, list)):
+        return json.dumps(value, default=str)
+    return value
+
+
+def csv_chunks(batches, progress=None):
+    """Yield UTF-8 CSV text, one chunk per batch (header first)"""
+    keep = None
+    row_num = 0
+    for columns, rows in batches:
+        buffer = io.StringIO()
+        writer = csv.writer(buffer)
+        if keep is None:
+            keep, names = kept_columns(columns)
+            writer.writerow(names)
+        for row in rows:
+            writer.writerow([csv_value(row[i]) for i in keep])
+        row_num += len(rows)
+        if progress:
+            progress(row_num)
+        yield buffer.getvalue().encode('utf-8')
+
+
+# ============= GEOJSONSEQ =============
+# Export queries for this format carry the geometry as GeoJSON text in this column
+GEOJSON_COLUMN = 'geojson'
+
+
+def geojsonseq_chunks(batches, progress=None):
+    """Yield newline-delimited GeoJSON Features, one chunk per batch"""
+    keep = None
+    row_num = 0
+    for columns, rows in batches:
+        if keep is None:
+            keep, names = kept_columns(columns)
+            names_index = dict(zip(names, keep))
+            geojson_at = names_index.pop(GEOJSON_COLUMN, None)
+        lines = []
+        for row in rows:
+            geometry = row[geojson_at] if geojson_at is not None else None
+            lines.append(json.dumps({
+                'type': 'Feature',
+                'geometry': json.loads(geometry) if geometry else None,
+                'properties': {name: row[i] for name, i in names_index.items()}
+            }, default=str))
+        row_num += len(rows)
+        if progress:
+            progress(row_num)
+        if lines:
+            yield ('\n'.join(lines) + '\n').encode('utf-8')
+
+
+def write_chunks(chunks):
+    """Turn a chunk generator into a writer(path, batches, progress) that returns the row count"""
+    def writer(path, batches, progress=None):
+        counted = [0]
+
+        def track(rows):
+            counted[0] = rows
+            if progress:
+                progress(rows)
+
+        with open(path, 'wb') as f:
+            for chunk in chunks(batches, track):
+                f.write(chunk)
+        return counted[0]
+    return writer
+
+
+# ============= PARQUET =============
+# PostgreSQL type OID -> Arrow type name; anything else is written as text
+PG_ARROW_TYPES = {
+    16: 'bool',
+    20: 'int64',
+    21: 'int16',
+    23: 'int32',
+    700: 'float32',
+    701: 'float64',
+    1700: 'float64',
+    1082: 'date32',
+    1114: 'timestamp',
+    1184: 'timestamptz'
+}
+
+
+def arrow_type(pa, type_code):
+    name = PG_ARROW_TYPES.get(type_code, 'string')
+    if name == 'timestamp':
+        return pa.timestamp('us')
+    if name == 'timestamptz':
+        return pa.timestamp('us', tz='UTC')
+    return getattr(pa, name)()
+
+
+def parquet_value(value, is_text):
+    if value is None:
+        return None
+    if isinstance(value, Decimal):
+        return float(value)
+    if is_text and not isinstance(value, str):
+        return json.dumps(value, default=str) if isinstance(value, (dict, list)) else str(value)
+    return value
+
+
+def write_parquet(path, batches, progress=None):
+    """Write each batch as an Arrow record batch; the schema comes from the column types"""
+    # Imported here so workers that never export Parquet don't load Arrow
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+
+    writer = None
+    row_num = 0
+    try:
+        for columns, rows in batches:
+            if writer is None:
+                keep, names = kept_columns(columns)
+                schema = pa.schema([(columns[i].name, arrow_type(pa, columns[i].type_code)) for i in keep])
+                text = [field.type == pa.string() for field in schema]
+                writer = pq.ParquetWriter(path, schema, compression='snappy')
+            arrays = [
+                pa.array([parquet_value(row[i], text[n]) for row in rows], type=schema.field(n).type)
+                for n, i in enumerate(keep)
+            ]
+            writer.write_batch(pa.record_batch(arrays, schema=schema))
+            row_num += len(rows)
+            if progress:
+                progress(row_num)
+    finally:
+        if writer is not None:
+            writer.close()
+    return row_num
+
+
+# ============= FORMATS =============
+# Format -> file suffix, mimetype, file writer(path, batches, progress) and,
+# for text formats, a chunk generator that can be streamed without a file
+EXPORT_FORMATS = {
+    'excel': {'suffix': '.xlsx', 'mimetype': XLSX_MIMETYPE, 'writer': write_xlsx, 'chunks': None},
+    'csv': {'suffix': '.csv', 'mimetype': 'text/csv', 'writer': write_chunks(csv_chunks), 'chunks': csv_chunks},
+    'parquet': {'suffix': '.parquet', 'mimetype': 'application/vnd.apache.parquet',
+                'writer': write_parquet, 'chunks': None},
+    'geojsonseq': {'suffix': '.geojsonl', 'mimetype': 'application/geo+json-seq',
+                   'writer': write_chunks(geojsonseq_chunks), 'chunks': geojsonseq_chunks}
+}
+
+
+def temp_export_path(suffix):
+    fd, path = tempfile.mkstemp(prefix='mekan_export_', suffix=suffix)
+    os.close(fd)
+    return path
+
+
+def stream_file(path, mimetype, download_name, delete=True):
+    """Chunked response for a file on disk, removed once fully sent if delete=True"""
+    def generate():
+        try:
+            with open(path, 'rb') as f:
+                while True:
+                    chunk = f.read(STREAM_CHUNK_SIZE)
+                    if not chunk:
+                        break
+                    yield chunk
+        finally:
+            if delete:
+                os.remove(path)
+
+    return Response(generate(), mimetype=mimetype, headers={
+        'Content-Disposition': f'attachment; filename="{download_name}"',
+        'Content-Length': str(os.path.getsize(path))
+    })
+
+
+def xlsx_response(conn, query, params, sheet_name, download_name, header_format=None):
+    """Build an .xlsx export on disk with flat memory use and stream it back"""
+    path = temp_export_path('.xlsx')
+    try:
+        rows = write_xlsx(path, iter_batches(conn, query, params), sheet_name, header_format)
+    except Exception:
+        os.remove(path)
+        raise
+    current_app.logger.info("Excel export %s: %d rows, %d bytes", download_name, rows, os.path.getsize(path))
+    return stream_file(path, XLSX_MIMETYPE, download_name)
+
+
+def export_response(conn, query, params, fmt, download_name):
+    """
+    Export response for any EXPORT_FORMATS entry.
+
+    Text formats are generated row batch by row batch while the response is
+    sent; binary formats are built in a temporary file first.
+    """
+    spec = EXPORT_FORMATS[fmt]
+    if spec['chunks'] is None:
+        path = temp_export_path(spec['suffix'])
+        try:
+            spec['writer'](path, iter_batches(conn, query, params))
+        except Exception:
+            os.remove(path)
+            raise
+        return stream_file(path, spec['mimetype'], download_name)
+
+    # The first chunk is produced here so query errors still become a 500 response
+    chunks = spec['chunks'](iter_batches(conn, query, params))
+    first = next(chunks, b'')
+
+    def generate():
+        yield first
+        yield from chunks
+
+    # Keep the app context (and its pooled connection) alive while streaming
+    return Response(
+        stream_with_context(generate()),
+        mimetype=spec['mimetype'],
+        headers={'Content-Disposition': f'attachment; filename="{download_name}"'}
+    )
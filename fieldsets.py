@@ -0,0 +1,132 @@
+"""
+Sparse Fieldsets
+?fields= and ?geometry= for the list endpoints: project only the requested columns
+"""
+
+from schema_registry import geometry_select, GEOMETRY_COLUMNS, GEOMETRY_4326_COLUMN
+from search import TSV_COLUMN
+
+GEOMETRY_MODES = ('none', 'bbox', 'full')
+
+# Internal columns never returned as record fields (use these lists instead of SELECT *)
+HIDDEN_COLUMNS = frozenset({GEOMETRY_4326_COLUMN, TSV_COLUMN})
+
+# Record fields for JSON and PDF sheets: the raw geometry is left out too
+# (it is returned as GeoJSON/bbox instead)
+RECORD_EXCLUDED = HIDDEN_COLUMNS | frozenset(GEOMETRY_COLUMNS)
+
+# Table -> response field -> column of that table. Fields whose column does
+# not exist on this schema are left out of the projection.
+LIST_FIELDS = {
+    'strat_unit': {
+        'su_uuid': 'su_uuid', 'mekan_no': 'mekan_no', 'mekan_year': 'mekan_year', 'mekan_alan': 'mekan_alan',
+        'mekan_acma': 'mekan_acma', 'mekan_type': 'mekan_type', 'mekan_plankare': 'mekan_plankare',
+        'mekan_tabaka': 'mekan_tabaka', 'description': 'description', 'description_tr': 'description_tr',
+        'koordinat_x': 'mekan_koordinat_x', 'koordinat_y': 'mekan_koordinat_y', 'koordinat_z': 'mekan_koordinat_z',
+        'created_at': 'created_at'
+    },
+    'mekan_birin': {
+        'birin_uuid': 'birin_uuid', 'su_uuid': 'su_uuid', 'birin_no': 'birin_no', 'birin_type': 'birin_type',
+        'description': 'description', 'description_tr': 'description_tr', 'koordinat_x': 'koordinat_x',
+        'koordinat_y': 'koordinat_y', 'koordinat_z': 'koordinat_z', 'dimensions': 'dimensions',
+        'preservation_state': 'preservation_state', 'created_at': 'created_at'
+    },
+    'mekan_wall': {
+        'wall_uuid': 'wall_uuid', 'wall_no': 'wall_no', 'wall_year': 'wall_year', 'wall_alan': 'wall_alan',
+        'wall_acma': 'wall_acma', 'wall_type': 'wall_type', 'description': 'description',
+        'description_tr': 'description_tr', 'wall_thickness_cm': 'wall_thickness_cm',
+        'wall_height_cm': 'wall_height_cm', 'wall_length_m': 'wall_length_m',
+        'construction_technique': 'construction_technique', 'material': 'material',
+        'preservation_state': 'preservation_state', 'created_at': 'created_at'
+    },
+    'mekan_grave': {
+        'grave_uuid': 'grave_uuid', 'su_uuid': 'su_uuid', 'grave_no': 'grave_no', 'grave_year': 'grave_year',
+        'grave_alan': 'grave_alan', 'grave_acma': 'grave_acma', 'grave_type': 'grave_type',
+        'grave_subtype': 'grave_subtype', 'description': 'description', 'description_tr': 'description_tr',
+        'individual_count': 'individual_count', 'burial_type': 'burial_type', 'orientation': 'orientation',
+        'preservation_state': 'preservation_state', 'grave_goods': 'grave_goods', 'created_at': 'created_at'
+    },
+    'mekan_buluntu': {
+        'id': 'id', 'bul_uuid': 'bul_uuid', 'buluntu_uuid': 'buluntu_uuid', 'su_uuid': 'su_uuid',
+        'birin_uuid': 'birin_uuid', 'bul_no': 'bul_no', 'buluntu_no': 'buluntu_no', 'malzemesi': 'malzemesi',
+        'sayisi': 'sayisi', 'agirlik': 'agirlik', 'aciklama': 'aciklama', 'created_at': 'created_at'
+    },
+    'finds': {
+        'id': 'id', 'find_id': 'find_id', 'find_uuid': 'find_uuid', 'su_uuid': 'su_uuid',
+        'find_number': 'find_number', 'material_type': 'material_type', 'material_type_tr': 'material_type_tr',
+        'description': 'description', 'description_tr': 'description_tr', 'quantity': 'quantity',
+        'weight_g': 'weight_g', 'dimensions': 'dimensions', 'preservation_state': 'preservation_state',
+        'discovery_date': 'discovery_date', 'registered_by': 'registered_by', 'created_at': 'created_at'
+    }
+}
+
+
+class FieldsetError(ValueError):
+    """Invalid ?fields= or ?geometry= values (answered with 400)"""
+
+
+def parse_geometry(value):
+    """?geometry= mode; 'full' when absent"""
+    mode = value or 'full'
+    if mode not in GEOMETRY_MODES:
+        raise FieldsetError(f"Invalid geometry, use one of: {', '.join(GEOMETRY_MODES)}")
+    return mode
+
+
+def geometry_projection(alias, table, mode, schema, as_json=False):
+    """
+    Select-list entry for a geometry mode: full GeoJSON as `geometry`, the
+    [xmin, ymin, xmax, ymax] extent as `bbox`, or None for 'none'
+    """
+    if mode == 'none':
+        return None
+    if mode == 'full':
+        return geometry_select(alias, table, schema, as_json)
+    column = schema.geometry_column(table)
+    if column is None:
+        return "NULL as bbox"
+    geom = f"{alias}.{column}"
+    return (f"CASE WHEN {geom} IS NULL THEN NULL ELSE "
+            f"json_build_array(ST_XMin({geom}), ST_YMin({geom}), ST_XMax({geom}), ST_YMax({geom})) END as bbox")
+
+
+def record_columns(alias, table, schema, excluded=HIDDEN_COLUMNS):
+    """`alias.column` for every column of `table` except `excluded`, in table order"""
+    return [f"{alias}.{column}" for column in schema.column_list(table) if column not in excluded]
+
+
+def projection(args, alias, table, schema, default, joined=None, required=(), as_json=False):
+    """
+    SELECT list for ?fields= / ?geometry= on a list query over `table`.
+
+    Without ?fields= the endpoint's `default` entries are kept. Otherwise
+    only the requested fields are selected, plus `required` (sort and media
+    keys the handler needs). `joined` maps extra field names to expressions
+    from joined tables (e.g. the parent mekan_no).
+    """
+    joined = joined or {}
+    columns = LIST_FIELDS[table]
+    mode = parse_geometry(args.get('geometry'))
+
+    value = args.get('fields')
+    if value:
+        names = [name.strip() for name in value.split(',') if name.strip()]
+        unknown = [name for name in names if name not in columns and name not in joined]
+        if unknown:
+            raise FieldsetError(
+                f"Unknown fields: {', '.join(unknown)}; available: {', '.join(list(columns) + list(joined))}"
+            )
+        entries = []
+        for name in list(required) + [name for name in names if name not in required]:
+            if name in joined:
+                entries.append(f"{joined[name]} as {name}")
+            elif schema.has_column(table, columns[name]):
+                column = columns[name]
+                entries.append(f"{alias}.{column}" if column == name else f"{alias}.{column} as {name}")
+    else:
+        entries = list(default)
+
+    geometry = geometry_projection(alias, table, mode, schema, as_json)
+    if geometry:
+        entries.append(geometry)
+    return ",\n                ".join(entries)
@@ -0,0 +1,49 @@
+"""
+Geometry Backfill
+Fills the maintained geom_4326 columns in batches, one transaction per batch
+"""
+
+from schema_registry import GEOMETRY_4326_COLUMN
+
+BACKFILL_BATCH_SIZE = 5000
+
+# Tables with a geom_4326 column (migrations/006_geometry_4326.sql)
+GEOMETRY_TABLES = ('strat_unit', 'mekan_birin', 'mekan_wall', 'mekan_grave', 'mekan_buluntu', 'finds')
+
+
+def backfill(conn, schema, batch_size=BACKFILL_BATCH_SIZE, log=print):
+    """Transform the rows whose geom_4326 is still NULL; returns {table: rows updated}"""
+    updated = {}
+    cursor = conn.cursor()
+    try:
+        for table in GEOMETRY_TABLES:
+            column = schema.geometry_column(table)
+            if column is None or not schema.geometry_4326_column(table):
+                continue
+
+            # Only geom_4326 is set: the tile invalidation and relationship summary
+            # row triggers fire on geometry/link column updates only (migrations 008
+            # and 009), so a batch neither drops cached tiles nor recounts MEKAN
+            total = 0
+            while True:
+                cursor.execute(f"""
+                    UPDATE {table} SET {GEOMETRY_4326_COLUMN} = ST_Transform({column}, 4326)
+                    WHERE ctid = ANY(ARRAY(
+                        SELECT ctid FROM {table}
+                        WHERE {GEOMETRY_4326_COLUMN} IS NULL
+                          AND {column} IS NOT NULL AND ST_SRID({column}) <> 0
+                        LIMIT %s
+                    ))
+                """, (batch_size,))
+                conn.commit()
+                total += cursor.rowcount
+                if cursor.rowcount < batch_size:
+                    break
+            updated[table] = total
+            log(f"{table}: {total} geometries transformed to EPSG:4326")
+        return updated
+    except Exception:
+        conn.rollback()
+        raise
+    finally:
+        cursor.close()
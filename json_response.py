@@ -0,0 +1,114 @@
+"""
+JSON Response Encoding
+Flask JSON provider with a pluggable fast encoder (orjson when installed) and raw JSON passthrough
+"""
+
+from flask.json.provider import DefaultJSONProvider
+from werkzeug.http import http_date
+from datetime import date
+from decimal import Decimal
+import dataclasses
+import json
+import re
+import uuid
+
+try:
+    import orjson
+except ImportError:           # optional: the stdlib encoder is used instead
+    orjson = None
+if orjson is not None and not hasattr(orjson, 'Fragment'):
+    orjson = None             # raw passthrough needs orjson >= 3.9
+
+
+class RawJSON(str):
+    """Text that is already JSON (e.g. ST_AsGeoJSON output), written into responses as-is"""
+
+
+# Set by init_app(); raw_json() builds the marker the active encoder understands
+_use_orjson = orjson is not None
+
+
+def raw_json(text):
+    """Mark PostGIS/PostgreSQL JSON text for passthrough instead of json.loads()"""
+    if text is None:
+        return None
+    if _use_orjson:
+        return orjson.Fragment(text)
+    return RawJSON(text)
+
+
+def default(value):
+    """Types the encoders don't handle natively; same wire format as Flask's default provider"""
+    if isinstance(value, date):
+        return http_date(value)
+    if isinstance(value, (Decimal, uuid.UUID)):
+        return str(value)
+    if dataclasses.is_dataclass(value):
+        return dataclasses.asdict(value)
+    if hasattr(value, '__html__'):
+        return str(value.__html__())
+    raise TypeError(f"Object of type {type(value).__name__} is not JSON serializable")
+
+
+# ============= ENCODERS =============
+def dumps_orjson(obj):
+    # Datetimes go through default() so dates keep Flask's HTTP-date format
+    return orjson.dumps(
+        obj, default=default, option=orjson.OPT_PASSTHROUGH_DATETIME | orjson.OPT_NON_STR_KEYS
+    ).decode('utf-8')
+
+
+def _mark_raw(obj, raws):
+    """Copy of obj with RawJSON values replaced by placeholder strings"""
+    if isinstance(obj, RawJSON):
+        raws.append(str(obj))
+        return f"\x00raw{len(raws) - 1}\x00"
+    if isinstance(obj, dict):
+        return {key: _mark_raw(value, raws) for key, value in obj.items()}
+    if isinstance(obj, (list, tuple)):
+        return [_mark_raw(value, raws) for value in obj]
+    return obj
+
+
+RAW_PLACEHOLDER = re.compile(r'"\\u0000raw(\d+)\\u0000"')
+
+
+def dumps_stdlib(obj):
+    raws = []
+    text = json.dumps(_mark_raw(obj, raws), default=default, ensure_ascii=False, separators=(',', ':'))
+    if raws:
+        text = RAW_PLACEHOLDER.sub(lambda m: raws[int(m.group(1))], text)
+    return text
+
+
+ENCODERS = {
+    'orjson': dumps_orjson,
+    'json': dumps_stdlib
+}
+
+
+class FastJSONProvider(DefaultJSONProvider):
+    """jsonify() and response bodies through the configured encoder"""
+
+    encoder = staticmethod(dumps_stdlib)
+
+    def dumps(self, obj, **kwargs):
+        # Formatting options (indent in debug mode, separators) are ignored: output is always compact
+        return self.encoder(obj)
+
+
+def init_app(app):
+    """Install the provider; JSON_ENCODER is 'auto' (orjson if installed), 'orjson' or 'json'"""
+    global _use_orjson
+    app.config.setdefault('JSON_ENCODER', 'auto')
+    name = app.config['JSON_ENCODER']
+    if name == 'auto':
+        name = 'orjson' if orjson is not None else 'json'
+    if name == 'orjson' and orjson is None:
+        raise RuntimeError("JSON_ENCODER=orjson but orjson is not installed")
+
+    _use_orjson = name == 'orjson'
+    provider = FastJSONProvider(app)
+    provider.encoder = ENCODERS[name]
+    app.json = provider
+    app.logger.info("JSON encoder: %s", name)
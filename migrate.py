@@ -0,0 +1,58 @@
+"""
+Database Migrations
+Applies the numbered SQL files in migrations/ once each, in order
+"""
+
+import os
+
+MIGRATIONS_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'migrations')
+
+
+def migration_files():
+    """Sorted (version, path) pairs for every migrations/NNN_name.sql file"""
+    files = []
+    for name in sorted(os.listdir(MIGRATIONS_DIR)):
+        if name.endswith('.sql'):
+            files.append((name[:-len('.sql')], os.path.join(MIGRATIONS_DIR, name)))
+    return files
+
+
+def applied_versions(conn):
+    cursor = conn.cursor()
+    try:
+        cursor.execute("""
+            CREATE TABLE IF NOT EXISTS schema_migrations (
+                version TEXT PRIMARY KEY,
+                applied_at TIMESTAMPTZ NOT NULL DEFAULT NOW()
+            )
+        """)
+        conn.commit()
+        cursor.execute("SELECT version FROM schema_migrations")
+        return {row[0] for row in cursor.fetchall()}
+    finally:
+        cursor.close()
+
+
+def apply_migrations(conn, log=print):
+    """Apply pending migrations, each in its own transaction; returns the versions applied"""
+    done = applied_versions(conn)
+    applied = []
+    for version, path in migration_files():
+        if version in done:
+            continue
+        with open(path, encoding='utf-8') as f:
+            sql = f.read()
+
+        cursor = conn.cursor()
+        try:
+            log(f"Applying {version}...")
+            cursor.execute(sql)
+            cursor.execute("INSERT INTO schema_migrations (version) VALUES (%s)", (version,))
+            conn.commit()
+            applied.append(version)
+        except Exception:
+            conn.rollback()
+            raise
+        finally:
+            cursor.close()
+    return applied
@@ -0,0 +1,89 @@
+-- Search indexes for the `search` parameter of the list endpoints.
+--
+-- * pg_trgm GIN indexes so `col ILIKE '%term%'` (and `id::text ILIKE ...`)
+--   can use an index instead of a sequential scan.
+-- * A generated `search_tsv` column (English description + Turkish
+--   description_tr / aciklama) with a GIN index for full-text matches.
+--
+-- Tables and columns that do not exist in this database are skipped, so the
+-- same file works with either mekan_buluntu or finds.
+
+CREATE EXTENSION IF NOT EXISTS pg_trgm;
+
+CREATE FUNCTION pg_temp.column_exists(tbl text, col text) RETURNS boolean AS $$
+    SELECT EXISTS (
+        SELECT 1 FROM information_schema.columns
+        WHERE table_schema = current_schema() AND table_name = tbl AND column_name = col
+    )
+$$ LANGUAGE sql STABLE;
+
+-- ============= TRIGRAM INDEXES =============
+DO $$
+DECLARE
+    t record;
+BEGIN
+    FOR t IN SELECT * FROM (VALUES
+        ('strat_unit',    'mekan_no',      '(mekan_no::text)',    'mekan_no_text'),
+        ('strat_unit',    'description',   '(description)',       'description'),
+        ('strat_unit',    'mekan_alan',    '(mekan_alan)',        'mekan_alan'),
+        ('mekan_birin',   'birin_no',      '(birin_no::text)',    'birin_no_text'),
+        ('mekan_birin',   'description',   '(description)',       'description'),
+        ('mekan_birin',   'birin_type',    '(birin_type)',        'birin_type'),
+        ('mekan_wall',    'wall_no',       '(wall_no::text)',     'wall_no_text'),
+        ('mekan_wall',    'description',   '(description)',       'description'),
+        ('mekan_wall',    'wall_type',     '(wall_type)',         'wall_type'),
+        ('mekan_grave',   'grave_no',      '(grave_no::text)',    'grave_no_text'),
+        ('mekan_grave',   'description',   '(description)',       'description'),
+        ('mekan_grave',   'grave_type',    '(grave_type)',        'grave_type'),
+        ('mekan_buluntu', 'aciklama',      '(aciklama)',          'aciklama'),
+        ('mekan_buluntu', 'malzemesi',     '(malzemesi)',         'malzemesi'),
+        ('finds',         'find_number',   '(find_number::text)', 'find_number_text'),
+        ('finds',         'description',   '(description)',       'description'),
+        ('finds',         'material_type', '(material_type)',     'material_type')
+    ) AS v(table_name, column_name, expression, suffix)
+    LOOP
+        CONTINUE WHEN NOT pg_temp.column_exists(t.table_name, t.column_name);
+        EXECUTE format(
+            'CREATE INDEX IF NOT EXISTS %I ON %I USING gin (%s gin_trgm_ops)',
+            t.table_name || '_' || t.suffix || '_trgm', t.table_name, t.expression
+        );
+    END LOOP;
+END $$;
+
+-- ============= FULL-TEXT COLUMNS =============
+DO $$
+DECLARE
+    t record;
+    expr text;
+BEGIN
+    FOR t IN SELECT * FROM (VALUES
+        ('strat_unit',    'description', 'description_tr'),
+        ('mekan_birin',   'description', 'description_tr'),
+        ('mekan_wall',    'description', 'description_tr'),
+        ('mekan_grave',   'description', 'description_tr'),
+        ('finds',         'description', 'description_tr'),
+        ('mekan_buluntu', NULL,          'aciklama')
+    ) AS v(table_name, english_column, turkish_column)
+    LOOP
+        CONTINUE WHEN to_regclass(t.table_name) IS NULL;
+        CONTINUE WHEN pg_temp.column_exists(t.table_name, 'search_tsv');
+
+        expr := NULL;
+        IF t.english_column IS NOT NULL AND pg_temp.column_exists(t.table_name, t.english_column) THEN
+            expr := format('to_tsvector(''english'', coalesce(%I, ''''))', t.english_column);
+        END IF;
+        IF pg_temp.column_exists(t.table_name, t.turkish_column) THEN
+            expr := concat_ws(' || ', expr, format('to_tsvector(''turkish'', coalesce(%I, ''''))', t.turkish_column));
+        END IF;
+        CONTINUE WHEN expr IS NULL;
+
+        EXECUTE format(
+            'ALTER TABLE %I ADD COLUMN search_tsv tsvector GENERATED ALWAYS AS (%s) STORED',
+            t.table_name, expr
+        );
+        EXECUTE format(
+            'CREATE INDEX IF NOT EXISTS %I ON %I USING gin (search_tsv)',
+            t.table_name || '_search_tsv_idx', t.table_name
+        );
+    END LOOP;
+END $$;
@@ -0,0 +1,19 @@
+-- Denormalized search documents for the global /api/v3/search endpoint.
+--
+-- One row per MEKAN, birim, wall, grave, find and media file with a display
+-- title/subtitle and a weighted tsvector (A: title, B: subtitle,
+-- C: English/Turkish descriptions). Rows are written by the triggers and the
+-- rebuild in search_index.py (flask --app app search-index).
+
+CREATE TABLE IF NOT EXISTS search_documents (
+    entity_type TEXT NOT NULL,
+    entity_id TEXT NOT NULL,
+    title TEXT NOT NULL,
+    subtitle TEXT,
+    document TSVECTOR NOT NULL,
+    updated_at TIMESTAMPTZ NOT NULL DEFAULT NOW(),
+    PRIMARY KEY (entity_type, entity_id)
+);
+
+CREATE INDEX IF NOT EXISTS search_documents_document_idx
+    ON search_documents USING gin (document);
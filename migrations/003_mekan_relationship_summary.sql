@@ -0,0 +1,174 @@
+-- Per-MEKAN relationship counts (birim, walls, graves, finds).
+--
+-- Row triggers on strat_unit and the child tables recount only the MEKAN a
+-- change touches, so relationship lookups and "sort by number of finds" read
+-- this table instead of re-scanning four tables. `flask --app app
+-- reconcile-relationships` rebuilds it from scratch and reports any drift.
+
+CREATE TABLE IF NOT EXISTS mekan_relationship_summary (
+    mekan_no INTEGER PRIMARY KEY,
+    birim_count INTEGER NOT NULL DEFAULT 0,
+    wall_count INTEGER NOT NULL DEFAULT 0,
+    grave_count INTEGER NOT NULL DEFAULT 0,
+    find_count INTEGER NOT NULL DEFAULT 0,
+    updated_at TIMESTAMPTZ NOT NULL DEFAULT NOW()
+);
+
+CREATE INDEX IF NOT EXISTS mekan_relationship_summary_find_count_idx
+    ON mekan_relationship_summary (find_count DESC, mekan_no);
+
+-- ============= REFRESH =============
+-- Recount the given MEKAN (same rules as enrichment.relationship_counts)
+-- and drop summary rows whose MEKAN no longer exists.
+CREATE OR REPLACE FUNCTION mekan_relationship_summary_refresh(mekan_nos INTEGER[]) RETURNS void AS $$
+DECLARE
+    finds_table TEXT := CASE WHEN to_regclass('mekan_buluntu') IS NULL THEN 'finds' ELSE 'mekan_buluntu' END;
+BEGIN
+    mekan_nos := ARRAY(SELECT DISTINCT n FROM unnest(mekan_nos) n WHERE n IS NOT NULL);
+    IF cardinality(mekan_nos) = 0 THEN
+        RETURN;
+    END IF;
+
+    DELETE FROM mekan_relationship_summary rs
+    WHERE rs.mekan_no = ANY(mekan_nos)
+      AND NOT EXISTS (SELECT 1 FROM strat_unit s WHERE s.mekan_no = rs.mekan_no);
+
+    EXECUTE format($sql$
+        INSERT INTO mekan_relationship_summary (mekan_no, birim_count, wall_count, grave_count, find_count)
+        WITH m AS (
+            SELECT DISTINCT ON (mekan_no) mekan_no, mekan_year, mekan_alan
+            FROM strat_unit
+            WHERE mekan_no = ANY($1)
+            ORDER BY mekan_no, su_uuid
+        ),
+        birim_counts AS (
+            SELECT s.mekan_no, COUNT(*) AS n
+            FROM mekan_birin b
+            JOIN strat_unit s ON b.su_uuid = s.su_uuid
+            WHERE s.mekan_no = ANY($1)
+            GROUP BY s.mekan_no
+        ),
+        find_counts AS (
+            SELECT s.mekan_no, COUNT(*) AS n
+            FROM %I f
+            JOIN strat_unit s ON f.su_uuid = s.su_uuid
+            WHERE s.mekan_no = ANY($1)
+            GROUP BY s.mekan_no
+        ),
+        wall_counts AS (
+            SELECT wall_year, wall_alan, COUNT(*) AS n
+            FROM mekan_wall
+            WHERE (wall_year, wall_alan) IN (SELECT mekan_year, mekan_alan FROM m)
+            GROUP BY wall_year, wall_alan
+        ),
+        grave_counts AS (
+            SELECT grave_year, grave_alan, COUNT(*) AS n
+            FROM mekan_grave
+            WHERE (grave_year, grave_alan) IN (SELECT mekan_year, mekan_alan FROM m)
+            GROUP BY grave_year, grave_alan
+        )
+        SELECT
+            m.mekan_no,
+            COALESCE(birim_counts.n, 0),
+            COALESCE(wall_counts.n, 0),
+            COALESCE(grave_counts.n, 0),
+            COALESCE(find_counts.n, 0)
+        FROM m
+        LEFT JOIN birim_counts ON birim_counts.mekan_no = m.mekan_no
+        LEFT JOIN find_counts ON find_counts.mekan_no = m.mekan_no
+        LEFT JOIN wall_counts ON wall_counts.wall_year = m.mekan_year AND wall_counts.wall_alan = m.mekan_alan
+        LEFT JOIN grave_counts ON grave_counts.grave_year = m.mekan_year AND grave_counts.grave_alan = m.mekan_alan
+        ON CONFLICT (mekan_no) DO UPDATE SET
+            birim_count = EXCLUDED.birim_count,
+            wall_count = EXCLUDED.wall_count,
+            grave_count = EXCLUDED.grave_count,
+            find_count = EXCLUDED.find_count,
+            updated_at = NOW()
+    $sql$, finds_table) USING mekan_nos;
+END
+$$ LANGUAGE plpgsql;
+
+-- ============= TRIGGERS =============
+-- TG_ARGV[0] says how a changed row maps to MEKAN:
+--   'mekan'             - the strat_unit row itself
+--   'su_uuid'           - birim/finds linked through su_uuid
+--   'area', year, alan  - walls/graves linked through their year/alan columns
+-- Both the OLD and NEW MEKAN are recounted, so moves between MEKAN are covered.
+CREATE OR REPLACE FUNCTION mekan_relationship_summary_sync() RETURNS trigger AS $$
+DECLARE
+    lookup TEXT;
+    ids INTEGER[];
+    affected INTEGER[] := '{}';
+BEGIN
+    lookup := CASE TG_ARGV[0]
+        WHEN 'mekan' THEN 'SELECT ARRAY[($1).mekan_no]'
+        WHEN 'su_uuid' THEN 'SELECT ARRAY(SELECT mekan_no FROM strat_unit WHERE su_uuid = ($1).su_uuid)'
+        ELSE format(
+            'SELECT ARRAY(SELECT mekan_no FROM strat_unit WHERE mekan_year = ($1).%I AND mekan_alan = ($1).%I)',
+            TG_ARGV[1], TG_ARGV[2]
+        )
+    END;
+
+    IF TG_OP <> 'INSERT' THEN
+        EXECUTE lookup INTO ids USING OLD;
+        affected := affected || ids;
+    END IF;
+    IF TG_OP <> 'DELETE' THEN
+        EXECUTE lookup INTO ids USING NEW;
+        affected := affected || ids;
+    END IF;
+
+    PERFORM mekan_relationship_summary_refresh(affected);
+    RETURN NULL;
+END
+$$ LANGUAGE plpgsql;
+
+-- Inserts and deletes always recount; updates only when a column linking
+-- the row to its MEKAN changes (the WHEN clause skips no-op SETs).
+DO $$
+DECLARE
+    t record;
+BEGIN
+    FOR t IN SELECT * FROM (VALUES
+        ('strat_unit',    'mekan',   NULL::text,   NULL::text,   ARRAY['mekan_no', 'su_uuid', 'mekan_year', 'mekan_alan']),
+        ('mekan_birin',   'su_uuid', NULL,         NULL,         ARRAY['su_uuid']),
+        ('mekan_buluntu', 'su_uuid', NULL,         NULL,         ARRAY['su_uuid']),
+        ('finds',         'su_uuid', NULL,         NULL,         ARRAY['su_uuid']),
+        ('mekan_wall',    'area',    'wall_year',  'wall_alan',  ARRAY['wall_year', 'wall_alan']),
+        ('mekan_grave',   'area',    'grave_year', 'grave_alan', ARRAY['grave_year', 'grave_alan'])
+    ) AS v(table_name, link, year_column, alan_column, link_columns)
+    LOOP
+        CONTINUE WHEN to_regclass(t.table_name) IS NULL;
+        EXECUTE format('DROP TRIGGER IF EXISTS mekan_relationship_summary_sync ON %I', t.table_name);
+        EXECUTE format('DROP TRIGGER IF EXISTS mekan_relationship_summary_sync_update ON %I', t.table_name);
+        CONTINUE WHEN (
+            SELECT COUNT(*) FROM information_schema.columns
+            WHERE table_schema = current_schema() AND table_name = t.table_name
+              AND column_name = ANY(t.link_columns)
+        ) < cardinality(t.link_columns);
+
+        EXECUTE format(
+            'CREATE TRIGGER mekan_relationship_summary_sync
+             AFTER INSERT OR DELETE ON %I
+             FOR EACH ROW EXECUTE FUNCTION mekan_relationship_summary_sync(%L, %L, %L)',
+            t.table_name, t.link, coalesce(t.year_column, ''), coalesce(t.alan_column, '')
+        );
+        EXECUTE format(
+            'CREATE TRIGGER mekan_relationship_summary_sync_update
+             AFTER UPDATE OF %s ON %I
+             FOR EACH ROW
+             WHEN ((%s) IS DISTINCT FROM (%s))
+             EXECUTE FUNCTION mekan_relationship_summary_sync(%L, %L, %L)',
+            (SELECT string_agg(quote_ident(c), ', ') FROM unnest(t.link_columns) c),
+            t.table_name,
+            (SELECT string_agg('OLD.' || quote_ident(c), ', ') FROM unnest(t.link_columns) c),
+            (SELECT string_agg('NEW.' || quote_ident(c), ', ') FROM unnest(t.link_columns) c),
+            t.link, coalesce(t.year_column, ''), coalesce(t.alan_column, '')
+        );
+    END LOOP;
+END $$;
+
+-- ============= INITIAL FILL =============
+SELECT mekan_relationship_summary_refresh(
+    ARRAY(SELECT DISTINCT mekan_no FROM strat_unit WHERE mekan_no IS NOT NULL)
+);
@@ -0,0 +1,146 @@
+-- Rollup counters for the dashboard statistics and /api/stats.
+--
+-- statistics_rollup holds, per source table, its row count (metric 'total')
+-- and the row count per value of one grouping expression (year of a unit,
+-- birim type, find material, day a user/activity was created). Statement
+-- triggers apply the delta of each INSERT/UPDATE/DELETE from its transition
+-- tables, so reads never scan the source tables. `flask --app app
+-- rebuild-statistics` recomputes everything (needed after a TRUNCATE).
+
+CREATE TABLE IF NOT EXISTS statistics_rollup_sources (
+    table_name TEXT PRIMARY KEY,
+    metric TEXT,
+    expression TEXT
+);
+
+CREATE TABLE IF NOT EXISTS statistics_rollup (
+    table_name TEXT NOT NULL,
+    metric TEXT NOT NULL,
+    key TEXT NOT NULL,
+    count BIGINT NOT NULL DEFAULT 0,
+    PRIMARY KEY (table_name, metric, key)
+);
+
+INSERT INTO statistics_rollup_sources (table_name, metric, expression) VALUES
+    ('strat_unit',        'year',    'mekan_year'),
+    ('mekan_birin',       'type',    'birin_type'),
+    ('mekan_wall',        NULL,      NULL),
+    ('mekan_grave',       NULL,      NULL),
+    ('media',             NULL,      NULL),
+    ('system_users',      'created', 'created_at::date'),
+    ('user_activity_log', 'created', 'created_at::date')
+ON CONFLICT (table_name) DO NOTHING;
+
+-- Finds are grouped by the first of material_type, material, malzemesi they
+-- have (same order as site_statistics.MATERIAL_COLUMNS)
+INSERT INTO statistics_rollup_sources (table_name, metric, expression)
+SELECT t.table_name, CASE WHEN c.column_name IS NULL THEN NULL ELSE 'material' END, c.column_name
+FROM (VALUES ('mekan_buluntu'), ('finds')) AS t(table_name)
+LEFT JOIN LATERAL (
+    SELECT column_name
+    FROM information_schema.columns
+    WHERE table_name = t.table_name
+      AND table_schema = ANY(current_schemas(false))
+      AND column_name IN ('material_type', 'material', 'malzemesi')
+    ORDER BY array_position(ARRAY['material_type', 'material', 'malzemesi'], column_name::text)
+    LIMIT 1
+) c ON TRUE
+ON CONFLICT (table_name) DO NOTHING;
+
+-- ============= REBUILD =============
+CREATE OR REPLACE FUNCTION statistics_rollup_rebuild() RETURNS void AS $$
+DECLARE
+    s record;
+BEGIN
+    DELETE FROM statistics_rollup;
+    FOR s IN SELECT * FROM statistics_rollup_sources LOOP
+        CONTINUE WHEN to_regclass(s.table_name) IS NULL;
+        -- Block writers so no delta is applied twice while recounting
+        EXECUTE format('LOCK TABLE %I IN SHARE MODE', s.table_name);
+        EXECUTE format(
+            'INSERT INTO statistics_rollup (table_name, metric, key, count) SELECT %L, ''total'', '''', COUNT(*) FROM %I',
+            s.table_name, s.table_name
+        );
+        IF s.metric IS NOT NULL THEN
+            EXECUTE format(
+                'INSERT INTO statistics_rollup (table_name, metric, key, count)
+                 SELECT %L, %L, k, COUNT(*) FROM (SELECT (%s)::text AS k FROM %I) x
+                 WHERE k IS NOT NULL GROUP BY k',
+                s.table_name, s.metric, s.expression, s.table_name
+            );
+        END IF;
+    END LOOP;
+END
+$$ LANGUAGE plpgsql;
+
+-- ============= TRIGGERS =============
+-- TG_ARGV[0]/[1] are the source's metric and grouping expression ('' for none).
+-- Inserted rows count +1 and deleted rows -1; an update is both.
+CREATE OR REPLACE FUNCTION statistics_rollup_sync() RETURNS trigger AS $$
+DECLARE
+    changes TEXT[] := '{}';
+    grouped TEXT := '';
+BEGIN
+    IF TG_OP <> 'DELETE' THEN
+        changes := changes || 'SELECT 1 AS rollup_delta, * FROM new_rows'::text;
+    END IF;
+    IF TG_OP <> 'INSERT' THEN
+        changes := changes || 'SELECT -1 AS rollup_delta, * FROM old_rows'::text;
+    END IF;
+    IF TG_ARGV[0] <> '' THEN
+        grouped := format('UNION ALL SELECT rollup_delta, %L, (%s)::text FROM changes', TG_ARGV[0], TG_ARGV[1]);
+    END IF;
+
+    EXECUTE format($sql$
+        WITH changes AS (%s)
+        INSERT INTO statistics_rollup (table_name, metric, key, count)
+        SELECT %L, metric, key, SUM(delta)
+        FROM (
+            SELECT rollup_delta AS delta, 'total' AS metric, '' AS key FROM changes
+            %s
+        ) d
+        WHERE key IS NOT NULL
+        GROUP BY metric, key
+        HAVING SUM(delta) <> 0
+        ON CONFLICT (table_name, metric, key) DO UPDATE SET count = statistics_rollup.count + EXCLUDED.count
+    $sql$, array_to_string(changes, ' UNION ALL '), TG_TABLE_NAME, grouped);
+
+    DELETE FROM statistics_rollup
+    WHERE table_name = TG_TABLE_NAME AND metric <> 'total' AND count = 0;
+    RETURN NULL;
+END
+$$ LANGUAGE plpgsql;
+
+DO $$
+DECLARE
+    s record;
+BEGIN
+    FOR s IN SELECT * FROM statistics_rollup_sources LOOP
+        CONTINUE WHEN to_regclass(s.table_name) IS NULL;
+        EXECUTE format('DROP TRIGGER IF EXISTS statistics_rollup_insert ON %I', s.table_name);
+        EXECUTE format('DROP TRIGGER IF EXISTS statistics_rollup_update ON %I', s.table_name);
+        EXECUTE format('DROP TRIGGER IF EXISTS statistics_rollup_delete ON %I', s.table_name);
+        -- Transition tables allow a single event per trigger
+        EXECUTE format(
+            'CREATE TRIGGER statistics_rollup_insert AFTER INSERT ON %I
+             REFERENCING NEW TABLE AS new_rows
+             FOR EACH STATEMENT EXECUTE FUNCTION statistics_rollup_sync(%L, %L)',
+            s.table_name, coalesce(s.metric, ''), coalesce(s.expression, '')
+        );
+        EXECUTE format(
+            'CREATE TRIGGER statistics_rollup_update AFTER UPDATE ON %I
+             REFERENCING OLD TABLE AS old_rows NEW TABLE AS new_rows
+             FOR EACH STATEMENT EXECUTE FUNCTION statistics_rollup_sync(%L, %L)',
+            s.table_name, coalesce(s.metric, ''), coalesce(s.expression, '')
+        );
+        EXECUTE format(
+            'CREATE TRIGGER statistics_rollup_delete AFTER DELETE ON %I
+             REFERENCING OLD TABLE AS old_rows
+             FOR EACH STATEMENT EXECUTE FUNCTION statistics_rollup_sync(%L, %L)',
+            s.table_name, coalesce(s.metric, ''), coalesce(s.expression, '')
+        );
+    END LOOP;
+END $$;
+
+-- ============= INITIAL FILL =============
+SELECT statistics_rollup_rebuild();
@@ -0,0 +1,72 @@
+-- Change log for the vector tile cache (tiles.py).
+--
+-- Every insert/update/delete on a map layer table records the Web Mercator
+-- bounding box of the old and new geometry with the writing transaction's
+-- id. A cached tile is stale when a logged box overlapping it was not yet
+-- visible to the snapshot the tile was rendered from. Rows older than 7
+-- days are pruned; the cache re-renders tiles before that age anyway.
+
+CREATE TABLE IF NOT EXISTS tile_invalidations (
+    id BIGSERIAL PRIMARY KEY,
+    table_name TEXT NOT NULL,
+    bbox geometry(Polygon, 3857) NOT NULL,
+    xid xid8 NOT NULL DEFAULT pg_current_xact_id(),
+    changed_at TIMESTAMPTZ NOT NULL DEFAULT NOW()
+);
+
+CREATE INDEX IF NOT EXISTS tile_invalidations_bbox_idx ON tile_invalidations USING GIST (bbox);
+CREATE INDEX IF NOT EXISTS tile_invalidations_changed_at_idx ON tile_invalidations (changed_at);
+
+-- TG_ARGV[0] is the table's geometry column. Updates that leave the geometry
+-- unchanged log nothing; geometries without an SRID cannot be placed in Web
+-- Mercator and are skipped (as in 006_geometry_4326).
+CREATE OR REPLACE FUNCTION tile_invalidations_log() RETURNS trigger AS $$
+DECLARE
+    old_g geometry;
+    new_g geometry;
+BEGIN
+    IF TG_OP <> 'INSERT' THEN
+        EXECUTE format('SELECT ($1).%I', TG_ARGV[0]) INTO old_g USING OLD;
+    END IF;
+    IF TG_OP <> 'DELETE' THEN
+        EXECUTE format('SELECT ($1).%I', TG_ARGV[0]) INTO new_g USING NEW;
+    END IF;
+    IF TG_OP = 'UPDATE' AND old_g IS NOT DISTINCT FROM new_g THEN
+        RETURN NULL;
+    END IF;
+
+    INSERT INTO tile_invalidations (table_name, bbox)
+    SELECT TG_TABLE_NAME, ST_Envelope(ST_Transform(ST_Envelope(g), 3857))
+    FROM unnest(ARRAY[old_g, new_g]) AS g
+    WHERE g IS NOT NULL AND ST_SRID(g) <> 0;
+
+    -- Occasional pruning keeps the log small without a scheduler
+    IF random() < 0.01 THEN
+        DELETE FROM tile_invalidations WHERE changed_at < NOW() - INTERVAL '7 days';
+    END IF;
+    RETURN NULL;
+END
+$$ LANGUAGE plpgsql;
+
+-- Updates fire only when the geometry column is in the SET list
+DO $$
+DECLARE
+    t record;
+BEGIN
+    FOR t IN
+        SELECT DISTINCT ON (c.table_name) c.table_name, c.column_name
+        FROM information_schema.columns c
+        WHERE c.table_schema = ANY(current_schemas(false))
+          AND c.table_name IN ('strat_unit', 'mekan_birin', 'mekan_wall', 'mekan_grave', 'mekan_buluntu', 'finds')
+          AND c.column_name IN ('geom', 'geometry')
+        ORDER BY c.table_name, c.column_name = 'geom' DESC
+    LOOP
+        EXECUTE format('DROP TRIGGER IF EXISTS tile_invalidations_log ON %I', t.table_name);
+        EXECUTE format(
+            'CREATE TRIGGER tile_invalidations_log
+             AFTER INSERT OR UPDATE OF %I OR DELETE ON %I
+             FOR EACH ROW EXECUTE FUNCTION tile_invalidations_log(%L)',
+            t.column_name, t.table_name, t.column_name
+        );
+    END LOOP;
+END $$;
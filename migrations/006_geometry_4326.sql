@@ -0,0 +1,51 @@
+-- Maintained EPSG:4326 copy of each layer geometry.
+--
+-- The map and spatial endpoints serve WGS84, so instead of calling
+-- ST_Transform(geom, 4326) on every row of every request they read
+-- geom_4326, kept in sync by a BEFORE trigger and indexed with GiST for
+-- bounding-box filters in 4326. Geometries without an SRID are left NULL.
+-- `flask --app app backfill-geometry` fills rows that are still NULL
+-- (e.g. after a bulk load with triggers disabled).
+
+CREATE OR REPLACE FUNCTION geom_4326_sync() RETURNS trigger AS $$
+DECLARE
+    g geometry;
+BEGIN
+    EXECUTE format('SELECT ($1).%I', TG_ARGV[0]) INTO g USING NEW;
+    NEW.geom_4326 := CASE WHEN g IS NULL OR ST_SRID(g) = 0 THEN NULL ELSE ST_Transform(g, 4326) END;
+    RETURN NEW;
+END
+$$ LANGUAGE plpgsql;
+
+DO $$
+DECLARE
+    t record;
+BEGIN
+    FOR t IN
+        SELECT DISTINCT ON (c.table_name) c.table_name, c.column_name
+        FROM information_schema.columns c
+        WHERE c.table_schema = ANY(current_schemas(false))
+          AND c.table_name IN ('strat_unit', 'mekan_birin', 'mekan_wall', 'mekan_grave', 'mekan_buluntu', 'finds')
+          AND c.column_name IN ('geom', 'geometry')
+        ORDER BY c.table_name, c.column_name = 'geom' DESC
+    LOOP
+        EXECUTE format('ALTER TABLE %I ADD COLUMN IF NOT EXISTS geom_4326 geometry(Geometry, 4326)', t.table_name);
+        EXECUTE format('CREATE INDEX IF NOT EXISTS %I ON %I USING GIST (geom_4326)',
+                       t.table_name || '_geom_4326_idx', t.table_name);
+
+        EXECUTE format('DROP TRIGGER IF EXISTS geom_4326_sync ON %I', t.table_name);
+        EXECUTE format(
+            'CREATE TRIGGER geom_4326_sync
+             BEFORE INSERT OR UPDATE OF %I ON %I
+             FOR EACH ROW EXECUTE FUNCTION geom_4326_sync(%L)',
+            t.column_name, t.table_name, t.column_name
+        );
+
+        -- Initial backfill
+        EXECUTE format(
+            'UPDATE %I SET geom_4326 = ST_Transform(%I, 4326)
+             WHERE %I IS NOT NULL AND ST_SRID(%I) <> 0 AND geom_4326 IS NULL',
+            t.table_name, t.column_name, t.column_name, t.column_name
+        );
+    END LOOP;
+END $$;
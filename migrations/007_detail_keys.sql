@@ -0,0 +1,48 @@
+-- B-tree indexes for by-id detail lookups and their embeds.
+--
+-- * Record numbers (mekan_no, birin_no, ...) so `/api/v3/<entity>/<id>`
+--   is an index lookup rather than a scan.
+-- * su_uuid on the child tables and year/alan on walls and graves, used to
+--   resolve a record's parent MEKAN and a MEKAN's children.
+-- * The media link columns, used to load a record's media.
+--
+-- Tables and columns that do not exist in this database are skipped.
+
+CREATE FUNCTION pg_temp.columns_exist(tbl text, cols text[]) RETURNS boolean AS $$
+    SELECT COUNT(*) = cardinality(cols) FROM information_schema.columns
+    WHERE table_schema = current_schema() AND table_name = tbl AND column_name = ANY(cols)
+$$ LANGUAGE sql STABLE;
+
+DO $$
+DECLARE
+    t record;
+BEGIN
+    FOR t IN SELECT * FROM (VALUES
+        ('strat_unit',    ARRAY['mekan_no'],                'mekan_no'),
+        ('strat_unit',    ARRAY['mekan_year', 'mekan_alan'], 'year_alan'),
+        ('mekan_birin',   ARRAY['birin_no'],                'birin_no'),
+        ('mekan_birin',   ARRAY['su_uuid'],                 'su_uuid'),
+        ('mekan_wall',    ARRAY['wall_no'],                 'wall_no'),
+        ('mekan_wall',    ARRAY['wall_year', 'wall_alan'],   'year_alan'),
+        ('mekan_grave',   ARRAY['grave_no'],                'grave_no'),
+        ('mekan_grave',   ARRAY['su_uuid'],                 'su_uuid'),
+        ('mekan_grave',   ARRAY['grave_year', 'grave_alan'], 'year_alan'),
+        ('mekan_buluntu', ARRAY['bul_no'],                  'bul_no'),
+        ('mekan_buluntu', ARRAY['su_uuid'],                 'su_uuid'),
+        ('finds',         ARRAY['find_number'],             'find_number'),
+        ('finds',         ARRAY['su_uuid'],                 'su_uuid'),
+        ('media',         ARRAY['su_uuid'],                 'su_uuid'),
+        ('media',         ARRAY['birin_uuid'],              'birin_uuid'),
+        ('media',         ARRAY['wall_uuid'],               'wall_uuid'),
+        ('media',         ARRAY['grave_uuid'],              'grave_uuid'),
+        ('media',         ARRAY['find_id'],                 'find_id')
+    ) AS v(table_name, column_names, suffix)
+    LOOP
+        CONTINUE WHEN NOT pg_temp.columns_exist(t.table_name, t.column_names);
+        EXECUTE format(
+            'CREATE INDEX IF NOT EXISTS %I ON %I (%s)',
+            t.table_name || '_' || t.suffix || '_idx', t.table_name,
+            (SELECT string_agg(quote_ident(c), ', ') FROM unnest(t.column_names) c)
+        );
+    END LOOP;
+END $$;
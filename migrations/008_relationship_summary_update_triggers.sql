@@ -0,0 +1,52 @@
+-- Narrow the relationship summary triggers of 003_mekan_relationship_summary.
+--
+-- They used to fire on every UPDATE, so editing a description (or the
+-- geometry backfill) recounted the row's MEKAN. Updates now recount only
+-- when a column linking the row to its MEKAN actually changes; inserts and
+-- deletes are unchanged. Same trigger definitions as the current 003, for
+-- databases that applied the earlier version.
+
+-- Inserts and deletes always recount; updates only when a column linking
+-- the row to its MEKAN changes (the WHEN clause skips no-op SETs).
+DO $$
+DECLARE
+    t record;
+BEGIN
+    FOR t IN SELECT * FROM (VALUES
+        ('strat_unit',    'mekan',   NULL::text,   NULL::text,   ARRAY['mekan_no', 'su_uuid', 'mekan_year', 'mekan_alan']),
+        ('mekan_birin',   'su_uuid', NULL,         NULL,         ARRAY['su_uuid']),
+        ('mekan_buluntu', 'su_uuid', NULL,         NULL,         ARRAY['su_uuid']),
+        ('finds',         'su_uuid', NULL,         NULL,         ARRAY['su_uuid']),
+        ('mekan_wall',    'area',    'wall_year',  'wall_alan',  ARRAY['wall_year', 'wall_alan']),
+        ('mekan_grave',   'area',    'grave_year', 'grave_alan', ARRAY['grave_year', 'grave_alan'])
+    ) AS v(table_name, link, year_column, alan_column, link_columns)
+    LOOP
+        CONTINUE WHEN to_regclass(t.table_name) IS NULL;
+        EXECUTE format('DROP TRIGGER IF EXISTS mekan_relationship_summary_sync ON %I', t.table_name);
+        EXECUTE format('DROP TRIGGER IF EXISTS mekan_relationship_summary_sync_update ON %I', t.table_name);
+        CONTINUE WHEN (
+            SELECT COUNT(*) FROM information_schema.columns
+            WHERE table_schema = current_schema() AND table_name = t.table_name
+              AND column_name = ANY(t.link_columns)
+        ) < cardinality(t.link_columns);
+
+        EXECUTE format(
+            'CREATE TRIGGER mekan_relationship_summary_sync
+             AFTER INSERT OR DELETE ON %I
+             FOR EACH ROW EXECUTE FUNCTION mekan_relationship_summary_sync(%L, %L, %L)',
+            t.table_name, t.link, coalesce(t.year_column, ''), coalesce(t.alan_column, '')
+        );
+        EXECUTE format(
+            'CREATE TRIGGER mekan_relationship_summary_sync_update
+             AFTER UPDATE OF %s ON %I
+             FOR EACH ROW
+             WHEN ((%s) IS DISTINCT FROM (%s))
+             EXECUTE FUNCTION mekan_relationship_summary_sync(%L, %L, %L)',
+            (SELECT string_agg(quote_ident(c), ', ') FROM unnest(t.link_columns) c),
+            t.table_name,
+            (SELECT string_agg('OLD.' || quote_ident(c), ', ') FROM unnest(t.link_columns) c),
+            (SELECT string_agg('NEW.' || quote_ident(c), ', ') FROM unnest(t.link_columns) c),
+            t.link, coalesce(t.year_column, ''), coalesce(t.alan_column, '')
+        );
+    END LOOP;
+END $$;
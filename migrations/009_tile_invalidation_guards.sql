@@ -0,0 +1,61 @@
+-- Narrow the tile invalidation trigger of 005_tile_invalidations.
+--
+-- The trigger logged two boxes for every updated row, even when the
+-- geometry did not change (so bulk updates such as the geom_4326 backfill
+-- invalidated every cached tile), and ST_Transform() raised on geometries
+-- without an SRID, aborting the writing transaction. Same definitions as
+-- the current 005, for databases that applied the earlier version.
+
+-- TG_ARGV[0] is the table's geometry column. Updates that leave the geometry
+-- unchanged log nothing; geometries without an SRID cannot be placed in Web
+-- Mercator and are skipped (as in 006_geometry_4326).
+CREATE OR REPLACE FUNCTION tile_invalidations_log() RETURNS trigger AS $$
+DECLARE
+    old_g geometry;
+    new_g geometry;
+BEGIN
+    IF TG_OP <> 'INSERT' THEN
+        EXECUTE format('SELECT ($1).%I', TG_ARGV[0]) INTO old_g USING OLD;
+    END IF;
+    IF TG_OP <> 'DELETE' THEN
+        EXECUTE format('SELECT ($1).%I', TG_ARGV[0]) INTO new_g USING NEW;
+    END IF;
+    IF TG_OP = 'UPDATE' AND old_g IS NOT DISTINCT FROM new_g THEN
+        RETURN NULL;
+    END IF;
+
+    INSERT INTO tile_invalidations (table_name, bbox)
+    SELECT TG_TABLE_NAME, ST_Envelope(ST_Transform(ST_Envelope(g), 3857))
+    FROM unnest(ARRAY[old_g, new_g]) AS g
+    WHERE g IS NOT NULL AND ST_SRID(g) <> 0;
+
+    -- Occasional pruning keeps the log small without a scheduler
+    IF random() < 0.01 THEN
+        DELETE FROM tile_invalidations WHERE changed_at < NOW() - INTERVAL '7 days';
+    END IF;
+    RETURN NULL;
+END
+$$ LANGUAGE plpgsql;
+
+-- Updates fire only when the geometry column is in the SET list
+DO $$
+DECLARE
+    t record;
+BEGIN
+    FOR t IN
+        SELECT DISTINCT ON (c.table_name) c.table_name, c.column_name
+        FROM information_schema.columns c
+        WHERE c.table_schema = ANY(current_schemas(false))
+          AND c.table_name IN ('strat_unit', 'mekan_birin', 'mekan_wall', 'mekan_grave', 'mekan_buluntu', 'finds')
+          AND c.column_name IN ('geom', 'geometry')
+        ORDER BY c.table_name, c.column_name = 'geom' DESC
+    LOOP
+        EXECUTE format('DROP TRIGGER IF EXISTS tile_invalidations_log ON %I', t.table_name);
+        EXECUTE format(
+            'CREATE TRIGGER tile_invalidations_log
+             AFTER INSERT OR UPDATE OF %I OR DELETE ON %I
+             FOR EACH ROW EXECUTE FUNCTION tile_invalidations_log(%L)',
+            t.column_name, t.table_name, t.column_name
+        );
+    END LOOP;
+END $$;
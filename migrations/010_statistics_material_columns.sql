@@ -0,0 +1,55 @@
+-- Group mekan_buluntu finds by malzemesi in the statistics rollup.
+--
+-- 004_statistics_rollup looked the finds material up in material_type or
+-- material only, so on mekan_buluntu (which keeps it in malzemesi) the
+-- rollup had no material breakdown while the live query did. Same lookup as
+-- the current 004, for databases that applied the earlier version.
+
+UPDATE statistics_rollup_sources s
+SET metric = CASE WHEN c.column_name IS NULL THEN NULL ELSE 'material' END,
+    expression = c.column_name
+FROM (VALUES ('mekan_buluntu'), ('finds')) AS t(table_name)
+LEFT JOIN LATERAL (
+    SELECT column_name
+    FROM information_schema.columns
+    WHERE table_name = t.table_name
+      AND table_schema = ANY(current_schemas(false))
+      AND column_name IN ('material_type', 'material', 'malzemesi')
+    ORDER BY array_position(ARRAY['material_type', 'material', 'malzemesi'], column_name::text)
+    LIMIT 1
+) c ON TRUE
+WHERE s.table_name = t.table_name
+  AND s.expression IS DISTINCT FROM c.column_name;
+
+-- The triggers carry metric and expression as arguments, so recreate them
+DO $$
+DECLARE
+    s record;
+BEGIN
+    FOR s IN SELECT * FROM statistics_rollup_sources WHERE table_name IN ('mekan_buluntu', 'finds') LOOP
+        CONTINUE WHEN to_regclass(s.table_name) IS NULL;
+        EXECUTE format('DROP TRIGGER IF EXISTS statistics_rollup_insert ON %I', s.table_name);
+        EXECUTE format('DROP TRIGGER IF EXISTS statistics_rollup_update ON %I', s.table_name);
+        EXECUTE format('DROP TRIGGER IF EXISTS statistics_rollup_delete ON %I', s.table_name);
+        EXECUTE format(
+            'CREATE TRIGGER statistics_rollup_insert AFTER INSERT ON %I
+             REFERENCING NEW TABLE AS new_rows
+             FOR EACH STATEMENT EXECUTE FUNCTION statistics_rollup_sync(%L, %L)',
+            s.table_name, coalesce(s.metric, ''), coalesce(s.expression, '')
+        );
+        EXECUTE format(
+            'CREATE TRIGGER statistics_rollup_update AFTER UPDATE ON %I
+             REFERENCING OLD TABLE AS old_rows NEW TABLE AS new_rows
+             FOR EACH STATEMENT EXECUTE FUNCTION statistics_rollup_sync(%L, %L)',
+            s.table_name, coalesce(s.metric, ''), coalesce(s.expression, '')
+        );
+        EXECUTE format(
+            'CREATE TRIGGER statistics_rollup_delete AFTER DELETE ON %I
+             REFERENCING OLD TABLE AS old_rows
+             FOR EACH STATEMENT EXECUTE FUNCTION statistics_rollup_sync(%L, %L)',
+            s.table_name, coalesce(s.metric, ''), coalesce(s.expression, '')
+        );
+    END LOOP;
+END $$;
+
+SELECT statistics_rollup_rebuild();
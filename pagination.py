@@ -0,0 +1,254 @@
+"""
+List Pagination
+Shared LIMIT/OFFSET and keyset (cursor) pagination for the list endpoints
+"""
+
+from counting import count_rows, COUNT_STRATEGIES
+import base64
+import json
+
+
+class PaginationError(ValueError):
+    """Raised for invalid ?cursor= or ?count= values (answered with 400)"""
+
+
+class InvalidCursor(PaginationError):
+    """Raised when a ?cursor= token cannot be decoded for this endpoint"""
+
+
+class Key:
+    """One ORDER BY key: SQL expression, result column holding its value, direction"""
+
+    def __init__(self, expr, column, descending=False, nulls_last=None):
+        self.expr = expr
+        self.column = column
+        self.descending = descending
+        # PostgreSQL default: NULLS LAST for ASC, NULLS FIRST for DESC
+        self.nulls_last = (not descending) if nulls_last is None else nulls_last
+
+    def reversed(self):
+        return Key(self.expr, self.column, not self.descending, not self.nulls_last)
+
+    def sql(self, expr=None):
+        direction = 'DESC' if self.descending else 'ASC'
+        nulls = 'NULLS LAST' if self.nulls_last else 'NULLS FIRST'
+        return f"{expr or self.expr} {direction} {nulls}"
+
+    def equals(self, value):
+        if value is None:
+            return f"{self.expr} IS NULL", []
+        return f"{self.expr} = %s", [value]
+
+    def after(self, value):
+        """Condition for rows strictly after value in this key's order (None = never)"""
+        if value is None:
+            return (None, []) if self.nulls_last else (f"{self.expr} IS NOT NULL", [])
+        op = '<' if self.descending else '>'
+        if self.nulls_last:
+            return f"({self.expr} {op} %s OR {self.expr} IS NULL)", [value]
+        return f"{self.expr} {op} %s", [value]
+
+    def not_before(self, value):
+        """Pure range bound on the leading key (index-usable), or None"""
+        if value is None or self.nulls_last:
+            return None, []
+        op = '<=' if self.descending else '>='
+        return f"{self.expr} {op} %s", [value]
+
+
+class KeysetOrder:
+    """Ordering of a list endpoint; the last key must make rows unique"""
+
+    def __init__(self, *keys):
+        self.keys = list(keys)
+
+    def order_by(self, backward=False):
+        keys = [k.reversed() for k in self.keys] if backward else self.keys
+        return "ORDER BY " + ", ".join(k.sql() for k in keys)
+
+    def order_by_columns(self, alias, backward=False):
+        """ORDER BY over the result columns of a subquery aliased `alias`"""
+        keys = [k.reversed() for k in self.keys] if backward else self.keys
+        return "ORDER BY " + ", ".join(k.sql(f"{alias}.{k.column}") for k in keys)
+
+    def seek(self, values, backward=False):
+        """WHERE fragment selecting rows after `values` (before, if backward)"""
+        keys = [k.reversed() for k in self.keys] if backward else self.keys
+        terms = []
+        params = []
+        for i, key in enumerate(keys):
+            condition, condition_params = key.after(values[i])
+            if condition is None:
+                continue
+            parts = []
+            for prev_key, prev_value in zip(keys[:i], values[:i]):
+                eq, eq_params = prev_key.equals(prev_value)
+                parts.append(eq)
+                params.extend(eq_params)
+            parts.append(condition)
+            params.extend(condition_params)
+            terms.append("(" + " AND ".join(parts) + ")")
+
+        if not terms:
+            return "FALSE", []
+
+        sql = "(" + " OR ".join(terms) + ")"
+        bound, bound_params = keys[0].not_before(values[0])
+        if bound:
+            sql = f"{bound} AND {sql}"
+            params = bound_params + params
+        return sql, params
+
+    def values(self, row):
+        return [row.get(k.column) for k in self.keys]
+
+
+def encode_cursor(values, direction):
+    """Opaque, URL-safe token for a position in the list"""
+    payload = json.dumps({'v': values, 'd': direction}, default=str, separators=(',', ':'))
+    return base64.urlsafe_b64encode(payload.encode('utf-8')).decode('ascii').rstrip('=')
+
+
+def decode_cursor(token, order):
+    try:
+        padded = token + '=' * (-len(token) % 4)
+        payload = json.loads(base64.urlsafe_b64decode(padded.encode('ascii')))
+        values, direction = payload['v'], payload['d']
+    except (ValueError, KeyError, TypeError):
+        raise InvalidCursor('Invalid cursor')
+    if direction not in ('next', 'prev') or not isinstance(values, list) or len(values) != len(order.keys):
+        raise InvalidCursor('Invalid cursor')
+    return values, direction
+
+
+def fetch_page(cursor, query, params, order, page=1, per_page=50, cursor_token=None,
+               count_strategy='auto'):
+    """
+    Run a list query and return (rows, page_info).
+
+    `query` is the filtered SELECT without ORDER BY/LIMIT. With cursor_token
+    None the classic page/total envelope is used, with `total` produced by
+    count_strategy (see counting.py); any other value (including '' for the
+    first page) switches to keyset mode with next/prev cursors and no total.
+    """
+    if cursor_token is None:
+        if count_strategy not in COUNT_STRATEGIES:
+            raise PaginationError(f"Invalid count strategy, use one of: {', '.join(COUNT_STRATEGIES)}")
+        total, total_strategy = count_rows(cursor, query, params, count_strategy)
+
+        cursor.execute(
+            f"{query} {order.order_by()} LIMIT %s OFFSET %s",
+            list(params) + [per_page, (page - 1) * per_page]
+        )
+        return cursor.fetchall(), {
+            'total': total,
+            'total_strategy': total_strategy,
+            'page': page,
+            'per_page': per_page,
+            'total_pages': (total + per_page - 1) // per_page
+        }
+
+    backward = False
+    seek_sql, seek_params = "", []
+    if cursor_token:
+        values, direction = decode_cursor(cursor_token, order)
+        backward = direction == 'prev'
+        seek_sql, seek_params = order.seek(values, backward)
+        seek_sql = f" AND {seek_sql}"
+
+    cursor.execute(
+        f"{query}{seek_sql} {order.order_by(backward)} LIMIT %s",
+        list(params) + seek_params + [per_page + 1]
+    )
+    rows = cursor.fetchall()
+    more = len(rows) > per_page
+    rows = rows[:per_page]
+    if backward:
+        rows.reverse()
+
+    first = order.values(rows[0]) if rows else None
+    last = order.values(rows[-1]) if rows else None
+    return rows, keyset_info(per_page, first, last, more, backward, cursor_token)
+
+
+def keyset_info(per_page, first, last, more, backward, cursor_token):
+    """Keyset envelope from the key values of the first/last row of a page (None if empty)"""
+    if backward:
+        next_cursor = encode_cursor(last, 'next') if last is not None else None
+        prev_cursor = encode_cursor(first, 'prev') if more else None
+    else:
+        next_cursor = encode_cursor(last, 'next') if more else None
+        prev_cursor = encode_cursor(first, 'prev') if cursor_token and first is not None else None
+
+    return {
+        'per_page': per_page,
+        'next_cursor': next_cursor,
+        'prev_cursor': prev_cursor,
+        'has_more': next_cursor is not None
+    }
+
+
+# ============= DB-RENDERED PAGES =============
+def _named(cursor, row):
+    return row if isinstance(row, dict) else dict(zip([c[0] for c in cursor.description], row))
+
+
+def fetch_page_json(cursor, query, params, order, page=1, per_page=50, cursor_token=None,
+                    count_strategy='auto', extra_columns=()):
+    """
+    fetch_page() for ?render=db: returns the response body as JSON text.
+
+    PostgreSQL builds the `data` array itself (json_agg over the page rows),
+    so rows are never turned into Python objects; columns that should be
+    nested JSON (geometry) must already be of type json in `query`.
+    extra_columns are SQL expressions over the page row `p` (e.g. has_media).
+    Only the small pagination envelope is assembled here.
+    """
+    extras = ''.join(f", {column}" for column in extra_columns)
+
+    if cursor_token is None:
+        if count_strategy not in COUNT_STRATEGIES:
+            raise PaginationError(f"Invalid count strategy, use one of: {', '.join(COUNT_STRATEGIES)}")
+        total, total_strategy = count_rows(cursor, query, params, count_strategy)
+
+        cursor.execute(f"""
+            WITH page AS ({query} {order.order_by()} LIMIT %s OFFSET %s)
+            SELECT COALESCE(json_agg(r {order.order_by_columns('r')}), '[]')::text AS data
+            FROM (SELECT p.*{extras} FROM page p) r
+        """, list(params) + [per_page, (page - 1) * per_page])
+        data = _named(cursor, cursor.fetchone())['data']
+        page_info = {
+            'total': total,
+            'total_strategy': total_strategy,
+            'page': page,
+            'per_page': per_page,
+            'total_pages': (total + per_page - 1) // per_page
+        }
+    else:
+        backward = False
+        seek_sql, seek_params = "", []
+        if cursor_token:
+            values, direction = decode_cursor(cursor_token, order)
+            backward = direction == 'prev'
+            seek_sql, seek_params = order.seek(values, backward)
+            seek_sql = f" AND {seek_sql}"
+
+        # One row more than the page tells whether there is a next page
+        key_values = ", ".join(f"r.{k.column}" for k in order.keys)
+        cursor.execute(f"""
+            WITH fetched AS ({query}{seek_sql} {order.order_by(backward)} LIMIT %s),
+            page AS (SELECT p.*{extras} FROM fetched p {order.order_by_columns('p', backward)} LIMIT %s)
+            SELECT
+                (SELECT COALESCE(json_agg(r {order.order_by_columns('r')}), '[]')::text FROM page r) AS data,
+                (SELECT COUNT(*) FROM fetched) > %s AS more,
+                (SELECT json_build_array({key_values})::text FROM page r {order.order_by_columns('r')} LIMIT 1) AS first_keys,
+                (SELECT json_build_array({key_values})::text FROM page r {order.order_by_columns('r', True)} LIMIT 1) AS last_keys
+        """, list(params) + seek_params + [per_page + 1, per_page, per_page])
+        row = _named(cursor, cursor.fetchone())
+        data = row['data']
+        first = json.loads(row['first_keys']) if row['first_keys'] else None
+        last = json.loads(row['last_keys']) if row['last_keys'] else None
+        page_info = keyset_info(per_page, first, last, row['more'], backward, cursor_token)
+
+    envelope = json.dumps(page_info, separators=(',', ':'))
+    return '{"data":' + data + ',' + envelope[1:]
@@ -0,0 +1,211 @@
+"""
+PDF Record Reports
+Renders record sheets, in a process pool for batches, as one combined PDF or a ZIP
+"""
+
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime
+from reportlab.lib import colors
+from reportlab.lib.pagesizes import A4
+from reportlab.platypus import SimpleDocTemplate, Table, TableStyle, Paragraph, Spacer, Image
+from reportlab.lib.styles import getSampleStyleSheet
+from reportlab.lib.units import inch
+from pypdf import PdfReader, PdfWriter
+from xml.sax.saxutils import escape
+import io
+import multiprocessing
+import os
+import threading
+import zipfile
+
+# Records per task sent to a pool worker
+RENDER_CHUNK_SIZE = 8
+
+# Media thumbnails on a sheet: grid columns, box size and most shown
+THUMBNAIL_COLUMNS = 3
+THUMBNAIL_BOX = 2*inch
+MAX_SHEET_THUMBNAILS = 12
+
+# Shared by every record sheet
+RECORD_TABLE_STYLE = TableStyle([
+    ('BACKGROUND', (0, 0), (0, -1), colors.lightgrey),
+    ('TEXTCOLOR', (0, 0), (-1, -1), colors.black),
+    ('ALIGN', (0, 0), (-1, -1), 'LEFT'),
+    ('FONTNAME', (0, 0), (0, -1), 'Helvetica-Bold'),
+    ('FONTSIZE', (0, 0), (-1, -1), 10),
+    ('GRID', (0, 0), (-1, -1), 1, colors.black),
+    ('VALIGN', (0, 0), (-1, -1), 'TOP'),
+])
+
+THUMBNAIL_TABLE_STYLE = TableStyle([
+    ('ALIGN', (0, 0), (-1, -1), 'CENTER'),
+    ('VALIGN', (0, 0), (-1, -1), 'TOP'),
+    ('BOTTOMPADDING', (0, 0), (-1, -1), 8),
+])
+
+TOC_TABLE_STYLE = TableStyle([
+    ('FONTSIZE', (0, 0), (-1, -1), 10),
+    ('ALIGN', (1, 0), (1, -1), 'RIGHT'),
+    ('LINEBELOW', (0, 0), (-1, -1), 0.25, colors.lightgrey),
+])
+
+_styles = None
+
+
+def get_styles():
+    """Sample stylesheet, built once per process"""
+    global _styles
+    if _styles is None:
+        _styles = getSampleStyleSheet()
+    return _styles
+
+
+def prepare_record(record, excluded=()):
+    """Field label/value pairs for a sheet (geometry, `excluded` and empty fields dropped)"""
+    return [
+        (key.replace('_', ' ').title(), str(value))
+        for key, value in record.items()
+        if key not in ['geometry', 'geom'] and key not in excluded and value is not None
+    ]
+
+
+def record_title(entity_type, entity_id):
+    return f"{entity_type.upper()} - {entity_id}"
+
+
+def thumbnail_grid(images):
+    """Table of (thumbnail path, caption) cells, THUMBNAIL_COLUMNS per row"""
+    styles = get_styles()
+    cells = [
+        [Image(path, width=THUMBNAIL_BOX, height=THUMBNAIL_BOX, kind='proportional'),
+         Paragraph(escape(caption), styles['Normal'])]
+        for path, caption in images[:MAX_SHEET_THUMBNAILS]
+    ]
+    cells += [''] * (-len(cells) % THUMBNAIL_COLUMNS)
+    rows = [cells[i:i + THUMBNAIL_COLUMNS] for i in range(0, len(cells), THUMBNAIL_COLUMNS)]
+    table = Table(rows, colWidths=[THUMBNAIL_BOX + 0.15*inch] * THUMBNAIL_COLUMNS)
+    table.setStyle(THUMBNAIL_TABLE_STYLE)
+    return table
+
+
+def record_story(entity_type, entity_id, fields, images=()):
+    styles = get_styles()
+    story = [Paragraph(record_title(entity_type, entity_id), styles['Title']), Spacer(1, 0.2*inch)]
+
+    if fields:
+        table = Table([list(field) for field in fields], colWidths=[2.5*inch, 4*inch])
+        table.setStyle(RECORD_TABLE_STYLE)
+        story.append(table)
+
+    if images:
+        story.append(Spacer(1, 0.3*inch))
+        story.append(Paragraph("Media", styles['Heading2']))
+        story.append(thumbnail_grid(images))
+
+    story.append(Spacer(1, 0.5*inch))
+    story.append(Paragraph(f"Generated: {datetime.now().strftime('%Y-%m-%d %H:%M:%S')}", styles['Normal']))
+    return story
+
+
+def render_record(item):
+    """
+    PDF bytes for one (entity_type, entity_id, fields, images) record sheet;
+    images are (thumbnail path, caption) pairs
+    """
+    entity_type, entity_id, fields, images = item
+    buffer = io.BytesIO()
+    SimpleDocTemplate(buffer, pagesize=A4).build(record_story(entity_type, entity_id, fields, images))
+    return buffer.getvalue()
+
+
+# ============= PROCESS POOL =============
+_pool = None
+_pool_lock = threading.Lock()
+
+
+def get_render_pool():
+    """Process pool shared by the batch requests of this worker"""
+    global _pool
+    with _pool_lock:
+        if _pool is None:
+            # spawn: children must not inherit the worker's pooled DB sockets
+            _pool = ProcessPoolExecutor(
+                max_workers=int(os.getenv('PDF_WORKERS', os.cpu_count() or 1)),
+                mp_context=multiprocessing.get_context('spawn')
+            )
+        return _pool
+
+
+def render_records(items):
+    """PDF bytes for each item, rendered across cores, in input order"""
+    return get_render_pool().map(render_record, items, chunksize=RENDER_CHUNK_SIZE)
+
+
+# ============= COMBINED PDF =============
+def render_toc(title, entries, page_offset):
+    """Table of contents pages; entries are (title, first page of the record sheet)"""
+    styles = get_styles()
+    rows = [[entry_title, str(page + page_offset)] for entry_title, page in entries]
+    story = [Paragraph(title, styles['Title']), Spacer(1, 0.2*inch)]
+    if rows:
+        table = Table(rows, colWidths=[5.5*inch, 1*inch])
+        table.setStyle(TOC_TABLE_STYLE)
+        story.append(table)
+
+    buffer = io.BytesIO()
+    SimpleDocTemplate(buffer, pagesize=A4).build(story)
+    return buffer.getvalue()
+
+
+def write_combined_pdf(path, title, items):
+    """One PDF with a table of contents, bookmarks and every record sheet; returns the record count"""
+    writer = PdfWriter()
+    sheets = []
+    page = 1
+    for (entity_type, entity_id, *_), pdf in zip(items, render_records(items)):
+        reader = PdfReader(io.BytesIO(pdf))
+        sheets.append((record_title(entity_type, entity_id), page, reader))
+        page += len(reader.pages)
+
+    # The TOC length only depends on the number of entries, so render once to count its pages
+    entries = [(sheet_title, first_page) for sheet_title, first_page, _ in sheets]
+    toc_pages = len(PdfReader(io.BytesIO(render_toc(title, entries, 0))).pages)
+    writer.append(PdfReader(io.BytesIO(render_toc(title, entries, toc_pages))))
+
+    for sheet_title, first_page, reader in sheets:
+        writer.append(reader)
+        writer.add_outline_item(sheet_title, toc_pages + first_page - 1)
+
+    with open(path, 'wb') as f:
+        writer.write(f)
+    return len(sheets)
+
+
+# ============= ZIP =============
+class _ChunkBuffer(io.RawIOBase):
+    """Write-only stream whose contents are drained after each ZIP entry"""
+
+    def __init__(self):
+        self._chunks = []
+
+    def writable(self):
+        return True
+
+    def write(self, data):
+        self._chunks.append(bytes(data))
+        return len(data)
+
+    def drain(self):
+        data = b''.join(self._chunks)
+        self._chunks = []
+        return data
+
+
+def zip_chunks(items):
+    """Yield a ZIP of per-record PDFs as each sheet is rendered"""
+    buffer = _ChunkBuffer()
+    with zipfile.ZipFile(buffer, 'w', compression=zipfile.ZIP_STORED) as archive:
+        for (entity_type, entity_id, *_), pdf in zip(items, render_records(items)):
+            archive.writestr(f"{entity_type}_{entity_id}.pdf", pdf)
+            yield buffer.drain()
+    yield buffer.drain()
@@ -0,0 +1,53 @@
+"""
+Relationship Summary Maintenance
+Reconciles mekan_relationship_summary against live counts and rebuilds it
+"""
+
+from psycopg2.extras import RealDictCursor
+from enrichment import relationship_counts, SUMMARY_TABLE
+
+
+def find_drift(cursor, finds_table):
+    """[(mekan_no, summary_counts, live_counts)] for every MEKAN whose summary is wrong"""
+    cursor.execute("SELECT DISTINCT mekan_no FROM strat_unit WHERE mekan_no IS NOT NULL")
+    mekan_nos = [row['mekan_no'] for row in cursor.fetchall()]
+    cursor.execute(f"SELECT mekan_no FROM {SUMMARY_TABLE}")
+    summarized = [row['mekan_no'] for row in cursor.fetchall()]
+
+    live = relationship_counts(cursor, mekan_nos, finds_table)
+    stored = relationship_counts(cursor, mekan_nos + summarized, finds_table, summary=True)
+
+    drift = []
+    for mekan_no in sorted(set(mekan_nos) | set(summarized)):
+        live_counts = live.get(mekan_no)
+        stored_counts = stored.get(mekan_no)
+        if stored_counts != live_counts:
+            drift.append((mekan_no, stored_counts, live_counts))
+    return drift
+
+
+def reconcile(conn, finds_table, rebuild=True, log=print):
+    """Report summary drift, then rebuild the whole table in one transaction"""
+    cursor = conn.cursor(cursor_factory=RealDictCursor)
+    try:
+        drift = find_drift(cursor, finds_table)
+        for mekan_no, stored, live in drift:
+            log(f"MEKAN {mekan_no}: summary {stored or 'missing'} != live {live or 'missing'}")
+        log(f"{len(drift)} MEKAN out of sync")
+
+        if rebuild:
+            cursor.execute(f"DELETE FROM {SUMMARY_TABLE}")
+            cursor.execute("""
+                SELECT mekan_relationship_summary_refresh(
+                    ARRAY(SELECT DISTINCT mekan_no FROM strat_unit WHERE mekan_no IS NOT NULL)
+                )
+            """)
+            cursor.execute(f"SELECT COUNT(*) AS count FROM {SUMMARY_TABLE}")
+            log(f"Rebuilt {SUMMARY_TABLE}: {cursor.fetchone()['count']} MEKAN")
+        conn.commit()
+        return drift
+    except Exception:
+        conn.rollback()
+        raise
+    finally:
+        cursor.close()
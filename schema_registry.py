@@ -0,0 +1,140 @@
+"""
+Schema Capability Registry
+Caches which tables and columns exist so handlers don't probe information_schema per request
+"""
+
+from flask import current_app
+from database import get_db
+import threading
+import time
+
+# Candidate geometry column names, in order of preference
+GEOMETRY_COLUMNS = ('geom', 'geometry')
+
+# Trigger-maintained EPSG:4326 copy of the geometry (migrations/006_geometry_4326.sql)
+GEOMETRY_4326_COLUMN = 'geom_4326'
+
+
+class SchemaRegistry:
+    """In-process snapshot of tables and columns visible on the search path"""
+
+    def __init__(self, ttl=300, logger=None):
+        self.ttl = ttl
+        self.logger = logger
+        self._tables = {}         # table_name -> frozenset of column names
+        self._ordered = {}        # table_name -> column names in definition order
+        self._loaded_at = None
+        self._lock = threading.Lock()
+
+    def is_stale(self):
+        if self._loaded_at is None:
+            return True
+        return bool(self.ttl) and time.time() - self._loaded_at > self.ttl
+
+    def load(self, conn):
+        """(Re)load the catalog snapshot using the given connection"""
+        cursor = conn.cursor()
+        try:
+            cursor.execute("""
+                SELECT table_name, column_name
+                FROM information_schema.columns
+                WHERE table_schema = ANY(current_schemas(false))
+                ORDER BY table_name, ordinal_position
+            """)
+            tables = {}
+            for table_name, column_name in cursor.fetchall():
+                tables.setdefault(table_name, []).append(column_name)
+        finally:
+            cursor.close()
+
+        self._tables = {name: frozenset(cols) for name, cols in tables.items()}
+        self._ordered = {name: tuple(cols) for name, cols in tables.items()}
+        self._loaded_at = time.time()
+        if self.logger:
+            self.logger.info("Schema registry loaded: %d tables", len(self._tables))
+
+    def ensure_loaded(self, conn_factory):
+        """Load on first use or once the TTL has expired"""
+        if self.is_stale():
+            with self._lock:
+                if self.is_stale():
+                    self.load(conn_factory())
+
+    def refresh(self, conn):
+        with self._lock:
+            self.load(conn)
+
+    def has_table(self, table):
+        return table in self._tables
+
+    def has_column(self, table, column):
+        return column in self._tables.get(table, ())
+
+    def columns(self, table):
+        return self._tables.get(table, frozenset())
+
+    def column_list(self, table):
+        """Columns of the table in definition order (like SELECT *)"""
+        return self._ordered.get(table, ())
+
+    def geometry_column(self, table):
+        """Return 'geom' or 'geometry' (whichever the table has), else None"""
+        for column in GEOMETRY_COLUMNS:
+            if self.has_column(table, column):
+                return column
+        return None
+
+    def geometry_4326_column(self, table):
+        """'geom_4326' if the table has the maintained WGS84 column, else None"""
+        return GEOMETRY_4326_COLUMN if self.has_column(table, GEOMETRY_4326_COLUMN) else None
+
+    def finds_table(self):
+        """Finds live in mekan_buluntu when it exists, otherwise in finds"""
+        return 'mekan_buluntu' if self.has_table('mekan_buluntu') else 'finds'
+
+    def snapshot(self):
+        return {
+            'loaded_at': self._loaded_at,
+            'age_seconds': round(time.time() - self._loaded_at, 1) if self._loaded_at else None,
+            'ttl': self.ttl,
+            'tables': {name: sorted(cols) for name, cols in sorted(self._tables.items())}
+        }
+
+
+def init_app(app):
+    """Attach a registry to the app; it is loaded lazily on first use"""
+    app.config.setdefault('SCHEMA_REGISTRY_TTL', 300)
+    app.extensions['schema_registry'] = SchemaRegistry(
+        ttl=float(app.config['SCHEMA_REGISTRY_TTL']), logger=app.logger
+    )
+
+
+def get_schema():
+    """Return the app's registry, loading it with the request connection if stale"""
+    registry = current_app.extensions['schema_registry']
+    registry.ensure_loaded(get_db)
+    return registry
+
+
+def refresh_schema():
+    """Force a reload of the registry, e.g. after a migration"""
+    registry = current_app.extensions['schema_registry']
+    registry.refresh(get_db())
+    return registry
+
+
+def geometry_select(alias, table, schema=None, as_json=False):
+    """ST_AsGeoJSON() over the table's geometry column, or NULL if it has none; as_json keeps it nested"""
+    column = (schema or get_schema()).geometry_column(table)
+    if column is None:
+        return "NULL as geometry"
+    cast = "::json" if as_json else ""
+    return f"ST_AsGeoJSON({alias}.{column}){cast} as geometry"
+
+
+def geometry_4326(alias, table, schema=None):
+    """The table's geometry in EPSG:4326: the maintained column, or ST_Transform() until it is migrated"""
+    schema = schema or get_schema()
+    if schema.geometry_4326_column(table):
+        return f"{alias}.{GEOMETRY_4326_COLUMN}"
+    return f"ST_Transform({alias}.{schema.geometry_column(table)}, 4326)"
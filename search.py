@@ -0,0 +1,103 @@
+"""
+List Search Predicates
+Index-friendly `search` filters backed by the pg_trgm and tsvector indexes
+created in migrations/001_search_indexes.sql
+"""
+
+from schema_registry import get_schema
+import re
+
+# Generated full-text column added by the search migration
+TSV_COLUMN = 'search_tsv'
+
+# Global search: entity types in search_documents and the candidate cap.
+# Only the first GLOBAL_CANDIDATES index matches are ranked, which keeps
+# short typeahead prefixes fast on a full-season database.
+DOCUMENT_TYPES = ('mekan', 'birim', 'wall', 'grave', 'find', 'media')
+GLOBAL_CANDIDATES = 2000
+
+
+def like_pattern(term):
+    """%term% with LIKE wildcards in the user's input escaped"""
+    escaped = term.replace('\\', '\\\\').replace('%', '\\%').replace('_', '\\_')
+    return f'%{escaped}%'
+
+
+def tsv_column(alias, table):
+    """Qualified search_tsv column if the table has been migrated, else None"""
+    if get_schema().has_column(table, TSV_COLUMN):
+        return f"{alias}.{TSV_COLUMN}" if alias else TSV_COLUMN
+    return None
+
+
+def search_clause(term, text_columns, cast_columns=(), exact_columns=(), tsv=None):
+    """
+    Build "(... OR ...)" and its params for a search term.
+
+    text_columns  - text columns matched with ILIKE (pg_trgm GIN index)
+    cast_columns  - numeric ids matched as `col::text ILIKE` (trgm expression index)
+    exact_columns - numeric ids matched with `=` when the term is an integer,
+                    otherwise like cast_columns
+    tsv           - tsvector column matched with English and Turkish tsqueries
+    """
+    pattern = like_pattern(term)
+    parts = []
+    params = []
+
+    try:
+        number = int(term)
+    except ValueError:
+        number = None
+
+    for column in exact_columns:
+        if number is not None:
+            parts.append(f"{column} = %s")
+            params.append(number)
+        else:
+            parts.append(f"{column}::text ILIKE %s")
+            params.append(pattern)
+
+    for column in cast_columns:
+        parts.append(f"{column}::text ILIKE %s")
+        params.append(pattern)
+
+    for column in text_columns:
+        parts.append(f"{column} ILIKE %s")
+        params.append(pattern)
+
+    if tsv:
+        parts.append(f"{tsv} @@ (plainto_tsquery('english', %s) || plainto_tsquery('turkish', %s))")
+        params.extend([term, term])
+
+    return "(" + " OR ".join(parts) + ")", params
+
+
+def prefix_tsquery(term):
+    """'pit fil' -> 'pit:* & fil:*' for to_tsquery('simple', ...), or None"""
+    words = re.findall(r'\w+', term.lower())
+    return ' & '.join(f"{w}:*" for w in words) or None
+
+
+def find_documents(cursor, term, types=None, limit=20):
+    """Ranked matches from search_documents (prefix, English and Turkish queries)"""
+    prefix = prefix_tsquery(term)
+    if prefix is None:
+        return []
+
+    type_filter = "AND entity_type = ANY(%s)" if types else ""
+    cursor.execute(f"""
+        SELECT entity_type as type, entity_id as id, title, subtitle,
+               ts_rank(document, q) as rank
+        FROM (
+            SELECT entity_type, entity_id, title, subtitle, document, q
+            FROM search_documents,
+                 (SELECT to_tsquery('simple', %s)
+                         || plainto_tsquery('english', %s)
+                         || plainto_tsquery('turkish', %s) AS q) query
+            WHERE document @@ q {type_filter}
+            LIMIT %s
+        ) candidates
+        ORDER BY rank DESC, type, id
+        LIMIT %s
+    """, [prefix, term, term] + ([list(types)] if types else []) + [GLOBAL_CANDIDATES, limit])
+    return cursor.fetchall()
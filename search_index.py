@@ -0,0 +1,203 @@
+"""
+Global Search Index
+Builds the search_documents table and the triggers that keep it current
+"""
+
+# Entity -> how its search document is built. Only columns present in the
+# database are used, so the same definitions work across deployments.
+#   key      - column used as entity_id (the number the API and UI use)
+#   label    - title prefix ("MEKAN 12"); None uses the first title_columns value
+#   subtitle - short descriptive columns (weight B)
+#   english / turkish - long text columns (weight C)
+SOURCES = {
+    'mekan': {
+        'table': 'strat_unit', 'key': 'mekan_no', 'label': 'MEKAN',
+        'subtitle': ['mekan_type', 'mekan_alan', 'mekan_year'],
+        'english': ['description'], 'turkish': ['description_tr']
+    },
+    'birim': {
+        'table': 'mekan_birin', 'key': 'birin_no', 'label': 'Birim',
+        'subtitle': ['birin_type'],
+        'english': ['description'], 'turkish': ['description_tr']
+    },
+    'wall': {
+        'table': 'mekan_wall', 'key': 'wall_no', 'label': 'Wall',
+        'subtitle': ['wall_type', 'wall_alan', 'wall_year'],
+        'english': ['description'], 'turkish': ['description_tr']
+    },
+    'grave': {
+        'table': 'mekan_grave', 'key': 'grave_no', 'label': 'Grave',
+        'subtitle': ['grave_type'],
+        'english': ['description'], 'turkish': ['description_tr']
+    },
+    'find': {
+        'table': 'mekan_buluntu', 'key': 'bul_no', 'label': 'Find',
+        'subtitle': ['malzemesi'],
+        'english': [], 'turkish': ['aciklama']
+    },
+    'media': {
+        'table': 'media', 'key': 'id', 'label': None,
+        'title_columns': ['original_filename', 'filename'],
+        'subtitle': ['media_type', 'photographer'],
+        'english': ['description'], 'turkish': []
+    }
+}
+
+# Used for 'find' when the database has no mekan_buluntu table
+FINDS_SOURCE = {
+    'table': 'finds', 'key': 'find_number', 'label': 'Find',
+    'subtitle': ['material_type'],
+    'english': ['description'], 'turkish': ['description_tr']
+}
+
+TRIGGER_NAME = 'search_documents_sync'
+
+
+def active_sources(schema):
+    """{entity_type: source} for the sources whose table exists"""
+    sources = {}
+    for entity_type, source in SOURCES.items():
+        if entity_type == 'find' and not schema.has_table(source['table']):
+            source = FINDS_SOURCE
+        if schema.has_table(source['table']) and schema.has_column(source['table'], source['key']):
+            sources[entity_type] = source
+    return sources
+
+
+def indexed_columns(source, schema):
+    """Columns a source's search document is built from (key first), as present in the table"""
+    columns = [source['key']]
+    for group in ('title_columns', 'subtitle', 'english', 'turkish'):
+        columns += [c for c in source.get(group, []) if c not in columns and schema.has_column(source['table'], c)]
+    return columns
+
+
+def _text(columns):
+    """Space-joined text of the given t.* columns"""
+    return "concat_ws(' ', " + ", ".join(f"t.{c}::text" for c in columns) + ")" if columns else "''"
+
+
+def document_select(entity_type, source, schema, where=None):
+    """SELECT producing search_documents rows for a source (one per key)"""
+    table = source['table']
+    key = f"t.{source['key']}"
+
+    def present(columns):
+        return [c for c in columns if schema.has_column(table, c)]
+
+    if source['label']:
+        title = f"'{source['label']} ' || {key}::text"
+    else:
+        # First non-empty title column, falling back to the key
+        title = "coalesce(" + ", ".join(
+            [f"NULLIF(t.{c}::text, '')" for c in present(source['title_columns'])] + [f"{key}::text"]
+        ) + ")"
+    subtitle = _text(present(source['subtitle']))
+
+    document = (
+        f"setweight(to_tsvector('simple', {title}), 'A') || "
+        f"setweight(to_tsvector('simple', {subtitle}), 'B') || "
+        f"setweight(to_tsvector('english', {_text(present(source['english']))}), 'C') || "
+        f"setweight(to_tsvector('turkish', {_text(present(source['turkish']))}), 'C')"
+    )
+
+    return f"""
+        SELECT DISTINCT ON ({key})
+            '{entity_type}' as entity_type,
+            {key}::text as entity_id,
+            {title} as title,
+            NULLIF({subtitle}, '') as subtitle,
+            {document} as document
+        FROM {table} t
+        WHERE {key} IS NOT NULL{f' AND {where}' if where else ''}
+        ORDER BY {key}
+    """
+
+
+UPSERT_SUFFIX = """
+    ON CONFLICT (entity_type, entity_id) DO UPDATE SET
+        title = EXCLUDED.title,
+        subtitle = EXCLUDED.subtitle,
+        document = EXCLUDED.document,
+        updated_at = NOW()
+"""
+
+
+def install_triggers(conn, schema, log=print):
+    """(Re)create the row triggers that keep search_documents in sync"""
+    sources = active_sources(schema)
+    cursor = conn.cursor()
+    try:
+        # Drop triggers on every candidate table (e.g. finds after mekan_buluntu appeared)
+        for source in list(SOURCES.values()) + [FINDS_SOURCE]:
+            if schema.has_table(source['table']):
+                cursor.execute(f"DROP TRIGGER IF EXISTS {TRIGGER_NAME} ON {source['table']}")
+                cursor.execute(f"DROP TRIGGER IF EXISTS {TRIGGER_NAME}_update ON {source['table']}")
+
+        for entity_type, source in sources.items():
+            key = source['key']
+            columns = "INSERT INTO search_documents (entity_type, entity_id, title, subtitle, document)"
+            old_rows = document_select(entity_type, source, schema, f"t.{key} = OLD.{key}")
+            new_rows = document_select(entity_type, source, schema, f"t.{key} = NEW.{key}")
+            cursor.execute(f"""
+                CREATE OR REPLACE FUNCTION search_documents_sync_{entity_type}() RETURNS trigger AS $fn$
+                BEGIN
+                    IF TG_OP <> 'INSERT' THEN
+                        -- Drop the old document, then rebuild it from any rows still sharing the key
+                        DELETE FROM search_documents
+                        WHERE entity_type = '{entity_type}' AND entity_id = OLD.{key}::text;
+                        {columns} {old_rows} {UPSERT_SUFFIX};
+                    END IF;
+                    IF TG_OP <> 'DELETE' THEN
+                        {columns} {new_rows} {UPSERT_SUFFIX};
+                    END IF;
+                    RETURN NULL;
+                END
+                $fn$ LANGUAGE plpgsql
+            """)
+            cursor.execute(f"""
+                CREATE TRIGGER {TRIGGER_NAME}
+                AFTER INSERT OR DELETE ON {source['table']}
+                FOR EACH ROW EXECUTE FUNCTION search_documents_sync_{entity_type}()
+            """)
+            # Updates only rebuild the document when an indexed column actually changed
+            indexed = indexed_columns(source, schema)
+            old_values = ", ".join(f"OLD.{c}" for c in indexed)
+            new_values = ", ".join(f"NEW.{c}" for c in indexed)
+            cursor.execute(f"""
+                CREATE TRIGGER {TRIGGER_NAME}_update
+                AFTER UPDATE OF {", ".join(indexed)} ON {source['table']}
+                FOR EACH ROW
+                WHEN (ROW({old_values}) IS DISTINCT FROM ROW({new_values}))
+                EXECUTE FUNCTION search_documents_sync_{entity_type}()
+            """)
+            log(f"Trigger installed on {source['table']} ({entity_type})")
+        conn.commit()
+    except Exception:
+        conn.rollback()
+        raise
+    finally:
+        cursor.close()
+
+
+def rebuild(conn, schema, log=print):
+    """Rebuild search_documents from scratch in one transaction; returns {entity_type: rows}"""
+    sources = active_sources(schema)
+    counts = {}
+    cursor = conn.cursor()
+    try:
+        cursor.execute("DELETE FROM search_documents")
+        for entity_type, source in sources.items():
+            cursor.execute(
+                "INSERT INTO search_documents (entity_type, entity_id, title, subtitle, document) "
+                + document_select(entity_type, source, schema)
+            )
+            counts[entity_type] = cursor.rowcount
+            log(f"Indexed {cursor.rowcount} {entity_type} documents")
+        conn.commit()
+    except Exception:
+        conn.rollback()
+        raise
+    finally:
+        cursor.close()
+    return counts
@@ -0,0 +1,216 @@
+"""
+Site Statistics
+Dashboard totals and breakdowns from the rollup counters (or one query), cached in-process with a TTL
+"""
+
+from flask import current_app, request, jsonify
+from database import get_db
+from schema_registry import get_schema
+import hashlib
+import json
+import threading
+import time
+
+# Candidate material columns of the finds table, in order of preference
+# (mekan_buluntu keeps it in malzemesi); migrations/004 uses the same order
+MATERIAL_COLUMNS = ('material_type', 'material', 'malzemesi')
+
+
+def statistics_query(schema, finds_table):
+    """Single multi-CTE query returning every statistic as one row (breakdowns as JSON)"""
+    material = next((c for c in MATERIAL_COLUMNS if schema.has_column(finds_table, c)), None)
+    if material:
+        find_materials = f"""
+            SELECT {material} AS material, COUNT(*) AS count
+            FROM {finds_table}
+            WHERE {material} IS NOT NULL
+            GROUP BY {material}
+        """
+    else:
+        find_materials = "SELECT NULL::text AS material, 0::bigint AS count WHERE FALSE"
+
+    return f"""
+        WITH unit_years AS (
+            SELECT mekan_year AS year, COUNT(*) AS count
+            FROM strat_unit
+            WHERE mekan_year IS NOT NULL
+            GROUP BY mekan_year
+        ),
+        birim_types AS (
+            SELECT birin_type, COUNT(*) AS count
+            FROM mekan_birin
+            WHERE birin_type IS NOT NULL
+            GROUP BY birin_type
+        ),
+        find_materials AS ({find_materials})
+        SELECT
+            (SELECT COUNT(*) FROM strat_unit) AS total_strat_units,
+            (SELECT COUNT(*) FROM mekan_birin) AS total_birim,
+            (SELECT COUNT(*) FROM mekan_wall) AS total_walls,
+            (SELECT COUNT(*) FROM mekan_grave) AS total_graves,
+            (SELECT COUNT(*) FROM {finds_table}) AS total_finds,
+            (SELECT COUNT(*) FROM media) AS total_media,
+            (SELECT COALESCE(json_agg(year ORDER BY year DESC), '[]') FROM unit_years) AS excavation_years,
+            (SELECT COALESCE(json_agg(json_build_object('year', year, 'count', count) ORDER BY year DESC), '[]')
+             FROM unit_years) AS units_by_year,
+            (SELECT COALESCE(json_agg(json_build_object('birin_type', birin_type, 'count', count)
+                                      ORDER BY count DESC, birin_type), '[]')
+             FROM birim_types) AS birim_by_type,
+            (SELECT COALESCE(json_agg(json_build_object('material', material, 'count', count)
+                                      ORDER BY count DESC, material), '[]')
+             FROM find_materials) AS finds_by_material
+    """
+
+
+# ============= ROLLUP =============
+# Trigger-maintained counters (migrations/004_statistics_rollup.sql)
+ROLLUP_TABLE = 'statistics_rollup'
+
+
+def ranked(counts, label):
+    """[{label: key, 'count': n}] by count descending"""
+    return [{label: key, 'count': count} for key, count in sorted(counts.items(), key=lambda kv: (-kv[1], kv[0]))]
+
+
+def rollup_statistics(cursor, finds_table):
+    """Same statistics as statistics_query(), read from the rollup counters"""
+    cursor.execute(f"SELECT table_name, metric, key, count FROM {ROLLUP_TABLE} WHERE table_name <> ALL(%s)",
+                   (['system_users', 'user_activity_log'],))
+    rollup = {}
+    for table_name, metric, key, count in cursor.fetchall():
+        rollup.setdefault(table_name, {}).setdefault(metric, {})[key] = count
+
+    def total(table):
+        return rollup.get(table, {}).get('total', {}).get('', 0)
+
+    years = sorted(((int(year), count) for year, count in rollup.get('strat_unit', {}).get('year', {}).items()), reverse=True)
+    return {
+        'total_strat_units': total('strat_unit'),
+        'total_birim': total('mekan_birin'),
+        'total_walls': total('mekan_wall'),
+        'total_graves': total('mekan_grave'),
+        'total_finds': total(finds_table),
+        'total_media': total('media'),
+        'excavation_years': [year for year, _ in years],
+        'units_by_year': [{'year': year, 'count': count} for year, count in years],
+        'birim_by_type': ranked(rollup.get('mekan_birin', {}).get('type', {}), 'birin_type'),
+        'finds_by_material': ranked(rollup.get(finds_table, {}).get('material', {}), 'material')
+    }
+
+
+def compute_statistics(conn, schema, finds_table):
+    """Statistics from the rollup when it is installed, otherwise from the source tables"""
+    cursor = conn.cursor()
+    try:
+        if schema.has_table(ROLLUP_TABLE):
+            return rollup_statistics(cursor, finds_table)
+        cursor.execute(statistics_query(schema, finds_table))
+        row = cursor.fetchone()
+        return {col.name: value for col, value in zip(cursor.description, row)}
+    finally:
+        cursor.close()
+
+
+def daily_counts(cursor, table, days, schema):
+    """[{'date', 'count'}] rows of a table created per day over the last days"""
+    if schema.has_table(ROLLUP_TABLE):
+        cursor.execute(f"""
+            SELECT key::date AS date, count
+            FROM {ROLLUP_TABLE}
+            WHERE table_name = %s AND metric = 'created'
+              AND key::date >= (NOW() - %s * INTERVAL '1 day')::date
+            ORDER BY date
+        """, (table, days))
+    else:
+        cursor.execute(f"""
+            SELECT DATE(created_at) as date, COUNT(*) as count
+            FROM {table}
+            WHERE created_at > NOW() - %s * INTERVAL '1 day'
+            GROUP BY DATE(created_at)
+            ORDER BY date
+        """, (days,))
+    return cursor.fetchall()
+
+
+def rebuild_rollup(conn, log=print):
+    """Recount every rollup counter from the source tables in one transaction"""
+    cursor = conn.cursor()
+    try:
+        cursor.execute("SELECT statistics_rollup_rebuild()")
+        cursor.execute(f"SELECT COUNT(*) FROM {ROLLUP_TABLE}")
+        log(f"Rebuilt {ROLLUP_TABLE}: {cursor.fetchone()[0]} counters")
+        conn.commit()
+    except Exception:
+        conn.rollback()
+        raise
+    finally:
+        cursor.close()
+
+
+class StatisticsCache:
+    """Last computed statistics per finds table, recomputed once older than the TTL or after invalidate()"""
+
+    def __init__(self, ttl=60):
+        self.ttl = ttl
+        self._entries = {}        # finds table -> (stats, etag, computed_at)
+        self._lock = threading.Lock()
+
+    def _fresh_entry(self, finds_table):
+        entry = self._entries.get(finds_table)
+        if entry is None or time.time() - entry[2] > self.ttl:
+            return None
+        return entry
+
+    def invalidate(self):
+        self._entries = {}
+
+    def get(self, conn_factory, schema_factory, finds_table=None):
+        """
+        (stats, etag, age in seconds); only one request recomputes when stale.
+        finds_table None means the schema's finds table (mekan_buluntu if present)
+        """
+        schema = schema_factory()
+        finds_table = finds_table or schema.finds_table()
+        entry = self._fresh_entry(finds_table)
+        if entry is None:
+            with self._lock:
+                entry = self._fresh_entry(finds_table)
+                if entry is None:
+                    stats = compute_statistics(conn_factory(), schema, finds_table)
+                    etag = hashlib.sha1(json.dumps(stats, sort_keys=True, default=str).encode('utf-8')).hexdigest()
+                    entry = self._entries[finds_table] = (stats, etag, time.time())
+        stats, etag, computed_at = entry
+        return stats, etag, round(time.time() - computed_at, 1)
+
+
+def init_app(app):
+    """Attach the statistics cache; it is filled on first request"""
+    app.config.setdefault('STATISTICS_TTL', 60)
+    app.extensions['statistics'] = StatisticsCache(ttl=float(app.config['STATISTICS_TTL']))
+
+
+def get_statistics_cache():
+    return current_app.extensions['statistics']
+
+
+def invalidate_statistics():
+    """Drop the cached statistics, e.g. after an import"""
+    get_statistics_cache().invalidate()
+
+
+def statistics_response(shape, finds_table=None):
+    """
+    JSON response with shape(stats) plus cache_age/cache_ttl, a weak ETag over
+    the data and 304 for a matching If-None-Match. finds_table pins the table
+    counted as finds (the v1/v2 APIs read `finds`)
+    """
+    cache = get_statistics_cache()
+    stats, etag, age = cache.get(get_db, get_schema, finds_table)
+    data = shape(stats)
+    data['cache_age'] = age
+    data['cache_ttl'] = cache.ttl
+
+    response = jsonify(data)
+    response.set_etag(etag, weak=True)
+    response.headers['Cache-Control'] = 'private, no-cache'
+    return response.make_conditional(request)
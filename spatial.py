@@ -0,0 +1,133 @@
+"""
+Spatial Feature Queries
+Bounding-box and zoom aware GeoJSON for the map layers, simplified and capped per layer
+"""
+
+from tiles import layer_source, source_srid, TILE_LAYERS, MAX_ZOOM
+import json
+import math
+
+# Features returned per layer unless ?limit= asks for fewer/more
+DEFAULT_LAYER_LIMIT = 2000
+MAX_LAYER_LIMIT = 10000
+
+# Web Mercator metres per 256px tile pixel at zoom 0
+METRES_PER_PIXEL_Z0 = 156543.03392804097
+
+# Simplification tolerance in pixels at the requested zoom
+SIMPLIFY_PIXELS = 0.5
+
+
+class SpatialQueryError(ValueError):
+    """Invalid bbox/zoom/layers parameters"""
+
+
+def parse_bbox(value):
+    """'west,south,east,north' in EPSG:4326 -> tuple of floats"""
+    if not value:
+        raise SpatialQueryError('bbox is required as west,south,east,north')
+    try:
+        west, south, east, north = (float(part) for part in value.split(','))
+    except ValueError:
+        raise SpatialQueryError('bbox must be four numbers: west,south,east,north')
+    if not (-180 <= west < east <= 180 and -90 <= south < north <= 90):
+        raise SpatialQueryError('bbox is out of range or inverted')
+    return west, south, east, north
+
+
+def parse_zoom(value):
+    try:
+        zoom = int(value)
+    except (TypeError, ValueError):
+        raise SpatialQueryError('zoom must be an integer')
+    if not 0 <= zoom <= MAX_ZOOM:
+        raise SpatialQueryError(f'zoom must be between 0 and {MAX_ZOOM}')
+    return zoom
+
+
+def parse_layers(value):
+    layers = [name.strip() for name in (value or ','.join(TILE_LAYERS)).split(',') if name.strip()]
+    unknown = [name for name in layers if name not in TILE_LAYERS]
+    if unknown:
+        raise SpatialQueryError(f"Unknown layers: {', '.join(unknown)}")
+    return layers
+
+
+def simplify_tolerance(zoom):
+    """Web Mercator metres below which detail is invisible at this zoom"""
+    return METRES_PER_PIXEL_Z0 / 2 ** zoom * SIMPLIFY_PIXELS
+
+
+def simplify_tolerance_degrees(zoom):
+    """The same tolerance in degrees, for geometries already in EPSG:4326"""
+    return 360 / (256 * 2 ** zoom) * SIMPLIFY_PIXELS
+
+
+def coordinate_digits(zoom):
+    """Decimal digits of a degree that still resolve one pixel at this zoom"""
+    degrees_per_pixel = 360 / (256 * 2 ** zoom)
+    return max(0, min(8, math.ceil(-math.log10(degrees_per_pixel))))
+
+
+def layer_query(layer, table, column, attributes, srid):
+    """
+    One GeoJSON Feature (as text) per row; && on the envelope uses the GiST
+    index. A geom_4326 column (srid 4326) is read without any ST_Transform.
+    """
+    properties = ''.join(f", '{name}', t.{col}" for name, col in attributes.items())
+    if srid == 4326:
+        envelope = "ST_MakeEnvelope(%(west)s, %(south)s, %(east)s, %(north)s, 4326)"
+        geometry = f"ST_SimplifyPreserveTopology(t.{column}, %(tolerance_degrees)s)"
+    else:
+        envelope = f"ST_Transform(ST_MakeEnvelope(%(west)s, %(south)s, %(east)s, %(north)s, 4326), {srid})"
+        geometry = f"ST_Transform(ST_SimplifyPreserveTopology(ST_Transform(t.{column}, 3857), %(tolerance)s), 4326)"
+    return f"""
+        SELECT json_build_object(
+            'type', 'Feature',
+            'properties', json_build_object('layer', '{layer}'{properties}),
+            'geometry', ST_AsGeoJSON({geometry}, %(digits)s)::json
+        )::text
+        FROM {table} t
+        WHERE t.{column} && {envelope}
+        LIMIT %(limit)s
+    """
+
+
+def feature_collection(cursor, schema, bbox, zoom, layers, limit=DEFAULT_LAYER_LIMIT):
+    """
+    GeoJSON FeatureCollection text for the features of each layer inside bbox.
+
+    Each layer returns at most limit features; layer_stats reports the count
+    and whether the layer was truncated. Features are serialised by
+    PostgreSQL and joined here without being parsed.
+    """
+    west, south, east, north = bbox
+    params = {
+        'west': west, 'south': south, 'east': east, 'north': north,
+        'tolerance': simplify_tolerance(zoom),
+        'tolerance_degrees': simplify_tolerance_degrees(zoom),
+        'digits': coordinate_digits(zoom),
+        'limit': limit + 1
+    }
+
+    features = []
+    layer_stats = {}
+    for layer in layers:
+        source = layer_source(layer, schema)
+        if source and schema.geometry_4326_column(source[0]):
+            table, _, attributes = source
+            column, srid = schema.geometry_4326_column(table), 4326
+        elif source:
+            table, column, attributes = source
+            srid = source_srid(cursor, table, column)
+        if source is None or srid is None:
+            layer_stats[layer] = {'count': 0, 'truncated': False}
+            continue
+
+        cursor.execute(layer_query(layer, table, column, attributes, srid), params)
+        rows = cursor.fetchall()
+        layer_stats[layer] = {'count': min(len(rows), limit), 'truncated': len(rows) > limit}
+        features.extend(row[0] for row in rows[:limit])
+
+    meta = json.dumps({'bbox': list(bbox), 'zoom': zoom, 'layers': layer_stats})
+    return '{"type":"FeatureCollection","features":[' + ','.join(features) + '],' + meta[1:]
@@ -0,0 +1,249 @@
+"""
+Media Thumbnail Cache
+Downscaled media thumbnails in a content-addressed disk cache with LRU eviction by size
+"""
+
+from flask import current_app
+from concurrent.futures import ThreadPoolExecutor
+from PIL import Image, UnidentifiedImageError
+import hashlib
+import io
+import os
+import tempfile
+import threading
+import urllib.parse
+import urllib.request
+import uuid
+
+# Longest edge of a thumbnail, in pixels
+THUMBNAIL_SIZE = 400
+THUMBNAIL_QUALITY = 80
+
+FETCH_TIMEOUT = 15
+
+# Only these are fetched and scaled; other media (video, documents) get no thumbnail
+IMAGE_EXTENSIONS = ('.jpg', '.jpeg', '.png', '.tif', '.tiff', '.webp', '.gif', '.bmp')
+
+# Ref file content for media URLs whose file is not a decodable image
+NOT_AN_IMAGE = 'none'
+
+# Public object URLs look like <project>/storage/v1/object/public/<bucket>/<path>
+PUBLIC_OBJECT_MARKER = '/storage/v1/object/public/'
+
+# Storage projects the media URLs point at (api_archaeological, api_archaeological_fixed)
+STORAGE_HOSTS = ('sbtpbadebhycqugsgglv.supabase.co', 'ctlqtgwyuknxpkssidcd.supabase.co')
+
+
+def is_image(media):
+    """Whether a media row (filename/public_url) looks like an image"""
+    name = (media.get('filename') or media.get('public_url') or '').split('?', 1)[0].lower()
+    return name.endswith(IMAGE_EXTENSIONS)
+
+
+# ============= STORAGE SOURCES =============
+class NoRedirect(urllib.request.HTTPRedirectHandler):
+    """Redirects are not followed, so a fetch cannot leave the allowed hosts"""
+
+    def redirect_request(self, req, fp, code, msg, headers, newurl):
+        return None
+
+
+class UrlSource:
+    """
+    Reads media over HTTPS from the storage bucket's public URLs. Anything
+    else (other schemes, hosts or paths) is not fetched and reads as None.
+    """
+
+    def __init__(self, hosts=STORAGE_HOSTS):
+        self.hosts = {host.lower() for host in hosts}
+        self._opener = urllib.request.build_opener(NoRedirect)
+
+    def allowed(self, url):
+        try:
+            parts = urllib.parse.urlsplit(url)
+            host, port = parts.hostname, parts.port
+        except ValueError:
+            return False
+        return (parts.scheme == 'https' and host in self.hosts and port in (None, 443)
+                and not parts.username and parts.path.startswith(PUBLIC_OBJECT_MARKER))
+
+    def read(self, url):
+        if not self.allowed(url):
+            return None
+        with self._opener.open(url, timeout=FETCH_TIMEOUT) as response:
+            return response.read()
+
+
+class DirectorySource:
+    """
+    Reads media from a local directory laid out like the bucket
+    (<root>/<bucket>/<path>), for development and tests without network access.
+    """
+
+    def __init__(self, root):
+        self.root = os.path.abspath(root)
+
+    def read(self, url):
+        relative = url.split(PUBLIC_OBJECT_MARKER, 1)[-1].split('?', 1)[0].lstrip('/')
+        path = os.path.abspath(os.path.join(self.root, relative))
+        if os.path.commonpath([self.root, path]) != self.root:
+            raise ValueError(f"Media path outside source directory: {relative}")
+        with open(path, 'rb') as f:
+            return f.read()
+
+
+# ============= CACHE =============
+class ThumbnailCache:
+    """
+    Thumbnails are stored under the SHA-256 of the original file's content,
+    so the same photo attached twice is only scaled and stored once. A small
+    ref file per media URL remembers which content it resolved to, so a
+    cached item is never fetched from storage again.
+
+    Hits refresh the thumbnail's mtime; evict() removes the least recently
+    used thumbnails until the cache fits in max_bytes. Files that turn out
+    not to be images are remembered too, so they are not downloaded again.
+    """
+
+    def __init__(self, directory, source, max_bytes=256 * 1024 * 1024, workers=4, logger=None):
+        self.directory = directory
+        self.source = source
+        self.max_bytes = max_bytes
+        self.workers = workers
+        self.logger = logger
+        self._executor = None
+        self._lock = threading.Lock()
+        os.makedirs(os.path.join(directory, 'refs'), exist_ok=True)
+        os.makedirs(os.path.join(directory, 'objects'), exist_ok=True)
+
+    def _get_executor(self):
+        with self._lock:
+            if self._executor is None:
+                self._executor = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix='thumbnail')
+            return self._executor
+
+    def _ref_path(self, url):
+        key = hashlib.sha256(f"{url}|{THUMBNAIL_SIZE}".encode('utf-8')).hexdigest()
+        return os.path.join(self.directory, 'refs', key)
+
+    def _object_path(self, digest):
+        return os.path.join(self.directory, 'objects', digest[:2], f"{digest}.jpg")
+
+    def _write_atomic(self, path, data):
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        tmp = f"{path}.{uuid.uuid4().hex}.tmp"
+        with open(tmp, 'wb') as f:
+            f.write(data)
+        os.replace(tmp, path)
+
+    def _cached(self, url):
+        """Thumbnail path, NOT_AN_IMAGE, or None on a miss"""
+        try:
+            with open(self._ref_path(url), encoding='ascii') as f:
+                digest = f.read().strip()
+            if digest == NOT_AN_IMAGE:
+                return NOT_AN_IMAGE
+            path = self._object_path(digest)
+            os.utime(path)
+            return path
+        except OSError:
+            return None
+
+    def get(self, url):
+        """Path of the thumbnail for a media URL, generating it on a miss; None if it is not an image or not readable"""
+        path = self._cached(url)
+        if path == NOT_AN_IMAGE:
+            return None
+        if path:
+            return path
+
+        data = self.source.read(url)
+        if data is None:
+            return None
+        digest = hashlib.sha256(data).hexdigest()
+        path = self._object_path(digest)
+        if os.path.exists(path):
+            os.utime(path)
+        else:
+            try:
+                self._write_atomic(path, downscale(data))
+            except UnidentifiedImageError:
+                self._write_atomic(self._ref_path(url), NOT_AN_IMAGE.encode('ascii'))
+                return None
+        self._write_atomic(self._ref_path(url), digest.encode('ascii'))
+        return path
+
+    def get_many(self, urls):
+        """Thumbnail paths for many URLs, generated in parallel; failures come back as None"""
+        def safe_get(url):
+            try:
+                return self.get(url) if url else None
+            except Exception as e:
+                if self.logger:
+                    self.logger.warning("Thumbnail failed for %s: %s", url, e)
+                return None
+
+        paths = list(self._get_executor().map(safe_get, urls))
+        self.evict()
+        return paths
+
+    def evict(self):
+        """Remove least recently used thumbnails until the cache fits in max_bytes"""
+        objects = []
+        total = 0
+        for root, _, names in os.walk(os.path.join(self.directory, 'objects')):
+            for name in names:
+                path = os.path.join(root, name)
+                try:
+                    stat = os.stat(path)
+                except OSError:
+                    continue
+                objects.append((stat.st_mtime, stat.st_size, path))
+                total += stat.st_size
+
+        # Refs to evicted objects are left behind and simply miss next time
+        for _, size, path in sorted(objects):
+            if total <= self.max_bytes:
+                break
+            try:
+                os.remove(path)
+                total -= size
+            except OSError:
+                pass
+        return total
+
+
+def downscale(data):
+    """JPEG thumbnail bytes for an image, longest edge THUMBNAIL_SIZE"""
+    with Image.open(io.BytesIO(data)) as image:
+        image.draft('RGB', (THUMBNAIL_SIZE, THUMBNAIL_SIZE))
+        image = image.convert('RGB')
+        image.thumbnail((THUMBNAIL_SIZE, THUMBNAIL_SIZE))
+        buffer = io.BytesIO()
+        image.save(buffer, 'JPEG', quality=THUMBNAIL_QUALITY, optimize=True)
+        return buffer.getvalue()
+
+
+def init_app(app):
+    """
+    Register the thumbnail cache; THUMBNAIL_SOURCE_DIR swaps the bucket for a local directory,
+    THUMBNAIL_STORAGE_HOSTS lists the hosts media may be fetched from
+    """
+    app.config.setdefault('THUMBNAIL_DIR', os.path.join(tempfile.gettempdir(), 'mekan_thumbnails'))
+    app.config.setdefault('THUMBNAIL_CACHE_BYTES', 256 * 1024 * 1024)
+    app.config.setdefault('THUMBNAIL_WORKERS', 4)
+    app.config.setdefault('THUMBNAIL_SOURCE_DIR', None)
+    app.config.setdefault('THUMBNAIL_STORAGE_HOSTS', STORAGE_HOSTS)
+
+    source_dir = app.config['THUMBNAIL_SOURCE_DIR']
+    app.extensions['thumbnails'] = ThumbnailCache(
+        app.config['THUMBNAIL_DIR'],
+        DirectorySource(source_dir) if source_dir else UrlSource(app.config['THUMBNAIL_STORAGE_HOSTS']),
+        max_bytes=int(app.config['THUMBNAIL_CACHE_BYTES']),
+        workers=int(app.config['THUMBNAIL_WORKERS']),
+        logger=app.logger
+    )
+
+
+def get_thumbnails():
+    return current_app.extensions['thumbnails']
@@ -0,0 +1,193 @@
+"""
+Vector Tiles
+Mapbox Vector Tiles rendered by PostGIS (ST_AsMVT) with an on-disk tile cache
+"""
+
+from flask import current_app
+import hashlib
+import os
+import tempfile
+import time
+import uuid
+
+TILE_EXTENT = 4096
+TILE_BUFFER = 64
+MAX_ZOOM = 24
+
+MVT_MIMETYPE = 'application/vnd.mapbox-vector-tile'
+
+# Invalidations are kept 7 days (migrations/005_tile_invalidations.sql),
+# so cached tiles must be re-rendered before that
+TILE_MAX_AGE = 6 * 24 * 3600
+
+INVALIDATION_TABLE = 'tile_invalidations'
+
+# Layer -> source table and attribute name -> column; attributes whose column
+# does not exist on this schema are left out
+TILE_LAYERS = {
+    'mekan': {'table': 'strat_unit', 'attributes': {
+        'id': 'su_uuid', 'label': 'mekan_no', 'year': 'mekan_year', 'alan': 'mekan_alan'
+    }},
+    'birim': {'table': 'mekan_birin', 'attributes': {
+        'id': 'birin_uuid', 'label': 'birin_no', 'type': 'birin_type', 'description': 'description'
+    }},
+    'walls': {'table': 'mekan_wall', 'attributes': {
+        'id': 'wall_uuid', 'label': 'wall_no', 'type': 'wall_type', 'description': 'description',
+        'year': 'wall_year', 'alan': 'wall_alan'
+    }},
+    'graves': {'table': 'mekan_grave', 'attributes': {
+        'id': 'grave_uuid', 'label': 'grave_no', 'type': 'grave_type', 'description': 'description',
+        'year': 'grave_year', 'alan': 'grave_alan'
+    }},
+    'finds': {'table': None, 'attributes': None}
+}
+
+# The finds layer reads whichever finds table the schema has
+FIND_ATTRIBUTES = {
+    'mekan_buluntu': {'id': 'bul_uuid', 'label': 'bul_no', 'material': 'malzemesi', 'description': 'aciklama'},
+    'finds': {'id': 'id', 'label': 'find_number', 'material': 'material_type', 'description': 'description'}
+}
+
+
+def layer_source(layer, schema):
+    """(table, geometry column, {attribute: column}) of a tile layer, or None if unknown/without geometry"""
+    spec = TILE_LAYERS.get(layer)
+    if spec is None:
+        return None
+    table = spec['table'] or schema.finds_table()
+    attributes = spec['attributes'] or FIND_ATTRIBUTES[table]
+    column = schema.geometry_column(table)
+    if column is None:
+        return None
+    return table, column, {name: col for name, col in attributes.items() if schema.has_column(table, col)}
+
+
+_srids = {}                   # (table, column) -> SRID
+
+
+def source_srid(cursor, table, column):
+    """SRID of a table's geometry column (from its first feature), or None while it is empty"""
+    key = (table, column)
+    if key not in _srids:
+        cursor.execute(f"SELECT ST_SRID({column}) FROM {table} WHERE {column} IS NOT NULL LIMIT 1")
+        row = cursor.fetchone()
+        if row is None:
+            return None               # looked up again next time
+        _srids[key] = row[0]
+    return _srids[key]
+
+
+def valid_tile(z, x, y):
+    return 0 <= z <= MAX_ZOOM and 0 <= x < 2 ** z and 0 <= y < 2 ** z
+
+
+def tile_query(layer, table, column, attributes, srid):
+    """
+    ST_AsMVT over the features intersecting the tile (plus buffer), with the
+    statement's snapshot so the cache can tell which later writes it missed
+    """
+    selected = ''.join(f", t.{col}::text AS {name}" for name, col in attributes.items())
+    # The envelope is transformed to the column's SRID (not the column to 3857) so its GiST index is used
+    return f"""
+        WITH bounds AS (
+            SELECT ST_TileEnvelope(%(z)s, %(x)s, %(y)s) AS env,
+                   ST_Transform(ST_TileEnvelope(%(z)s, %(x)s, %(y)s, margin => %(margin)s), {srid}) AS source_env
+        ),
+        features AS (
+            SELECT ST_AsMVTGeom(ST_Transform(t.{column}, 3857), bounds.env, {TILE_EXTENT}, {TILE_BUFFER}, true) AS mvt_geom
+                   {selected}
+            FROM {table} t, bounds
+            WHERE t.{column} && bounds.source_env
+        )
+        SELECT
+            (SELECT ST_AsMVT(features.*, '{layer}', {TILE_EXTENT}, 'mvt_geom') FROM features WHERE mvt_geom IS NOT NULL),
+            pg_current_snapshot()::text
+    """
+
+
+class TileCache:
+    """
+    Tiles on disk as <layer>/<fields>/<z>/<x>/<y>.pbf, each prefixed with the
+    snapshot it was rendered from.
+
+    Triggers log the bounding box of every changed feature in
+    tile_invalidations together with its transaction id. A cached tile is
+    reused only if no logged change overlapping it was invisible to its
+    snapshot. Without that table (migration not applied) tiles are rendered
+    on every request.
+    """
+
+    def __init__(self, directory, max_age=TILE_MAX_AGE):
+        self.directory = directory
+        self.max_age = max_age
+        os.makedirs(directory, exist_ok=True)
+
+    def _path(self, layer, fields_key, z, x, y):
+        return os.path.join(self.directory, layer, fields_key, str(z), str(x), f"{y}.pbf")
+
+    def _read(self, path):
+        """(snapshot, tile bytes) of a cached tile younger than max_age, or None"""
+        try:
+            if time.time() - os.path.getmtime(path) > self.max_age:
+                return None
+            with open(path, 'rb') as f:
+                snapshot, _, data = f.read().partition(b'\n')
+            return snapshot.decode('ascii'), data
+        except OSError:
+            return None
+
+    def _write(self, path, snapshot, data):
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        tmp = f"{path}.{uuid.uuid4().hex}.tmp"
+        with open(tmp, 'wb') as f:
+            f.write(snapshot.encode('ascii') + b'\n' + data)
+        os.replace(tmp, path)
+
+    def _is_current(self, cursor, table, snapshot, z, x, y):
+        cursor.execute(f"""
+            SELECT NOT EXISTS (
+                SELECT 1 FROM {INVALIDATION_TABLE}
+                WHERE table_name = %(table)s
+                  AND bbox && ST_TileEnvelope(%(z)s, %(x)s, %(y)s, margin => %(margin)s)
+                  AND NOT pg_visible_in_snapshot(xid, %(snapshot)s::pg_snapshot)
+            )
+        """, {'table': table, 'z': z, 'x': x, 'y': y, 'margin': TILE_BUFFER / TILE_EXTENT, 'snapshot': snapshot})
+        return cursor.fetchone()[0]
+
+    def get(self, conn, schema, layer, source, z, x, y):
+        """Tile bytes (b'' for an empty tile) and whether they came from the cache"""
+        table, column, attributes = source
+        fields_key = hashlib.sha1(','.join(sorted(attributes)).encode('utf-8')).hexdigest()[:12]
+        path = self._path(layer, fields_key, z, x, y)
+        caching = schema.has_table(INVALIDATION_TABLE)
+
+        cursor = conn.cursor()
+        try:
+            cached = self._read(path) if caching else None
+            if cached and self._is_current(cursor, table, cached[0], z, x, y):
+                return cached[1], True
+
+            if schema.geometry_4326_column(table):
+                column, srid = schema.geometry_4326_column(table), 4326
+            else:
+                srid = source_srid(cursor, table, column)
+            if srid is None:
+                return b'', False
+            cursor.execute(tile_query(layer, table, column, attributes, srid),
+                           {'z': z, 'x': x, 'y': y, 'margin': TILE_BUFFER / TILE_EXTENT})
+            tile, snapshot = cursor.fetchone()
+            data = bytes(tile) if tile else b''
+            if caching:
+                self._write(path, snapshot, data)
+            return data, False
+        finally:
+            cursor.close()
+
+
+def init_app(app):
+    app.config.setdefault('TILE_DIR', os.path.join(tempfile.gettempdir(), 'mekan_tiles'))
+    app.extensions['tiles'] = TileCache(app.config['TILE_DIR'])
+
+
+def get_tile_cache():
+    return current_app.extensions['tiles']